@@ -1,5 +1,6 @@
+import inspect
 from dataclasses import asdict
-from typing import Any
+from typing import Any, Callable, Union
 from fastapi import APIRouter
 from fastapi.websockets import WebSocketState
 from pydantic import BaseModel
@@ -14,7 +15,12 @@ from api.agent.common import (
     foundry_agents,
 )
 
-from api.agent.common import execute_foundry_agent
+from api.agent.common import (
+    FoundryRun,
+    discard_foundry_run,
+    execute_foundry_agent,
+    prepare_foundry_agent,
+)
 
 # load function agents
 import api.agent.agents as agents  # noqa: F401
@@ -150,38 +156,122 @@ class FunctionCall(BaseModel):
     arguments: dict[str, Any]
 
 
-@router.post("/{id}")
-async def execute_agent(id: str, function: FunctionCall):
-    global connections, custom_agents, foundry_agents, function_agents, function_calls
+# agent name -> status function for that agent
+AgentNotify = Callable[[str], AgentUpdateEvent]
 
+
+async def load_foundry_agents() -> dict[str, Agent]:
+    global foundry_agents
     if len(foundry_agents) == 0:
         foundry_agents = await get_foundry_agents()
+    return foundry_agents
+
+
+async def has_function(name: str) -> bool:
+    """
+    True if ``name`` is a Foundry agent, function agent or function call
+    that can run on the server.
+    """
+    if name in function_agents:
+        return function_agents[name].id in dir(agents)
+    if name in function_calls:
+        return True
+    return name in await load_foundry_agents()
+
+
+def prepare_fields(name: str) -> Union[tuple[str, ...], None]:
+    """
+    Arguments needed to set up ``name`` before its call is complete (see
+    prepare_function), or None when it has no setup worth starting early.
+    """
+    if name in foundry_agents:
+        # agent lookup, thread and the query message
+        return ("query",)
+    return None
+
+
+async def prepare_function(name: str, arguments: dict[str, Any]) -> Any:
+    """
+    Start the slow setup of a call to ``name`` from the fields listed by
+    prepare_fields. The result is handed to run_function, or to
+    discard_prepared if the call doesn't go ahead with those arguments.
+    """
+    foundry_agent = foundry_agents[name]
+    return await prepare_foundry_agent(foundry_agent.id, arguments["query"])
+
+
+async def discard_prepared(prepared: Any):
+    if isinstance(prepared, FoundryRun):
+        await discard_foundry_run(prepared)
 
-    if id not in connections:
-        return {"error": "Connection not found"}
 
-    if function.name in foundry_agents:
+async def run_function(
+    name: str,
+    arguments: dict[str, Any],
+    notify: AgentNotify,
+    prepared: Any = None,
+) -> Any:
+    """
+    Run the Foundry agent, function agent or function call registered as
+    ``name``, reporting progress through ``notify``. Raises ValueError
+    when there is no such function.
+    """
+    global function_agents, function_calls
+
+    foundry_agents = await load_foundry_agents()
+    if name in foundry_agents:
         # execute foundry agent
-        foundry_agent = foundry_agents[function.name]
-        await execute_foundry_agent(
+        foundry_agent = foundry_agents[name]
+        try:
+            additional_instructions = arguments.get("additional_instructions", "")
+            query = arguments["query"]
+            agent_notify = notify(foundry_agent.name)
+        except BaseException:
+            # execute_foundry_agent closes the prepared run, but never got it
+            if prepared is not None:
+                await discard_prepared(prepared)
+            raise
+        return await execute_foundry_agent(
             foundry_agent.id,
-            function.arguments["additional_instructions"],
-            function.arguments["query"],
+            additional_instructions,
+            query,
             function_calls,
-            send_agent_status(
-                connection_id=id, name=foundry_agent.name, call_id=function.call_id
-            ),
+            agent_notify,
+            prepared=prepared,
         )
-    elif function.name in function_agents:
-        function_agent = function_agents[function.name]
-        functions = dir(agents)
-        if function_agent.id in functions:
-            # execute function agent
-            func = getattr(agents, function_agent.id)
-            args = function.arguments.copy()
-            args["notify"] = send_agent_status(
-                connection_id=id, name=function_agent.name, call_id=function.call_id
-            )
-            await func(**args)
-        else:
-            return {"error": "Function not found"}
+    elif name in function_agents and function_agents[name].id in dir(agents):
+        # execute function agent
+        function_agent = function_agents[name]
+        func = getattr(agents, function_agent.id)
+        args = arguments.copy()
+        args["notify"] = notify(function_agent.name)
+        return await func(**args)
+    elif name in function_calls:
+        # every @function takes notify, as in SustineoAgentEventHandler
+        args = arguments.copy()
+        args["notify"] = notify(name)
+        result = function_calls[name].func(**args)
+        return await result if inspect.isawaitable(result) else result
+
+    raise ValueError(f"Function {name} not found")
+
+
+@router.post("/{id}")
+async def execute_agent(id: str, function: FunctionCall):
+    global connections
+
+    await load_foundry_agents()
+
+    if id not in connections:
+        return {"error": "Connection not found"}
+
+    if not await has_function(function.name):
+        return {"error": "Function not found"}
+
+    await run_function(
+        function.name,
+        function.arguments,
+        lambda name: send_agent_status(
+            connection_id=id, name=name, call_id=function.call_id
+        ),
+    )
@@ -119,17 +119,37 @@ async def get_foundry_agents() -> dict[str, Agent]:
         return foundry_agents
 
 
-@trace
-async def execute_foundry_agent(
-    agent_id: str,
-    additional_instructions: str,
-    query: str,
-    tools: dict[str, Function],
-    notify: AgentUpdateEvent,
-):
-    """Execute a Foundry agent."""
+class FoundryRun:
+    """
+    A Foundry agent run set up to the point of streaming: the agent
+    looked up and the query posted to a new thread. Owns its project
+    client until run or discarded. (not a dataclass, so traces don't
+    try to serialize the client)
+    """
+
+    def __init__(
+        self,
+        stack: contextlib.AsyncExitStack,
+        project_client: AIProjectClient,
+        agent_id: str,
+        thread_id: str,
+        query: str,
+    ):
+        self.stack = stack
+        self.project_client = project_client
+        self.agent_id = agent_id
+        self.thread_id = thread_id
+        self.query = query
+
+    def __str__(self):
+        return f"FoundryRun(agent_id={self.agent_id}, thread_id={self.thread_id})"
 
-    async with get_foundry_project_client() as project_client:
+
+@trace
+async def prepare_foundry_agent(agent_id: str, query: str) -> FoundryRun:
+    stack = contextlib.AsyncExitStack()
+    try:
+        project_client = await stack.enter_async_context(get_foundry_project_client())
         server_agent = await project_client.agents.get_agent(agent_id)
         thread = await project_client.agents.create_thread()
         await project_client.agents.create_message(
@@ -137,15 +157,44 @@ async def execute_foundry_agent(
             role="user",
             content=query,
         )
+    except BaseException:
+        await stack.aclose()
+        raise
 
-        handler = SustineoAgentEventHandler(project_client, tools, notify)
-        async with await project_client.agents.create_stream(
-            agent_id=server_agent.id,
-            thread_id=thread.id,
+    return FoundryRun(stack, project_client, server_agent.id, thread.id, query)
+
+
+async def discard_foundry_run(run: FoundryRun):
+    """Clean up a prepared run that won't be used."""
+    try:
+        await run.project_client.agents.delete_thread(run.thread_id)
+    finally:
+        await run.stack.aclose()
+
+
+@trace
+async def execute_foundry_agent(
+    agent_id: str,
+    additional_instructions: str,
+    query: str,
+    tools: dict[str, Function],
+    notify: AgentUpdateEvent,
+    prepared: Union[FoundryRun, None] = None,
+):
+    """Execute a Foundry agent, optionally from an already prepared run."""
+
+    run = prepared or await prepare_foundry_agent(agent_id, query)
+    try:
+        handler = SustineoAgentEventHandler(run.project_client, tools, notify)
+        async with await run.project_client.agents.create_stream(
+            agent_id=run.agent_id,
+            thread_id=run.thread_id,
             additional_instructions=additional_instructions,
             event_handler=handler,
         ) as stream:
             await stream.until_done()
+    finally:
+        await run.stack.aclose()
 
 
 async def create_foundry_thread():
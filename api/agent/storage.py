@@ -1,54 +1,319 @@
 import os
 import uuid
 import base64
+import asyncio
+import aiohttp
 import contextlib
-from typing import AsyncGenerator
+from datetime import datetime, timedelta, timezone
+from typing import AsyncGenerator, Union
 from aiohttp.streams import StreamReader
-from azure.storage.blob.aio import BlobServiceClient
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob import (
+    BlobBlock,
+    BlobSasPermissions,
+    ContentSettings,
+    UserDelegationKey,
+    generate_blob_sas,
+)
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient
 from azure.identity.aio import DefaultAzureCredential
 
 
 SUSTINEO_STORAGE = os.environ.get("SUSTINEO_STORAGE", "EMPTY")
 SUSTINEO_CONTAINER = "sustineo"
 
+# keep downloads to a few small chunks in memory at a time
+# (the sdk defaults to a 32MB initial get)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# number of images decoded/uploaded at the same time
+UPLOAD_CONCURRENCY = 4
+
+# videos are streamed into storage in blocks of this size
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+
+# "proxy" streams media through the api, "redirect" sends clients
+# straight to storage with short-lived signed (SAS) urls
+MEDIA_DELIVERY = os.environ.get("SUSTINEO_MEDIA_DELIVERY", "proxy").lower()
+MEDIA_SAS_TTL_MINUTES = int(os.environ.get("SUSTINEO_MEDIA_SAS_TTL_MINUTES", "60"))
+
+# maximum number of pooled connections to the storage account
+STORAGE_POOL_SIZE = int(os.environ.get("SUSTINEO_STORAGE_POOL_SIZE", "100"))
+
+
+class StorageClientManager:
+    """
+    Process-wide blob storage clients. A single credential (with its token
+    cache) and a single BlobServiceClient (with a pooled aiohttp session) are
+    created on first use and shared by every request until the application
+    shuts down. Clients created on another event loop are replaced, and the
+    old ones closed in the background.
+    """
+
+    def __init__(self, account_url: str, pool_size: int = STORAGE_POOL_SIZE):
+        self.account_url = account_url
+        self.pool_size = pool_size
+        self.credential: Union[DefaultAzureCredential, None] = None
+        self.service_client: Union[BlobServiceClient, None] = None
+        self.container_clients: dict[str, ContainerClient] = {}
+        self.loop: Union[asyncio.AbstractEventLoop, None] = None
+        # clients left behind by reset(), still closing
+        self.closing: set[asyncio.Task] = set()
+
+    def get_service_client(self) -> BlobServiceClient:
+        loop = asyncio.get_running_loop()
+        if self.service_client is not None and self.loop is not loop:
+            # clients are bound to the loop that created them (e.g. a
+            # reloaded app or a new test loop), start over on this one
+            self.reset()
+
+        if self.service_client is None:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                cookie_jar=aiohttp.DummyCookieJar(),
+                auto_decompress=False,
+                trust_env=True,
+            )
+            self.credential = DefaultAzureCredential()
+            self.service_client = BlobServiceClient(
+                account_url=self.account_url,
+                credential=self.credential,
+                transport=AioHttpTransport(session=session, session_owner=True),
+                max_single_get_size=DOWNLOAD_CHUNK_SIZE,
+                max_chunk_get_size=DOWNLOAD_CHUNK_SIZE,
+            )
+            self.loop = loop
+
+        return self.service_client
+
+    def get_container_client(self, container: str) -> ContainerClient:
+        service_client = self.get_service_client()
+        if container not in self.container_clients:
+            # container clients share the service client's transport
+            self.container_clients[container] = service_client.get_container_client(
+                container
+            )
+        return self.container_clients[container]
+
+    def detach(
+        self,
+    ) -> tuple[Union[BlobServiceClient, None], Union[DefaultAzureCredential, None]]:
+        clients = (self.service_client, self.credential)
+        self.container_clients.clear()
+        self.service_client = None
+        self.credential = None
+        self.loop = None
+        return clients
+
+    def reset(self):
+        # the old clients still hold a session with open connections, close
+        # them on their own loop if it is still running, else on this one
+        loop = self.loop
+        service_client, credential = self.detach()
+        if service_client is None and credential is None:
+            return
+
+        closing = close_clients(service_client, credential)
+        running = asyncio.get_running_loop()
+        if loop is not None and loop is not running and loop.is_running():
+            asyncio.run_coroutine_threadsafe(closing, loop)
+        else:
+            task = running.create_task(closing)
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+
+    async def close(self):
+        await close_clients(*self.detach())
+        if self.closing:
+            await asyncio.wait(self.closing)
+
+
+async def close_clients(
+    service_client: Union[BlobServiceClient, None],
+    credential: Union[DefaultAzureCredential, None],
+):
+    try:
+        if service_client is not None:
+            await service_client.close()
+    except Exception as e:
+        # e.g. connections left behind by a loop that has since closed
+        print("Error closing storage client", e)
+    finally:
+        if credential is not None:
+            await credential.close()
+
+
+storage_clients = StorageClientManager(SUSTINEO_STORAGE)
+
+
+class SignedUrlCache:
+    """
+    Short-lived, read-only user delegation SAS urls for blobs. The
+    delegation key and each blob's url are reused until they get close to
+    expiring, so signing is normally a dictionary lookup.
+    """
+
+    def __init__(
+        self,
+        clients: StorageClientManager,
+        ttl: timedelta = timedelta(minutes=MEDIA_SAS_TTL_MINUTES),
+    ):
+        self.clients = clients
+        self.ttl = ttl
+        # refresh once less than a quarter of the lifetime is left
+        self.margin = ttl / 4
+        self.urls: dict[str, tuple[str, datetime]] = {}
+        self.delegation_key: Union[UserDelegationKey, None] = None
+        self.delegation_key_expiry = datetime.min.replace(tzinfo=timezone.utc)
+        self.lock = asyncio.Lock()
+
+    async def get_delegation_key(self, now: datetime) -> UserDelegationKey:
+        async with self.lock:
+            # the key has to outlive every url signed with it
+            if self.delegation_key is None or (
+                self.delegation_key_expiry < now + self.ttl + self.margin
+            ):
+                expiry = now + max(timedelta(days=1), self.ttl * 2)
+                service_client = self.clients.get_service_client()
+                self.delegation_key = await service_client.get_user_delegation_key(
+                    key_start_time=now - timedelta(minutes=5),
+                    key_expiry_time=expiry,
+                )
+                self.delegation_key_expiry = expiry
+
+            return self.delegation_key
+
+    async def get_url(self, container: str, blob_name: str) -> str:
+        now = datetime.now(timezone.utc)
+        key = f"{container}/{blob_name}"
+        if key in self.urls:
+            url, expiry = self.urls[key]
+            if expiry - self.margin > now:
+                return url
+
+        delegation_key = await self.get_delegation_key(now)
+        container_client = self.clients.get_container_client(container)
+        blob_client = container_client.get_blob_client(blob_name)
+
+        expiry = now + self.ttl
+        sas = generate_blob_sas(
+            account_name=str(blob_client.account_name),
+            container_name=container,
+            blob_name=blob_name,
+            user_delegation_key=delegation_key,
+            permission=BlobSasPermissions(read=True),
+            # allow for clock skew between us and the storage service
+            start=now - timedelta(minutes=5),
+            expiry=expiry,
+        )
+
+        # forget expired urls rather than let the cache grow forever
+        if len(self.urls) > 10_000:
+            self.urls = {k: v for k, v in self.urls.items() if v[1] > now}
+
+        url = f"{blob_client.url}?{sas}"
+        self.urls[key] = (url, expiry)
+        return url
+
+
+signed_urls = SignedUrlCache(storage_clients)
+
 
 @contextlib.asynccontextmanager
 async def get_storage_client(container: str):
-    # Create credential and blob service client
-    credential = DefaultAzureCredential()
-    blob_service_client = BlobServiceClient(
-        account_url=SUSTINEO_STORAGE, credential=credential
-    )
-    try:
-        # Create the container if it doesn't exist
-        container_client = blob_service_client.get_container_client(container)
+    # container clients come from the shared pool and are
+    # closed with the application, not at the end of the block
+    container_client = storage_clients.get_container_client(container)
 
-        # remove the comment below if you want to ensure
-        # the container exists. commenting to avoid unnecessary
-        # creation
-        # if not await container_client.exists():
-        #    await container_client.create_container()
+    # remove the comment below if you want to ensure
+    # the container exists. commenting to avoid unnecessary
+    # creation
+    # if not await container_client.exists():
+    #    await container_client.create_container()
 
-        yield container_client
-    finally:
-        await credential.close()
-        await blob_service_client.close()
+    yield container_client
 
 
 async def save_image_blobs(images: list[str]) -> AsyncGenerator[str, None]:
+    """
+    Decode and upload images concurrently, yielding each blob name as soon as
+    its upload finishes (completion order, not input order).
+    """
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
     async with get_storage_client(SUSTINEO_CONTAINER) as container_client:
-        for image in images:
-            image_bytes = base64.b64decode(image)
-            blob_name = f"images/{str(uuid.uuid4())}.png"
-            await container_client.upload_blob(
-                name=blob_name, data=image_bytes, overwrite=True
-            )
-            yield blob_name
+
+        async def save_image(image: str) -> str:
+            async with semaphore:
+                # decoding multi-MB base64 strings would stall the event loop
+                image_bytes = await asyncio.to_thread(base64.b64decode, image)
+                blob_name = f"images/{str(uuid.uuid4())}.png"
+                await container_client.upload_blob(
+                    name=blob_name, data=image_bytes, overwrite=True
+                )
+                return blob_name
+
+        tasks = [asyncio.create_task(save_image(image)) for image in images]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            # consumer stopped early or an upload failed
+            for task in tasks:
+                task.cancel()
+
+
+async def read_blocks(
+    stream_reader: StreamReader, block_size: int
+) -> AsyncGenerator[bytes, None]:
+    # fixed size blocks, the last one holds whatever is left
+    while True:
+        try:
+            yield await stream_reader.readexactly(block_size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                yield e.partial
+            return
 
 
 async def save_video_blob(stream_reader: StreamReader) -> str:
+    """
+    Pipe a video download straight into a block blob. Blocks are staged
+    while the download continues, with at most UPLOAD_CONCURRENCY in
+    flight, so memory stays constant regardless of the video length.
+    """
     async with get_storage_client(SUSTINEO_CONTAINER) as container_client:
         blob_name = f"videos/{str(uuid.uuid4())}.mp4"
-        content = await stream_reader.read()
-        await container_client.upload_blob(name=blob_name, data=content, overwrite=True)
+        blob_client = container_client.get_blob_client(blob_name)
+
+        blocks: list[BlobBlock] = []
+        pending: set[asyncio.Task] = set()
+        try:
+            async for data in read_blocks(stream_reader, UPLOAD_BLOCK_SIZE):
+                # block ids must all have the same length
+                block_id = base64.b64encode(f"{len(blocks):08d}".encode()).decode()
+                blocks.append(BlobBlock(block_id=block_id))
+                pending.add(
+                    asyncio.create_task(blob_client.stage_block(block_id, data))
+                )
+
+                if len(pending) >= UPLOAD_CONCURRENCY:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        task.result()
+
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                for task in done:
+                    task.result()
+        finally:
+            # a failed block or download abandons the upload
+            for task in pending:
+                task.cancel()
+
+        await blob_client.commit_block_list(
+            blocks, content_settings=ContentSettings(content_type="video/mp4")
+        )
         return blob_name
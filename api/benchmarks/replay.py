@@ -0,0 +1,136 @@
+"""
+Replay benchmark for RealtimeSession event handling.
+
+Plays a recorded voice session (see ``VOICE_RECORD_DIR``), or a synthetic
+one, through RealtimeSession with no network, and reports throughput and
+per-event handling time for realtime events and client messages.
+
+    python -m api.benchmarks.replay [recording.jsonl] [--sessions 10] [--speed 0]
+"""
+
+import time
+import base64
+import asyncio
+import argparse
+from typing import Any, cast
+
+from api.connection import AUDIO_FRAME
+from api.voice.replay import (
+    DISCONNECT,
+    HandlingTimes,
+    RecordedEvent,
+    ReplaySession,
+    load_recording,
+)
+from api.voice.session import RealtimeSession
+
+
+def synthetic_recording(turns: int = 5) -> list[RecordedEvent]:
+    # per turn: 3s of microphone audio in 100ms frames, then 3s of
+    # response audio in 50ms deltas
+    mic = bytes((AUDIO_FRAME,)) + bytes(4800)
+    delta = base64.b64encode(bytes(2400)).decode()
+    events = [RecordedEvent(0.0, "client", {"user": "benchmark"})]
+    t = 0.0
+    for turn in range(turns):
+        item = f"item_{turn}"
+        events.append(
+            RecordedEvent(
+                t, "realtime", {"type": "input_audio_buffer.speech_started", "item_id": item}
+            )
+        )
+        for _ in range(30):
+            events.append(RecordedEvent(t, "client", mic))
+            t += 0.1
+        events.append(
+            RecordedEvent(
+                t,
+                "realtime",
+                {
+                    "type": "conversation.item.input_audio_transcription.completed",
+                    "item_id": item,
+                    "content_index": 0,
+                    "transcript": "what's the weather like today",
+                },
+            )
+        )
+        for i in range(60):
+            events.append(
+                RecordedEvent(
+                    t,
+                    "realtime",
+                    {
+                        "type": "response.audio.delta",
+                        "event_id": f"event_{turn}_{i}",
+                        "response_id": f"response_{turn}",
+                        "item_id": f"item_{turn}_audio",
+                        "delta": delta,
+                    },
+                )
+            )
+            t += 0.05
+        events.append(RecordedEvent(t, "realtime", {"type": "response.audio.done"}))
+        events.append(
+            RecordedEvent(t, "realtime", {"type": "response.done", "response": {"output": []}})
+        )
+    events.append(RecordedEvent(t, "client", DISCONNECT))
+    return events
+
+
+async def replay(events: list[RecordedEvent], speed: float) -> ReplaySession:
+    replay = ReplaySession(events, speed=speed)
+    await replay.client.receive_json()
+    session = RealtimeSession(cast(Any, replay.realtime), replay.client)
+    await asyncio.gather(session.receive_realtime(), session.receive_client())
+    return replay
+
+
+def percentiles(samples: list[float]) -> str:
+    ordered = sorted(samples)
+    if len(ordered) == 0:
+        return "no samples"
+    values = [
+        ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1e6
+        for p in (50, 95, 99)
+    ]
+    return "p50 {:8.1f} us  p95 {:8.1f} us  p99 {:8.1f} us".format(*values)
+
+
+async def run(events: list[RecordedEvent], sessions: int, speed: float):
+    start = time.perf_counter()
+    replays = await asyncio.gather(*[replay(events, speed) for _ in range(sessions)])
+    seconds = time.perf_counter() - start
+
+    realtime, client = HandlingTimes(), HandlingTimes()
+    for r in replays:
+        for event_type, samples in r.realtime.times.samples.items():
+            realtime.samples.setdefault(event_type, []).extend(samples)
+        for event_type, samples in r.websocket.times.samples.items():
+            client.samples.setdefault(event_type, []).extend(samples)
+
+    total = len(realtime.all()) + len(client.all())
+    print(f"{sessions} sessions, {total:,} events in {seconds:.2f}s")
+    print(f"  {total / seconds:,.0f} events/s\n")
+    for name, times in (("realtime", realtime), ("client", client)):
+        print(f"{name:<10} {percentiles(times.all())}")
+        for event_type, samples in sorted(times.samples.items()):
+            print(f"  {event_type:<56} {len(samples):7,}  {percentiles(samples)}")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", nargs="?", help="jsonl session recording")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument(
+        "--speed", type=float, default=0, help="1 for real time, 0 as fast as possible"
+    )
+    parser.add_argument("--turns", type=int, default=5, help="synthetic session turns")
+    args = parser.parse_args()
+
+    events = (
+        load_recording(args.recording)
+        if args.recording
+        else synthetic_recording(args.turns)
+    )
+    asyncio.run(run(events, args.sessions, args.speed))
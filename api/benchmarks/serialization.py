@@ -0,0 +1,76 @@
+"""
+Microbenchmark for Update serialization.
+
+Compares the previous path (``dataclasses.asdict`` + stdlib ``json``) with
+the precompiled encoders and the orjson fast path used by
+``Connection.send_update``.
+
+    python -m api.benchmarks.serialization [--number 100000]
+"""
+
+import json
+import base64
+import timeit
+import argparse
+from dataclasses import asdict
+
+from api.model import Content, Update, orjson
+
+
+def sample_updates() -> dict[str, Update]:
+    # ~100ms of 24kHz pcm16, a typical coalesced audio frame
+    audio = base64.b64encode(bytes(4800)).decode()
+    agent = Update.agent(
+        id="run_4f1c",
+        call_id="call_9a2b",
+        name="Image Generation Agent",
+        status="step completed",
+        information="storing image",
+        content=Content(
+            type="image",
+            content=[
+                {
+                    "type": "image",
+                    "description": "A lighthouse on a cliff at sunset, oil painting",
+                    "size": "1024x1024",
+                    "quality": "low",
+                    "image_url": "images/9a2cb127-1270-4e23-8ef7-4c71ca67c33a.png",
+                }
+            ],
+        ),
+        output=True,
+    )
+    return {
+        "AudioUpdate": Update.audio(id="event_123", data=audio),
+        "AgentUpdate": agent,
+    }
+
+
+def run(number: int):
+    paths = {
+        "asdict + json": lambda u: json.dumps(asdict(u)),
+        "to_dict + json": lambda u: json.dumps(u.to_dict(), separators=(",", ":")),
+        "to_json": lambda u: u.to_json(),
+    }
+    if orjson is None:
+        print("orjson is not installed, to_json uses the stdlib encoder\n")
+
+    for name, update in sample_updates().items():
+        # all paths must produce the same message
+        expected = json.loads(json.dumps(asdict(update)))
+        baseline = None
+        print(f"{name} ({number:,} iterations)")
+        for label, path in paths.items():
+            assert json.loads(path(update)) == expected
+            seconds = min(timeit.repeat(lambda: path(update), number=number, repeat=3))
+            per_call = seconds / number * 1e6
+            baseline = baseline or per_call
+            print(f"  {label:<16} {per_call:8.2f} us/op  {baseline / per_call:5.1f}x")
+        print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.number)
@@ -0,0 +1,369 @@
+"""
+Load generator for the voice websocket.
+
+Starts the app in a child process against a local stub realtime server and
+opens concurrent ``/api/voice/{id}`` clients that stream synthetic pcm16 in
+real time. Every few seconds a client starts a turn; the stub answers with
+speech_started (an interrupt for the client) and a stream of audio deltas.
+Reports p50/p95/p99 session setup time, interrupt propagation and audio
+delta forwarding latency, plus the app's CPU and memory per session.
+
+    python -m api.benchmarks.voice_load [--sessions 50] [--duration 30]
+
+The app's Cosmos configuration and Foundry thread are replaced by the local
+voice.prompty and a fixed thread id; everything else runs as deployed.
+CPU and memory need psutil.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import struct
+import asyncio
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from typing import Any, Union
+
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import ServerConnection, serve
+
+from api.benchmarks.replay import percentiles
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover
+    psutil = None
+
+# 100ms of 24kHz pcm16 per client message, the web client's chunk size
+FRAME_MS = 100
+FRAME_BYTES = 24000 * 2 * FRAME_MS // 1000
+
+# audio carrying a stamp starts with this marker, a 32 bit key and a
+# time.monotonic() timestamp, which is shared by processes on one host
+MARK = b"SVLB"
+STAMP = struct.Struct(">4sId")
+
+
+def stamp(audio: bytes, key: int) -> bytes:
+    return STAMP.pack(MARK, key, time.monotonic()) + audio[STAMP.size :]
+
+
+def find_stamps(audio: bytes) -> list[tuple[int, float]]:
+    stamps: list[tuple[int, float]] = []
+    position = audio.find(MARK)
+    while position >= 0 and position + STAMP.size <= len(audio):
+        _, key, sent = STAMP.unpack_from(audio, position)
+        stamps.append((key, sent))
+        position = audio.find(MARK, position + STAMP.size)
+    return stamps
+
+
+def turn_key(client: int, turn: int) -> int:
+    return client * 1000 + turn
+
+
+@dataclass
+class LoadResults:
+    setup: list[float] = field(default_factory=list)
+    interrupt: list[float] = field(default_factory=list)
+    delta: list[float] = field(default_factory=list)
+    errors: int = 0
+    deltas_sent: int = 0
+
+
+class StubRealtime:
+    """
+    Realtime api stand-in. Answers each stamped input audio append (the
+    start of a client turn) with speech_started followed by
+    ``deltas`` stamped audio deltas, ``interval`` seconds apart.
+    """
+
+    def __init__(self, results: LoadResults, deltas: int, interval: float):
+        self.results = results
+        self.deltas = deltas
+        self.interval = interval
+        # session.update time per client, and speech_started time per turn
+        self.updated: dict[int, float] = {}
+        self.interrupts: dict[int, float] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    async def handler(self, websocket: ServerConnection):
+        await websocket.send(json.dumps({"type": "session.created", "session": {}}))
+        updated: Union[float, None] = None
+        async for message in websocket:
+            event = json.loads(message)
+            match event["type"]:
+                case "session.update":
+                    updated = time.monotonic()
+                    await websocket.send(
+                        json.dumps({"type": "session.updated", "session": {}})
+                    )
+                case "input_audio_buffer.append":
+                    for key, _ in find_stamps(base64.b64decode(event["audio"])):
+                        if updated is not None:
+                            self.updated.setdefault(key // 1000, updated)
+                        task = asyncio.create_task(self.respond(websocket, key))
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+
+    async def respond(self, websocket: ServerConnection, key: int):
+        item = f"item_{key}"
+        self.interrupts[key] = time.monotonic()
+        await websocket.send(
+            json.dumps(
+                {
+                    "type": "input_audio_buffer.speech_started",
+                    "event_id": f"event_{key}",
+                    "item_id": item,
+                    "audio_start_ms": 0,
+                }
+            )
+        )
+        # 50ms of audio per delta
+        audio = bytes(2400)
+        for i in range(self.deltas):
+            await asyncio.sleep(self.interval)
+            await websocket.send(
+                json.dumps(
+                    {
+                        "type": "response.audio.delta",
+                        "event_id": f"event_{key}_{i}",
+                        "response_id": f"response_{key}",
+                        "item_id": item,
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": base64.b64encode(stamp(audio, key)).decode(),
+                    }
+                )
+            )
+            self.results.deltas_sent += 1
+        await websocket.send(
+            json.dumps(
+                {
+                    "type": "response.audio.done",
+                    "response_id": f"response_{key}",
+                    "item_id": item,
+                    "output_index": 0,
+                    "content_index": 0,
+                }
+            )
+        )
+
+
+async def run_client(
+    url: str,
+    index: int,
+    stub: StubRealtime,
+    results: LoadResults,
+    duration: float,
+    turn_seconds: float,
+    binary: bool,
+):
+    subprotocols: Any = ["sustineo.audio.v1"] if binary else None
+    current: Union[int, None] = None
+    tail = b""
+
+    async def read(websocket):
+        nonlocal tail
+        async for message in websocket:
+            now = time.monotonic()
+            if isinstance(message, bytes):
+                # audio frame: 1 byte frame type, then the audio
+                audio = message[1:]
+            else:
+                update = json.loads(message)
+                if update["type"] == "interrupt" and current in stub.interrupts:
+                    results.interrupt.append(now - stub.interrupts[current])
+                if update["type"] != "audio":
+                    continue
+                audio = base64.b64decode(update["content"])
+
+            # a stamp can straddle two frames. the carried tail is too
+            # short to hold a whole (already counted) stamp
+            data = tail + audio
+            for _, sent in find_stamps(data):
+                results.delta.append(now - sent)
+            tail = data[-(STAMP.size - 1) :]
+
+    start = time.monotonic()
+    try:
+        async with connect(
+            f"{url}/api/voice/load-{index}", subprotocols=subprotocols, max_size=None
+        ) as websocket:
+            await websocket.send(
+                json.dumps({"type": "settings", "settings": {"user": f"load {index}"}})
+            )
+            reader = asyncio.create_task(read(websocket))
+
+            silence = bytes(FRAME_BYTES)
+            frames = int(duration * 1000 / FRAME_MS)
+            per_turn = max(1, int(turn_seconds * 1000 / FRAME_MS))
+            for frame in range(frames):
+                audio = silence
+                if frame % per_turn == 0:
+                    current = turn_key(index, frame // per_turn)
+                    audio = stamp(silence, current)
+
+                if binary:
+                    await websocket.send(b"\x01" + audio)
+                else:
+                    content = base64.b64encode(audio).decode()
+                    await websocket.send(json.dumps({"type": "audio", "content": content}))
+
+                # real time microphone pacing
+                next_frame = start + (frame + 1) * FRAME_MS / 1000
+                await asyncio.sleep(max(0.0, next_frame - time.monotonic()))
+
+            # let the last response arrive
+            await asyncio.sleep(stub.deltas * stub.interval + 0.5)
+            reader.cancel()
+    except Exception as e:
+        results.errors += 1
+        print(f"Client {index} failed: {e}")
+
+    if index in stub.updated:
+        results.setup.append(stub.updated[index] - start)
+
+
+def serve_app(port: int):
+    """
+    Child process: the app with its Cosmos and Foundry dependencies
+    replaced by local stand-ins.
+    """
+    import uvicorn
+
+    import api.main as main
+    from api.voice.common import load_prompty_file
+
+    async def default_configuration():
+        return await load_prompty_file("voice.prompty", True)
+
+    async def create_thread():
+        return "thread_load_test"
+
+    main.get_default_configuration = default_configuration
+    main.create_foundry_thread = create_thread
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+async def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def sample(process: Any) -> tuple[float, int]:
+    # cpu seconds and rss of the app, children (workers) included
+    processes = [process, *process.children(recursive=True)]
+    cpu = sum(sum(p.cpu_times()[:2]) for p in processes)
+    return cpu, sum(p.memory_info().rss for p in processes)
+
+
+async def run(args: argparse.Namespace):
+    results = LoadResults()
+    stub = StubRealtime(results, args.deltas, args.delta_interval)
+
+    async with serve(stub.handler, "127.0.0.1", 0, max_size=None) as server:
+        stub_port = list(server.sockets)[0].getsockname()[1]
+        env = {
+            **os.environ,
+            "AZURE_VOICE_ENDPOINT": "http://127.0.0.1",
+            "AZURE_VOICE_WEBSOCKET_URL": f"ws://127.0.0.1:{stub_port}",
+            "APPLICATIONINSIGHTS_CONNECTION_STRING": os.getenv(
+                "APPLICATIONINSIGHTS_CONNECTION_STRING",
+                "InstrumentationKey=00000000-0000-0000-0000-000000000000",
+            ),
+        }
+        app = subprocess.Popen(
+            [sys.executable, "-m", "api.benchmarks.voice_load", "--serve", str(args.port)],
+            env=env,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.DEVNULL,
+        )
+        try:
+            await wait_for_port(args.port)
+            process = psutil.Process(app.pid) if psutil is not None else None
+            await asyncio.sleep(1.0)
+            if process is not None:
+                idle_cpu, idle_rss = sample(process)
+
+            url = f"ws://127.0.0.1:{args.port}"
+            start = time.monotonic()
+            clients = []
+            for i in range(args.sessions):
+                clients.append(
+                    asyncio.create_task(
+                        run_client(
+                            url,
+                            i,
+                            stub,
+                            results,
+                            args.duration,
+                            args.turn_seconds,
+                            args.binary,
+                        )
+                    )
+                )
+                # spread connects over the ramp
+                await asyncio.sleep(args.ramp / args.sessions)
+
+            # peak memory is sampled while every client is streaming
+            await asyncio.sleep(max(0.0, args.duration / 2 - args.ramp))
+            if process is not None:
+                _, load_rss = sample(process)
+            await asyncio.gather(*clients)
+            elapsed = time.monotonic() - start
+            if process is not None:
+                load_cpu, _ = sample(process)
+        finally:
+            app.terminate()
+            app.wait()
+
+    sessions = args.sessions - results.errors
+    print(f"{args.sessions} sessions for {args.duration:.0f}s, {results.errors} failed")
+    print(f"  setup      {percentiles(results.setup)}")
+    print(f"  interrupt  {percentiles(results.interrupt)}")
+    print(f"  delta      {percentiles(results.delta)}")
+    received = len(results.delta)
+    print(f"  deltas     {received:,} of {results.deltas_sent:,} received")
+
+    if process is None:
+        print("\npsutil is not installed, cpu and memory are not reported")
+    elif sessions > 0:
+        cpu = load_cpu - idle_cpu
+        # cpu seconds per second of one session
+        per_session = cpu / (sessions * elapsed)
+        print(f"\n  cpu        {per_session * 100:.2f}% of a core per session")
+        print(f"  sessions   {1 / per_session if per_session > 0 else 0:,.0f} per core")
+        memory = (load_rss - idle_rss) / sessions / 1024 / 1024
+        print(f"  memory     {memory:.2f} MiB per session")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per session")
+    parser.add_argument("--turn-seconds", type=float, default=5)
+    parser.add_argument("--ramp", type=float, default=5, help="seconds to open all sessions")
+    parser.add_argument("--deltas", type=int, default=40, help="audio deltas per turn")
+    parser.add_argument("--delta-interval", type=float, default=0.025)
+    parser.add_argument("--binary", action="store_true", help="binary audio frames")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--verbose", action="store_true", help="show app output")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve_app(args.serve)
+    else:
+        asyncio.run(run(args))
@@ -1,18 +1,438 @@
+import os
+import json
+import time
+import base64
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Literal, Union
 from api.model import Update
-from fastapi import WebSocket
-from dataclasses import asdict
+from api.voice.codecs import AudioCodec
+from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.websockets import WebSocketState
 
+# websocket subprotocol a client can request to exchange audio as raw
+# pcm16 in binary frames instead of base64 inside json messages
+AUDIO_SUBPROTOCOL = "sustineo.audio.v1"
+
+# binary frames are a one byte frame type followed by the payload
+AUDIO_FRAME = 0x01
+
+
+# outbound audio deltas are merged into frames of this duration (0 disables)
+# or at most this many bytes, whichever comes first
+AUDIO_FRAME_MS = int(os.getenv("VOICE_AUDIO_FRAME_MS", "100"))
+AUDIO_FRAME_MAX_BYTES = int(os.getenv("VOICE_AUDIO_FRAME_MAX_BYTES", "32768"))
+AUDIO_SAMPLE_RATE = 24000
+
+# outbound messages waiting on a slow client. text updates (messages,
+# agent and control updates) are never dropped, senders wait for space
+# instead. audio beyond VOICE_SEND_QUEUE_AUDIO_MS of playback is dropped
+SEND_QUEUE_SIZE = int(os.getenv("VOICE_SEND_QUEUE_SIZE", "256"))
+SEND_QUEUE_AUDIO_MS = int(os.getenv("VOICE_SEND_QUEUE_AUDIO_MS", "10000"))
+
+# how long close() keeps writing what is already queued
+SEND_QUEUE_DRAIN_SECONDS = 2.0
+
+
+def encode_frame(frame_type: int, payload: bytes) -> bytes:
+    return bytes((frame_type,)) + payload
+
+
+def decode_frame(data: bytes) -> tuple[int, bytes]:
+    if len(data) == 0:
+        raise ValueError("Empty binary frame")
+    return data[0], data[1:]
+
+
+class AudioCoalescer:
+    """
+    Merges small, bursty pcm16 audio deltas into larger frames. A frame is
+    sent once it holds ``frame_ms`` of audio (or ``max_bytes``), when
+    ``frame_ms`` has passed since the first buffered delta, or on flush().
+    """
+
+    def __init__(
+        self,
+        send: Callable[[bytes], Awaitable[None]],
+        frame_ms: int = AUDIO_FRAME_MS,
+        max_bytes: int = AUDIO_FRAME_MAX_BYTES,
+        sample_rate: int = AUDIO_SAMPLE_RATE,
+        sample_width: int = 2,
+    ):
+        self.send = send
+        self.frame_ms = frame_ms
+        self.max_bytes = max_bytes
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.buffer = bytearray()
+        self.timer: Union[asyncio.TimerHandle, None] = None
+        self.tasks: set[asyncio.Task] = set()
+        self.lock = asyncio.Lock()
+
+    @property
+    def frame_bytes(self) -> int:
+        # whole samples only, so frames never split one
+        bytes_per_second = self.sample_rate * self.sample_width
+        size = min(self.max_bytes, bytes_per_second * self.frame_ms // 1000)
+        return size - size % self.sample_width
+
+    async def add(self, audio: bytes):
+        if self.frame_bytes <= 0:
+            async with self.lock:
+                await self.send(audio)
+            return
+
+        self.buffer += audio
+        if len(self.buffer) >= self.frame_bytes:
+            await self.flush()
+        elif self.timer is None:
+            # don't hold a partial frame longer than one frame window
+            self.timer = asyncio.get_running_loop().call_later(
+                self.frame_ms / 1000, self.flush_later
+            )
+
+    def flush_later(self):
+        self.timer = None
+        task = asyncio.create_task(self.flush())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        async with self.lock:
+            if len(self.buffer) == 0:
+                return
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            await self.send(data)
+
+    def clear(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.buffer.clear()
+
+
+class Playback:
+    """
+    Where the client is in playing the current response item. The client
+    plays audio in real time as it arrives, so whatever was written ahead
+    of the playback clock is still buffered there, unheard.
+    """
+
+    def __init__(self, sample_rate: int = AUDIO_SAMPLE_RATE, sample_width: int = 2):
+        self.bytes_per_ms = sample_rate * sample_width / 1000
+        self.item_id: Union[str, None] = None
+        self.written_ms = 0.0
+        # time.monotonic() at which the written audio finishes playing
+        self.ends = 0.0
+
+    def start(self, item_id: str):
+        self.item_id = item_id
+        self.written_ms = 0.0
+
+    def write(self, size: int, now: Union[float, None] = None):
+        if self.item_id is None:
+            return
+        now = time.monotonic() if now is None else now
+        duration_ms = size / self.bytes_per_ms
+        self.written_ms += duration_ms
+        # playback stalls when the client runs dry, then picks up again
+        self.ends = max(now, self.ends) + duration_ms / 1000
+
+    def played_ms(self, now: Union[float, None] = None) -> int:
+        now = time.monotonic() if now is None else now
+        buffered_ms = max(0.0, self.ends - now) * 1000
+        return max(0, int(self.written_ms - buffered_ms))
+
+    def stop(self):
+        self.item_id = None
+        self.written_ms = 0.0
+        self.ends = 0.0
+
+
+@dataclass(slots=True)
+class Outbound:
+    # audio_end marks the end of a response's audio, see Connection.end_audio
+    kind: Literal["text", "audio", "audio_end"]
+    data: Union[str, bytes]
+
+
+class SendQueue:
+    """
+    Bounded outbound queue for a single client, drained by its own writer
+    task so a slow socket never blocks the realtime read loop. Audio can
+    always be queued: when the queue is full adjacent audio frames are
+    merged, and once more than ``max_audio_bytes`` is waiting the oldest
+    audio is dropped (the client is too far behind to play it in time).
+    Text is never dropped, put_text() waits for space instead.
+    """
+
+    def __init__(
+        self,
+        write_text: Callable[[str], Awaitable[None]],
+        write_audio: Callable[[bytes], Awaitable[None]],
+        max_items: int = SEND_QUEUE_SIZE,
+        max_audio_bytes: int = AUDIO_SAMPLE_RATE * 2 * SEND_QUEUE_AUDIO_MS // 1000,
+        write_audio_end: Union[Callable[[], Awaitable[None]], None] = None,
+    ):
+        self.write_text = write_text
+        self.write_audio = write_audio
+        self.write_audio_end = write_audio_end
+        self.max_items = max_items
+        self.max_audio_bytes = max_audio_bytes
+        self.items: deque[Outbound] = deque()
+        self.audio_bytes = 0
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.writer: Union[asyncio.Task, None] = None
+        self.closed = False
+        self.dropping = False
+
+        # metrics
+        self.sent = 0
+        self.max_depth = 0
+        self.compacted = 0
+        self.waits = 0
+        self.dropped_audio = 0
+        self.dropped_audio_bytes = 0
+
+    def start(self):
+        if self.writer is None and not self.closed:
+            self.writer = asyncio.create_task(self.run())
+
+    def append(self, item: Outbound):
+        self.items.append(item)
+        self.max_depth = max(self.max_depth, len(self.items))
+        self.ready.set()
+
+    async def put_text(self, text: str):
+        self.start()
+        while len(self.items) >= self.max_items and not self.closed:
+            # squeeze audio before making the caller wait
+            if self.compact() or self.drop_audio():
+                continue
+            self.waits += 1
+            self.space.clear()
+            await self.space.wait()
+
+        if not self.closed:
+            self.append(Outbound("text", text))
+
+    def put_audio(self, audio: bytes):
+        self.start()
+        if self.closed:
+            return
+
+        self.append(Outbound("audio", audio))
+        self.audio_bytes += len(audio)
+        while self.audio_bytes > self.max_audio_bytes and self.drop_audio():
+            pass
+        if len(self.items) > self.max_items:
+            self.compact() or self.drop_audio()
+
+    def put_audio_end(self):
+        self.start()
+        if not self.closed and self.write_audio_end is not None:
+            self.append(Outbound("audio_end", b""))
+
+    def compact(self) -> bool:
+        # merge runs of queued audio into single frames
+        items: deque[Outbound] = deque()
+        for item in self.items:
+            if item.kind == "audio" and items and items[-1].kind == "audio":
+                items[-1] = Outbound("audio", items[-1].data + item.data)  # type: ignore
+            else:
+                items.append(item)
+
+        if len(items) == len(self.items):
+            return False
+        self.compacted += len(self.items) - len(items)
+        self.items = items
+        return True
+
+    def drop_audio(self) -> bool:
+        # oldest first, it is the furthest behind
+        for i, item in enumerate(self.items):
+            if item.kind == "audio":
+                del self.items[i]
+                self.audio_bytes -= len(item.data)
+                self.dropped_audio += 1
+                self.dropped_audio_bytes += len(item.data)
+                if not self.dropping:
+                    self.dropping = True
+                    print(f"Client is falling behind, dropping audio {self.metrics()}")
+                return True
+        return False
+
+    def clear_audio(self):
+        self.items = deque(item for item in self.items if item.kind == "text")
+        self.audio_bytes = 0
+        self.space.set()
+
+    async def run(self):
+        try:
+            while True:
+                if len(self.items) == 0:
+                    if self.closed:
+                        return
+                    self.dropping = False
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+
+                item = self.items.popleft()
+                self.space.set()
+                if item.kind == "audio":
+                    self.audio_bytes -= len(item.data)
+                    await self.write_audio(item.data)  # type: ignore
+                elif item.kind == "audio_end":
+                    await self.write_audio_end()  # type: ignore
+                else:
+                    await self.write_text(item.data)  # type: ignore
+                self.sent += 1
+        except Exception as e:
+            # the client went away, the receive loop will notice
+            print(f"Error sending to client: {e}")
+        finally:
+            self.closed = True
+            self.items.clear()
+            self.audio_bytes = 0
+            self.space.set()
+
+    async def close(self, timeout: float = SEND_QUEUE_DRAIN_SECONDS):
+        """
+        Stop accepting updates and give the writer ``timeout`` seconds to
+        send what is already queued.
+        """
+        self.closed = True
+        self.ready.set()
+        self.space.set()
+        if self.writer is not None:
+            try:
+                await asyncio.wait_for(self.writer, timeout)
+            except TimeoutError:
+                pass
+
+    def stop(self):
+        # drop whatever is queued, the socket is already gone
+        self.closed = True
+        if self.writer is not None:
+            self.writer.cancel()
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "depth": len(self.items),
+            "max_depth": self.max_depth,
+            "audio_bytes": self.audio_bytes,
+            "sent": self.sent,
+            "compacted": self.compacted,
+            "waits": self.waits,
+            "dropped_audio": self.dropped_audio,
+            "dropped_audio_bytes": self.dropped_audio_bytes,
+        }
+
 
 class Connection:
-    def __init__(self, websocket: WebSocket):
+    def __init__(self, websocket: WebSocket, binary_audio: bool = False):
         self.websocket = websocket
+        self.binary_audio = binary_audio
+        self.outbound = SendQueue(
+            self.websocket.send_text,
+            self.write_audio,
+            write_audio_end=self.end_audio,
+        )
+        self.audio = AudioCoalescer(self.queue_audio)
+        self.codec = AudioCodec()
+        self.playback = Playback()
+        # called after each audio write, for turn latency
+        self.on_audio_written: Union[Callable[[], None], None] = None
+
+    def set_codec(self, codec: AudioCodec):
+        """
+        Use ``codec`` for audio exchanged with the client. Outbound audio is
+        framed and budgeted in the codec's upstream format.
+        """
+        self.codec = codec
+        self.audio.sample_rate = codec.upstream_rate
+        self.audio.sample_width = codec.upstream_width
+        self.playback = Playback(codec.upstream_rate, codec.upstream_width)
+        bytes_per_second = codec.upstream_rate * codec.upstream_width
+        self.outbound.max_audio_bytes = bytes_per_second * SEND_QUEUE_AUDIO_MS // 1000
 
     async def receive_json(self) -> dict:
         return await self.websocket.receive_json()
 
+    async def receive(self) -> Union[dict[str, Any], bytes]:
+        """
+        Receive the next client message, either a json control message or
+        a binary frame (only sent by clients using the audio subprotocol).
+        """
+        message = await self.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+
+        if message.get("bytes") is not None:
+            return message["bytes"]
+        return json.loads(message["text"])
+
     async def send_update(self, update: Update):
-        await self.websocket.send_json(asdict(update))
+        if update.type == "interrupt":
+            # the client drops queued playback on interrupt,
+            # so buffered audio would only arrive after it
+            self.audio.clear()
+            self.outbound.clear_audio()
+            self.codec.reset()
+        else:
+            # keep ordering with audio sent before this update
+            await self.audio.flush()
+
+        await self.outbound.put_text(update.to_json())
+
+    async def send_audio(self, id: str, audio: str):
+        """
+        Queue base64 encoded pcm16 audio from the realtime api for the
+        client. Deltas are coalesced into larger frames (see AudioCoalescer).
+        """
+        await self.audio.add(base64.b64decode(audio))
+
+    async def flush_audio(self):
+        """
+        End of the response's audio: send what is buffered, including the
+        codec's partial frame (padded). Other flushes keep that for the
+        next write, so silence isn't inserted mid response.
+        """
+        await self.audio.flush()
+        self.outbound.put_audio_end()
+
+    async def queue_audio(self, audio: bytes):
+        self.outbound.put_audio(audio)
+
+    async def write_audio(self, audio: bytes):
+        self.playback.write(len(audio))
+        await self.write_encoded(await self.codec.encode(audio))
+
+    async def end_audio(self):
+        await self.write_encoded(await self.codec.finish())
+
+    async def write_encoded(self, audio: bytes):
+        # a codec can hold back audio that doesn't fill a frame
+        if len(audio) == 0:
+            return
+
+        # binary frame when the client negotiated it, else an AudioUpdate
+        if self.binary_audio:
+            await self.websocket.send_bytes(encode_frame(AUDIO_FRAME, audio))
+        else:
+            update = Update.audio(id="audio", data=base64.b64encode(audio).decode())
+            await self.websocket.send_text(update.to_json())
+
+        if self.on_audio_written is not None:
+            self.on_audio_written()
 
     async def accept(self):
         await self.websocket.accept()
@@ -21,6 +441,8 @@ class Connection:
         return await self.websocket.receive_text()
 
     async def close(self):
+        self.audio.clear()
+        await self.outbound.close()
         if self.websocket.client_state == WebSocketState.CONNECTED:
             await self.websocket.close()
 
@@ -31,6 +453,9 @@ class Connection:
     def state(self) -> WebSocketState:
         return self.websocket.client_state
 
+    def metrics(self) -> dict[str, int]:
+        return self.outbound.metrics()
+
 
 # class for managing websocket connections by id
 class ConnectionManager:
@@ -42,10 +467,12 @@ class ConnectionManager:
         if id in self.active_connections:
             if self.active_connections[id].state == WebSocketState.CONNECTED:
                 await self.active_connections[id].close()
-            del self.active_connections[id]
+            self.remove(id)
 
-        await websocket.accept()
-        self.active_connections[id] = Connection(websocket)
+        # negotiate binary audio frames if the client asked for them
+        binary_audio = AUDIO_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+        await websocket.accept(subprotocol=AUDIO_SUBPROTOCOL if binary_audio else None)
+        self.active_connections[id] = Connection(websocket, binary_audio=binary_audio)
         return self.active_connections[id]
 
     async def send_update(self, id: str, update: Update):
@@ -68,8 +495,12 @@ class ConnectionManager:
             await self.active_connections[key].close()
             del self.active_connections[key]
 
+    def metrics(self) -> dict[str, dict[str, int]]:
+        return {id: c.metrics() for id, c in self.active_connections.items()}
+
     def remove(self, id: str):
         if id in self.active_connections:
+            self.active_connections[id].outbound.stop()
             del self.active_connections[id]
 
 
@@ -1,31 +1,43 @@
 import os
 import json
 import asyncio
+import contextlib
 from pathlib import Path
 from typing import Literal
-from openai import AsyncAzureOpenAI
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 
-from api.agent.storage import get_storage_client
+from api.agent.storage import storage_clients
 from api.connection import connections
 from api.model import Update
 from api.telemetry import init_tracing
-from api.voice.common import get_default_configuration_data
-from api.voice.session import RealtimeSession
+from api.voice.common import (
+    configuration_tools,
+    get_default_configuration,
+    render_configuration,
+)
+from api.voice.audio import LOCAL_VAD
+from api.voice.codecs import negotiate_codec, shutdown_audio_workers
+from api.voice.metrics import SetupTimer, turn_metrics
+from api.voice.pool import realtime_pool
+from api.voice.replay import open_recorder
+from api.voice.session import VOICE_SERVER_TOOLS, RealtimeSession, shared_session
+from api.voice.transcripts import transcripts
 from api.voice import router as voice_configuration_router
+from api.media import router as media_router
+from api.media.derivatives import shutdown_image_workers
 from api.agent import router as agent_router
 from api.agent.common import get_custom_agents, create_foundry_thread
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+from openai.resources.beta.realtime.realtime import AsyncRealtimeConnection
+from openai.types.beta.realtime.session_update_event import SessionUpdateEvent
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-AZURE_VOICE_ENDPOINT = os.getenv("AZURE_VOICE_ENDPOINT") or ""
-AZURE_VOICE_KEY = os.getenv("AZURE_VOICE_KEY", "fake_key")
 COSMOSDB_CONNECTION = os.getenv("COSMOSDB_CONNECTION", "fake_connection")
 SUSTINEO_STORAGE = os.environ.get("SUSTINEO_STORAGE", "EMPTY")
 LOCAL_TRACING_ENABLED = os.getenv("LOCAL_TRACING_ENABLED", "false").lower() == "true"
@@ -35,20 +47,38 @@ init_tracing(local_tracing=LOCAL_TRACING_ENABLED)
 base_path = Path(__file__).parent
 
 
+async def preconfigure_realtime(realtime: AsyncRealtimeConnection):
+    # formats, turn detection and tools don't depend on the user, so
+    # pooled sessions get them while they wait
+    configuration = await get_default_configuration()
+    tools = configuration_tools(configuration) if configuration is not None else []
+    await realtime.send(
+        SessionUpdateEvent(type="session.update", session=shared_session(tools))
+    )
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
         # Load agents from prompty files in directory
         await get_custom_agents()
+        realtime_pool.configure = preconfigure_realtime
+        realtime_pool.start()
         yield
     finally:
         await connections.clear()
+        await realtime_pool.close()
+        await transcripts.close()
+        await storage_clients.close()
+        shutdown_image_workers()
+        shutdown_audio_workers()
 
 
 app = FastAPI(lifespan=lifespan, redirect_slashes=False)
 
 app.include_router(voice_configuration_router, tags=["voice"])
 app.include_router(agent_router, tags=["agents"])
+app.include_router(media_router, tags=["media"])
 
 app.add_middleware(
     CORSMiddleware,
@@ -70,60 +100,70 @@ async def health(response: Response):
     return {"status": "ok"}
 
 
-@app.get("/")
-async def root():
-    return {"message": "Hello World"}
+@app.get("/api/voice/connections")
+async def voice_connections():
+    # outbound queue depth per client, to spot clients falling behind
+    return connections.metrics()
 
 
-@app.get("/images/{image_id}")
-async def get_image(image_id: str):
-    async with get_storage_client("sustineo") as container_client:
-        # get the blob client for the image
-        blob_client = container_client.get_blob_client(f"images/{image_id}")
+@app.get("/api/voice/pool")
+async def voice_pool():
+    return realtime_pool.metrics()
 
-        # check if the blob exists
-        if not await blob_client.exists():
-            return Response(status_code=404, content="Image not found")
 
-        # return bytes as png image
-        image_data = await blob_client.download_blob()
-        image_bytes = await image_data.readall()
-        return Response(content=image_bytes, media_type="image/png")
+@app.get("/api/voice/turns")
+async def voice_turns():
+    return turn_metrics.report()
 
 
-@app.get("/videos/{video_id}")
-async def get_video(video_id: str):
-    async with get_storage_client("sustineo") as container_client:
-        # get the blob client for the video
-        blob_client = container_client.get_blob_client(f"videos/{video_id}")
+@app.get("/")
+async def root():
+    return {"message": "Hello World"}
+
 
-        # check if the blob exists
-        if not await blob_client.exists():
-            return Response(status_code=404, content="Video not found")
+def log_setup_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print("Error setting up voice session", task.exception())
 
-        # return bytes as mp4 video
-        video_data = await blob_client.download_blob()
-        video_bytes = await video_data.readall()
-        return Response(content=video_bytes, media_type="video/mp4")
+
+async def cancel_setup_task(task: asyncio.Task):
+    # setup steps started ahead of time that the session never used
+    task.cancel()
+    await asyncio.wait([task])
+    if not task.cancelled():
+        task.exception()
 
 
 @app.websocket("/api/voice/{id}")
 async def voice_endpoint(id: str, websocket: WebSocket):
 
-    connection = await connections.connect(id, websocket)
+    timer = SetupTimer()
+    connection = await timer.time("accept", connections.connect(id, websocket))
+
+    # nothing below depends on the client's settings, so it runs
+    # while we wait for them. the foundry thread is created
+    # speculatively and only transcripts wait on it
+    configuration = asyncio.create_task(
+        timer.time("configuration", get_default_configuration())
+    )
+    thread = asyncio.create_task(timer.time("thread", create_foundry_thread()))
+    thread.add_done_callback(log_setup_error)
+    pending = [configuration, thread]
 
     try:
-        client = AsyncAzureOpenAI(
-            azure_endpoint=AZURE_VOICE_ENDPOINT,
-            api_key=AZURE_VOICE_KEY,
-            api_version="2025-04-01-preview",
-        )
-        async with client.beta.realtime.connect(
-            model="gpt-4o-realtime-preview", extra_query={"debug": "elvis"}
-        ) as realtime_client:
+        async with contextlib.AsyncExitStack() as stack:
+            # usually an already connected session from the pool
+            realtime = asyncio.create_task(
+                timer.time(
+                    "realtime_connect",
+                    stack.enter_async_context(realtime_pool.connection()),
+                )
+            )
+            # must not outlive the exit stack it registers with
+            stack.push_async_callback(cancel_setup_task, realtime)
 
             # get current username and receive any parameters
-            user_message = await connection.receive_json()
+            user_message = await timer.time("settings", connection.receive_json())
 
             if user_message["type"] != "settings":
                 await connection.send_update(
@@ -139,6 +179,22 @@ async def voice_endpoint(id: str, websocket: WebSocket):
 
             settings = user_message["settings"]
 
+            # outbound audio frame window requested by the client
+            if "audio_frame_ms" in settings:
+                connection.audio.frame_ms = max(0, int(settings["audio_frame_ms"]))
+
+            # audio format and rate the client wants to use
+            connection.set_codec(negotiate_codec(settings))
+            if any(k in settings for k in ("audio_format", "audio_formats", "sample_rate")):
+                await connection.send_update(
+                    Update.audio_settings(id=id, settings=connection.codec.settings())
+                )
+
+            # optional capture of the session for offline replay
+            recorder = open_recorder(id)
+            if recorder is not None:
+                recorder.record("client", settings)
+
             print(
                 "Starting voice session with settings:\n",
                 json.dumps(settings, indent=2),
@@ -153,8 +209,8 @@ async def voice_endpoint(id: str, websocket: WebSocket):
             if "time" in settings:
                 args["time"] = settings["time"]
 
-            prompt_settings = await get_default_configuration_data(**args)
-            if prompt_settings is None:
+            default_configuration = await configuration
+            if default_configuration is None:
                 await connection.send_update(
                     Update.exception(
                         id=id,
@@ -165,13 +221,24 @@ async def voice_endpoint(id: str, websocket: WebSocket):
                 await connection.close()
                 return
 
-            # create a new thread in the foundry
-            thread_id = await create_foundry_thread()
+            prompt_settings = await timer.time(
+                "render", render_configuration(default_configuration, **args)
+            )
 
+            realtime_client = await realtime
+
+            # the thread now belongs to the session's transcripts
+            pending.remove(thread)
             session = RealtimeSession(
                 realtime=realtime_client,
                 client=connection,
-                thread_id=thread_id,
+                thread_id=thread,
+                recorder=recorder,
+                server_tools=(
+                    bool(settings["server_tools"])
+                    if "server_tools" in settings
+                    else VOICE_SERVER_TOOLS
+                ),
             )
 
             detection_type: Literal["semantic_vad", "server_vad"] = (
@@ -184,30 +251,41 @@ async def voice_endpoint(id: str, websocket: WebSocket):
                 settings["eagerness"] if "eagerness" in settings else "auto"
             )
 
-            await session.update_realtime_session(
-                instructions=prompt_settings.system_message,
-                detection_type=detection_type,
-                transcription_model=(
-                    settings["transcription_model"]
-                    if "transcription_model" in settings
-                    else "whisper-1"
-                ),
-                threshold=settings["threshold"] if "threshold" in settings else 0.8,
-                silence_duration_ms=(
-                    settings["silence_duration"]
-                    if "silence_duration_ms" in settings
-                    else 500
+            await timer.time(
+                "session_update",
+                session.update_realtime_session(
+                    instructions=prompt_settings.system_message,
+                    detection_type=detection_type,
+                    transcription_model=(
+                        settings["transcription_model"]
+                        if "transcription_model" in settings
+                        else "whisper-1"
+                    ),
+                    threshold=settings["threshold"] if "threshold" in settings else 0.8,
+                    silence_duration_ms=(
+                        settings["silence_duration"]
+                        if "silence_duration_ms" in settings
+                        else 500
+                    ),
+                    prefix_padding_ms=(
+                        settings["prefix_padding"]
+                        if "prefix_padding_ms" in settings
+                        else 300
+                    ),
+                    eagerness=eagerness,
+                    voice=settings["voice"] if "voice" in settings else "sage",
+                    configuration=default_configuration.name,
+                    tools=prompt_settings.tools,
+                    local_vad=(
+                        bool(settings["local_vad"])
+                        if "local_vad" in settings
+                        else LOCAL_VAD
+                    ),
                 ),
-                prefix_padding_ms=(
-                    settings["prefix_padding"]
-                    if "prefix_padding_ms" in settings
-                    else 300
-                ),
-                eagerness=eagerness,
-                voice=settings["voice"] if "voice" in settings else "sage",
-                tools=prompt_settings.tools,
             )
 
+            print(f"Voice session {id} ready: {timer}")
+
             tasks = [
                 asyncio.create_task(session.receive_realtime()),
                 asyncio.create_task(session.receive_client()),
@@ -217,6 +295,9 @@ async def voice_endpoint(id: str, websocket: WebSocket):
     except WebSocketDisconnect as e:
         connections.remove(id)
         print("Voice Socket Disconnected", e)
+    finally:
+        for task in pending:
+            await cancel_setup_task(task)
 
 
 FastAPIInstrumentor.instrument_app(app, exclude_spans=["send", "receive"])
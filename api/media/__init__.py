@@ -0,0 +1,80 @@
+from typing import Optional
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import RedirectResponse
+
+from api.agent.storage import MEDIA_DELIVERY, SUSTINEO_CONTAINER, signed_urls
+
+from api.media.common import read_blob, stream_blob
+from api.media.derivatives import get_image_variant, negotiate_variant
+from api.media.cache import (
+    IMMUTABLE_CACHE_CONTROL,
+    etag_matches,
+    image_cache,
+    make_etag,
+)
+
+
+router = APIRouter(
+    tags=["media"],
+    responses={404: {"description": "Not found"}},
+    dependencies=[],
+)
+
+
+async def redirect_to_storage(blob_name: str) -> Response:
+    # media bytes go straight from storage to the client
+    url = await signed_urls.get_url(SUSTINEO_CONTAINER, blob_name)
+    return RedirectResponse(
+        url, status_code=307, headers={"Cache-Control": "private, max-age=60"}
+    )
+
+
+@router.get("/images/{image_id}")
+async def get_image(
+    image_id: str,
+    request: Request,
+    width: Optional[int] = None,
+    quality: Optional[int] = None,
+):
+    blob_name = f"images/{image_id}"
+
+    # resize and/or re-encode (webp, avif) based on the query and Accept header
+    variant = negotiate_variant(width, quality, request.headers.get("accept"))
+    if variant is None and MEDIA_DELIVERY == "redirect":
+        return await redirect_to_storage(blob_name)
+    key = variant.key(blob_name) if variant is not None else blob_name
+    headers = {
+        "ETag": make_etag(key),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Vary": "Accept",
+    }
+
+    # images never change, a matching tag needs no storage access at all
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if variant is None:
+        image_bytes = await image_cache.get(blob_name, lambda: read_blob(blob_name))
+        media_type = "image/png"
+    else:
+        image_bytes = await get_image_variant(image_cache, blob_name, variant)
+        media_type = variant.media_type
+
+    if image_bytes is None:
+        return Response(status_code=404, content="Image not found")
+
+    return Response(content=image_bytes, media_type=media_type, headers=headers)
+
+
+@router.get("/videos/{video_id}")
+async def get_video(video_id: str, request: Request):
+    if MEDIA_DELIVERY == "redirect":
+        return await redirect_to_storage(f"videos/{video_id}")
+
+    # stream the mp4 in chunks, supporting range requests for seeking
+    return await stream_blob(
+        f"videos/{video_id}",
+        media_type="video/mp4",
+        request=request,
+        not_found="Video not found",
+    )
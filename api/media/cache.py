@@ -0,0 +1,170 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+import aiofiles
+import aiofiles.os
+from pathlib import Path
+from collections import OrderedDict
+from typing import Awaitable, Callable, Union
+
+
+MEDIA_CACHE_DIR = os.environ.get(
+    "SUSTINEO_CACHE_DIR", str(Path(tempfile.gettempdir()) / "sustineo-cache")
+)
+MEDIA_CACHE_MEMORY_MB = int(os.environ.get("SUSTINEO_CACHE_MEMORY_MB", "64"))
+MEDIA_CACHE_DISK_MB = int(os.environ.get("SUSTINEO_CACHE_DISK_MB", "512"))
+
+# generated media is written once under a unique name and never changed
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def make_etag(key: str) -> str:
+    # blobs behind a key never change, so the key identifies the bytes
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Union[str, None], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+class MediaCache:
+    """
+    Two tier cache for immutable media: a bounded LRU of bytes in memory in
+    front of a size-capped directory on local disk. Concurrent misses for
+    the same key share a single load.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path] = MEDIA_CACHE_DIR,
+        memory_limit: int = MEDIA_CACHE_MEMORY_MB * 1024 * 1024,
+        disk_limit: int = MEDIA_CACHE_DISK_MB * 1024 * 1024,
+    ):
+        self.directory = Path(directory)
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.memory: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_size = 0
+        self.disk: Union[OrderedDict[str, int], None] = None
+        self.disk_size = 0
+        self.pending: dict[str, asyncio.Task[Union[bytes, None]]] = {}
+
+    async def get(
+        self, key: str, loader: Callable[[], Awaitable[Union[bytes, None]]]
+    ) -> Union[bytes, None]:
+        """
+        Return the cached bytes for ``key``, calling ``loader`` on a miss.
+        ``None`` from the loader (e.g. a missing blob) is not cached.
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        if key not in self.pending:
+            task = asyncio.create_task(self.load(key, loader))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+
+        # shielded so a disconnecting client doesn't cancel everyone's load
+        return await asyncio.shield(self.pending[key])
+
+    async def load(
+        self, key: str, loader: Callable[[], Awaitable[Union[bytes, None]]]
+    ) -> Union[bytes, None]:
+        data = await self.read_disk(key)
+        if data is None:
+            data = await loader()
+            if data is None:
+                return None
+            await self.write_disk(key, data)
+
+        self.put_memory(key, data)
+        return data
+
+    def put_memory(self, key: str, data: bytes):
+        # don't let a single large item flush the whole tier
+        if len(data) > self.memory_limit // 8:
+            return
+
+        if key in self.memory:
+            self.memory_size -= len(self.memory.pop(key))
+
+        self.memory[key] = data
+        self.memory_size += len(data)
+        while self.memory_size > self.memory_limit and self.memory:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_size -= len(evicted)
+
+    def path(self, key: str) -> Path:
+        return self.directory / hashlib.sha256(key.encode()).hexdigest()
+
+    async def load_disk_index(self) -> OrderedDict[str, int]:
+        if self.disk is None:
+            await aiofiles.os.makedirs(self.directory, exist_ok=True)
+
+            # rebuild the index from what a previous process left behind,
+            # oldest first so it is evicted first
+            files = [
+                (entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                for entry in os.scandir(self.directory)
+                if entry.is_file() and not entry.name.endswith(".tmp")
+            ]
+            self.disk = OrderedDict(
+                (name, size) for _, name, size in sorted(files)
+            )
+            self.disk_size = sum(self.disk.values())
+
+        return self.disk
+
+    async def read_disk(self, key: str) -> Union[bytes, None]:
+        disk = await self.load_disk_index()
+        path = self.path(key)
+        if path.name not in disk:
+            return None
+
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = await f.read()
+        except FileNotFoundError:
+            self.disk_size -= disk.pop(path.name, 0)
+            return None
+
+        disk.move_to_end(path.name)
+        return data
+
+    async def write_disk(self, key: str, data: bytes):
+        if len(data) > self.disk_limit:
+            return
+
+        disk = await self.load_disk_index()
+        path = self.path(key)
+        temp = path.with_suffix(".tmp")
+        try:
+            async with aiofiles.open(temp, "wb") as f:
+                await f.write(data)
+            await aiofiles.os.replace(temp, path)
+        except OSError as e:
+            # the disk tier is best effort
+            print(f"Error writing media cache {path}: {e}")
+            return
+
+        self.disk_size -= disk.pop(path.name, 0)
+        disk[path.name] = len(data)
+        self.disk_size += len(data)
+
+        while self.disk_size > self.disk_limit and disk:
+            name, size = disk.popitem(last=False)
+            self.disk_size -= size
+            try:
+                await aiofiles.os.remove(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+
+image_cache = MediaCache()
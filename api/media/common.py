@@ -0,0 +1,182 @@
+import re
+from typing import AsyncGenerator, Union
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+from azure.storage.blob.aio import ContainerClient, StorageStreamDownloader
+
+from api.agent.storage import get_storage_client, SUSTINEO_CONTAINER
+
+
+RANGE_PATTERN = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def parse_range(header: Union[str, None]) -> Union[tuple[int, int | None], None]:
+    """
+    Parse a single byte range from a ``Range`` header.
+
+    Returns ``(start, end)`` with an inclusive (or open, ``None``) end, or
+    ``(-suffix, None)`` for suffix ranges such as ``bytes=-500``. Multiple
+    ranges and malformed headers return ``None`` so the caller can fall back
+    to sending the whole blob, which RFC 9110 allows.
+    """
+    if header is None:
+        return None
+
+    match = RANGE_PATTERN.match(header)
+    if match is None:
+        return None
+
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+
+    if first == "":
+        # suffix range - the last n bytes of the blob
+        suffix = int(last)
+        return (-suffix, None) if suffix > 0 else None
+
+    start = int(first)
+    end = int(last) if last != "" else None
+    if end is not None and end < start:
+        return None
+
+    return start, end
+
+
+def parse_total_size(content_range: Union[str, None]) -> Union[int, None]:
+    # content range is reported as "bytes start-end/total"
+    if content_range is None or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def is_strong_etag(value: str) -> bool:
+    return value.startswith('"') and value.endswith('"')
+
+
+async def read_blob(blob_name: str) -> Union[bytes, None]:
+    async with get_storage_client(SUSTINEO_CONTAINER) as container_client:
+        blob_client = container_client.get_blob_client(blob_name)
+        try:
+            downloader = await blob_client.download_blob()
+        except ResourceNotFoundError:
+            return None
+        return await downloader.readall()
+
+
+async def open_blob_download(
+    container_client: ContainerClient,
+    blob_name: str,
+    byte_range: Union[tuple[int, int | None], None],
+    if_range: Union[str, None] = None,
+) -> tuple[StorageStreamDownloader, Union[tuple[int, int | None], None]]:
+    """
+    Start a (possibly ranged) blob download. Returns the downloader and the
+    range that was actually applied, which is ``None`` when the ``If-Range``
+    validator no longer matches and the full blob is sent instead.
+    """
+    blob_client = container_client.get_blob_client(blob_name)
+
+    if byte_range is not None and byte_range[0] < 0:
+        # suffix ranges need the blob size to resolve an offset
+        properties = await blob_client.get_blob_properties()
+        byte_range = (max(properties.size + byte_range[0], 0), None)
+
+    if byte_range is None:
+        return await blob_client.download_blob(), None
+
+    start, end = byte_range
+    length = end - start + 1 if end is not None else None
+
+    # If-Range only honours strong entity tags, anything else means "send everything"
+    if if_range is not None and not is_strong_etag(if_range):
+        return await blob_client.download_blob(), None
+
+    try:
+        downloader = await blob_client.download_blob(
+            offset=start,
+            length=length,
+            etag=if_range,
+            match_condition=(
+                MatchConditions.IfNotModified if if_range is not None else None
+            ),
+        )
+        return downloader, byte_range
+    except ResourceModifiedError:
+        # the blob changed since the client cached its copy
+        return await blob_client.download_blob(), None
+
+
+async def stream_blob(
+    blob_name: str,
+    media_type: str,
+    request: Request,
+    not_found: str = "Not found",
+) -> Response:
+    """
+    Stream a blob to the client in storage-sized chunks, honouring ``Range``
+    and ``If-Range`` so players can seek without the whole file being held
+    in memory.
+    """
+    byte_range = parse_range(request.headers.get("range"))
+    if_range = request.headers.get("if-range")
+
+    async with get_storage_client(SUSTINEO_CONTAINER) as container_client:
+        try:
+            downloader, byte_range = await open_blob_download(
+                container_client, blob_name, byte_range, if_range
+            )
+        except ResourceNotFoundError:
+            return Response(status_code=404, content=not_found)
+        except HttpResponseError as e:
+            if e.status_code != 416:
+                raise
+
+            # requested range starts beyond the end of the blob
+            blob_client = container_client.get_blob_client(blob_name)
+            properties = await blob_client.get_blob_properties()
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{properties.size}"},
+            )
+
+    properties = downloader.properties
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(downloader.size),
+    }
+    if properties.etag:
+        headers["ETag"] = properties.etag
+    if properties.last_modified:
+        headers["Last-Modified"] = properties.last_modified.strftime(
+            "%a, %d %b %Y %H:%M:%S GMT"
+        )
+
+    status_code = 200
+    if byte_range is not None:
+        status_code = 206
+        start = byte_range[0]
+        total = parse_total_size(properties.content_range)
+        headers["Content-Range"] = (
+            f"bytes {start}-{start + downloader.size - 1}/{total}"
+        )
+
+    async def content() -> AsyncGenerator[bytes, None]:
+        # the pooled storage client outlives the request,
+        # so chunks can be pulled after the handler returns
+        async for chunk in downloader.chunks():
+            yield chunk
+
+    return StreamingResponse(
+        content(),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type,
+    )
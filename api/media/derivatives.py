@@ -0,0 +1,168 @@
+import io
+import os
+import asyncio
+from dataclasses import dataclass
+from typing import Literal, Union
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, features
+
+from api.media.cache import MediaCache
+from api.media.common import read_blob
+
+
+# widths are snapped to a small set so the number of variants per image
+# (and therefore cache entries) stays bounded
+IMAGE_WIDTHS = [128, 256, 384, 512, 640, 800, 1024, 1280, 1600, 2048]
+DEFAULT_QUALITY = 80
+
+# Pillow releases the GIL while resampling and encoding,
+# so a thread pool keeps this work off the event loop
+IMAGE_WORKERS = int(os.environ.get("SUSTINEO_IMAGE_WORKERS", os.cpu_count() or 4))
+
+ImageFormat = Literal["png", "webp", "avif"]
+
+MEDIA_TYPES: dict[str, str] = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+SUPPORTED_FORMATS: list[ImageFormat] = [
+    f for f in ("avif", "webp") if features.check(f)  # type: ignore
+]
+
+_executor: Union[ThreadPoolExecutor, None] = None
+
+
+@dataclass(frozen=True)
+class ImageVariant:
+    width: Union[int, None]
+    quality: int
+    format: ImageFormat
+
+    @property
+    def media_type(self) -> str:
+        return MEDIA_TYPES[self.format]
+
+    def key(self, blob_name: str) -> str:
+        return f"{blob_name}?w={self.width or ''}&q={self.quality}&f={self.format}"
+
+
+def snap_width(width: int) -> int:
+    for size in IMAGE_WIDTHS:
+        if width <= size:
+            return size
+    return IMAGE_WIDTHS[-1]
+
+
+def accepted_formats(accept: Union[str, None]) -> set[str]:
+    # only explicit image types count, */* keeps the original format
+    formats: set[str] = set()
+    for item in (accept or "").split(","):
+        media_type, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+
+        media_type = media_type.strip()
+        if weight > 0 and media_type.startswith("image/"):
+            formats.add(media_type.removeprefix("image/"))
+    return formats
+
+
+def negotiate_variant(
+    width: Union[int, None],
+    quality: Union[int, None],
+    accept: Union[str, None],
+) -> Union[ImageVariant, None]:
+    """
+    Pick the image variant to serve for the requested width, quality and
+    ``Accept`` header. Returns ``None`` when the original should be sent
+    untouched.
+    """
+    accepted = accepted_formats(accept)
+    format: ImageFormat = next(
+        (f for f in SUPPORTED_FORMATS if f in accepted), "png"
+    )
+
+    if width is None and format == "png":
+        return None
+
+    return ImageVariant(
+        width=snap_width(width) if width is not None and width > 0 else None,
+        quality=max(10, min(100, round((quality or DEFAULT_QUALITY) / 5) * 5)),
+        format=format,
+    )
+
+
+def render_variant(data: bytes, variant: ImageVariant) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        # the with block closes the decoded original, not what's rendered
+        output_image: Image.Image = image
+        if variant.width is not None and image.width > variant.width:
+            height = max(1, round(image.height * variant.width / image.width))
+            output_image = image.resize(
+                (variant.width, height), Image.Resampling.LANCZOS
+            )
+
+        mode = output_image.mode
+        if mode not in ("RGB", "RGBA"):
+            transparent = "transparency" in output_image.info or mode in ("LA", "PA")
+            output_image = output_image.convert("RGBA" if transparent else "RGB")
+
+        output = io.BytesIO()
+        match variant.format:
+            case "avif":
+                output_image.save(
+                    output, format="AVIF", quality=variant.quality, speed=8
+                )
+            case "webp":
+                output_image.save(
+                    output, format="WEBP", quality=variant.quality, method=4
+                )
+            case _:
+                output_image.save(output, format="PNG", optimize=False)
+        return output.getvalue()
+
+
+def get_image_workers() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=IMAGE_WORKERS, thread_name_prefix="image-derivative"
+        )
+    return _executor
+
+
+def shutdown_image_workers():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def get_image_variant(
+    cache: MediaCache, blob_name: str, variant: ImageVariant
+) -> Union[bytes, None]:
+    """
+    Return the bytes of an image variant, rendering it from the (cached)
+    original on a miss. Variants are cached next to the originals.
+    """
+
+    async def render() -> Union[bytes, None]:
+        original = await cache.get(blob_name, lambda: read_blob(blob_name))
+        if original is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_image_workers(), render_variant, original, variant
+        )
+
+    return await cache.get(variant.key(blob_name), render)
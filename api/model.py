@@ -1,8 +1,29 @@
 import json
-from typing import Any, Callable, Coroutine, Literal, Optional, Protocol
+import dataclasses
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Coroutine,
+    Literal,
+    Optional,
+    Protocol,
+    TypeVar,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+from types import UnionType
 from dataclasses import dataclass, field
 from openai.types.beta.realtime.session_update_event import SessionTool
 
+try:
+    # optional fast path for serializing updates
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
 
 #### Configuration ####
 # This is a configuration class for the agent system.
@@ -53,15 +74,74 @@ class Function:
 
 
 #### Updates ####
+T = TypeVar("T")
+
+
+def _has_dataclass(annotation: Any) -> bool:
+    if dataclasses.is_dataclass(annotation):
+        return True
+    return any(_has_dataclass(arg) for arg in get_args(annotation))
+
+
+def _optional_dataclass(annotation: Any) -> bool:
+    # a serializable dataclass, or Optional of one
+    if get_origin(annotation) in (Union, UnionType):
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) != 1:
+            return False
+        annotation = args[0]
+    return dataclasses.is_dataclass(annotation) and hasattr(annotation, "to_dict")
+
+
+def _encode(value: Any) -> Any:
+    # dataclasses inside containers, converted the way asdict does
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        to_dict = getattr(value, "to_dict", None)
+        return to_dict() if to_dict is not None else dataclasses.asdict(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_encode(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def serializable(cls: type[T]) -> type[T]:
+    """
+    Compile a ``to_dict`` encoder for a dataclass once, when the class is
+    defined. The generated function reads each field directly instead of
+    walking (and deep-copying) the instance the way ``asdict`` does.
+    """
+    hints = get_type_hints(cls)
+    items = []
+    for f in dataclasses.fields(cls):  # type: ignore
+        if _optional_dataclass(hints[f.name]):
+            value = f"None if o.{f.name} is None else o.{f.name}.to_dict()"
+        elif _has_dataclass(hints[f.name]):
+            value = f"_encode(o.{f.name})"
+        else:
+            value = f"o.{f.name}"
+        items.append(f"{f.name!r}: {value}")
+
+    namespace: dict[str, Any] = {"_encode": _encode}
+    exec(f"def to_dict(o):\n    return {{{', '.join(items)}}}", namespace)
+    setattr(cls, "to_dict", namespace["to_dict"])
+    return cls
+
+
 # This is a class agent return content.
-@dataclass
+@serializable
+@dataclass(slots=True)
 class Content:
     type: Literal["text", "image", "video", "tool_calls"]
     content: list[dict[str, Any]]
 
+    # generated by serializable
+    to_dict: ClassVar[Callable[[Any], dict[str, Any]]]
+
 
 # This is a class representing an update in the system.
-@dataclass
+@serializable
+@dataclass(slots=True)
 class Update:
     id: str
     type: Literal[
@@ -76,6 +156,18 @@ class Update:
         "error",
     ]
 
+    # generated by serializable
+    to_dict: ClassVar[Callable[[Any], dict[str, Any]]]
+
+    def to_json(self) -> str:
+        if orjson is not None:
+            try:
+                return orjson.dumps(self).decode()
+            except TypeError:
+                # e.g. payload values orjson can't encode
+                pass
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
     @staticmethod
     def from_json(data: str) -> "Update":
         d = json.loads(data)
@@ -129,6 +221,10 @@ class Update:
     def console(id: str, payload: dict[str, Any]) -> "Update":
         return ConsoleUpdate(id=id, type="console", payload=payload)
 
+    @staticmethod
+    def audio_settings(id: str, settings: dict[str, Any]) -> "Update":
+        return SettingsUpdate(id=id, type="settings", settings=settings)
+
     @staticmethod
     def exception(id: str, error: str, content: str) -> "Update":
         return ErrorUpdate(id=id, type="error", error=error, content=content)
@@ -155,7 +251,8 @@ class Update:
         )
 
 
-@dataclass
+@serializable
+@dataclass(slots=True)
 class ConsoleUpdate(Update):
     payload: dict[str, Any]
 
@@ -164,7 +261,8 @@ class ConsoleUpdate(Update):
 
 
 # This is a class representing a message update in the system.
-@dataclass
+@serializable
+@dataclass(slots=True)
 class MessageUpdate(Update):
     role: Literal["user", "assistant"]
     content: str
@@ -174,7 +272,8 @@ class MessageUpdate(Update):
 
 
 # This is a class representing a function update in the system.
-@dataclass
+@serializable
+@dataclass(slots=True)
 class FunctionUpdate(Update):
     call_id: str
     name: str
@@ -184,7 +283,8 @@ class FunctionUpdate(Update):
         self.type = "function"
 
 
-@dataclass
+@serializable
+@dataclass(slots=True)
 class FunctionCompletionUpdate(Update):
     call_id: str
     output: str
@@ -193,7 +293,8 @@ class FunctionCompletionUpdate(Update):
         self.type = "function_completion"
 
 
-@dataclass
+@serializable
+@dataclass(slots=True)
 class AudioUpdate(Update):
     content: str
 
@@ -201,7 +302,8 @@ class AudioUpdate(Update):
         self.type = "audio"
 
 
-@dataclass
+@serializable
+@dataclass(slots=True)
 class SettingsUpdate(Update):
     settings: dict[str, Any]
 
@@ -209,7 +311,8 @@ class SettingsUpdate(Update):
         self.type = "settings"
 
 
-@dataclass
+@serializable
+@dataclass(slots=True)
 class ErrorUpdate(Update):
     error: str
     content: str
@@ -219,7 +322,8 @@ class ErrorUpdate(Update):
 
 
 # This is a class representing an agent update in the system.
-@dataclass
+@serializable
+@dataclass(slots=True)
 class AgentUpdate(Update):
     call_id: str
     name: str
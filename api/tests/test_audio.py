@@ -0,0 +1,118 @@
+"""
+Unit tests for input audio processing.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from api.voice.audio import EnergyGate, InputAudioBuffer, trailing_silence_ms
+
+RATE = 24000
+FRAME = RATE * 20 // 1000 * 2  # 20ms of pcm16
+
+
+def silence(ms: int) -> bytes:
+    return bytes(RATE * ms // 1000 * 2)
+
+
+def tone(ms: int, amplitude: int = 8000) -> bytes:
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype("<i2").tobytes()
+
+
+class TestEnergyGate:
+
+    @pytest.fixture
+    def gate(self):
+        return EnergyGate(trailing_ms=100, padding_ms=60)
+
+    def test_drops_silence(self, gate):
+        assert gate.process(silence(1000)) == b""
+        assert gate.metrics() == {"received_bytes": len(silence(1000)), "sent_bytes": 0}
+
+    def test_speech_with_padding_and_trailing_silence(self, gate):
+        speech = tone(200)
+        gate.process(silence(500))
+        output = gate.process(speech + silence(500))
+
+        # 60ms of leading silence, the speech, then 100ms of trailing silence
+        assert output == silence(60) + speech + silence(100)
+        assert gate.process(silence(500)) == b""
+
+    def test_low_noise_is_silence(self, gate):
+        assert gate.process(tone(200, amplitude=50)) == b""
+
+    def test_partial_frames_carry_over(self, gate):
+        speech = tone(100)
+        output = b""
+        for i in range(0, len(speech), 1000):
+            output += gate.process(speech[i : i + 1000])
+
+        # whole frames only, the rest waits for more audio
+        assert output == speech[: len(speech) - len(speech) % FRAME]
+
+    def test_trailing_silence_covers_turn_detection(self):
+        assert trailing_silence_ms("server_vad", silence_duration_ms=500) >= 500
+        assert trailing_silence_ms("semantic_vad", eagerness="low") == 8000
+        assert trailing_silence_ms("semantic_vad", eagerness="high") == 2000
+
+
+class TestInputAudioBuffer:
+
+    @pytest.fixture
+    def sent(self):
+        return []
+
+    @pytest.fixture
+    def gate(self):
+        # closed gate = an upstream socket that isn't taking writes
+        gate = asyncio.Event()
+        gate.set()
+        return gate
+
+    @pytest.fixture
+    def buffer(self, sent, gate):
+        async def send(audio: bytes):
+            await gate.wait()
+            sent.append(audio)
+
+        # 20ms chunks = 960 bytes
+        buffer = InputAudioBuffer(send, chunk_ms=20, max_chunks=2, max_buffer_ms=100)
+        yield buffer
+        buffer.close()
+
+    @pytest.mark.asyncio
+    async def test_aggregates_small_chunks(self, buffer, sent):
+        for _ in range(10):
+            buffer.add(bytes(200))
+        await asyncio.sleep(0)
+
+        assert [len(s) for s in sent] == [960, 960]
+        # the rest goes out once it is a chunk window old
+        await asyncio.sleep(0.05)
+        assert [len(s) for s in sent] == [960, 960, 80]
+
+    @pytest.mark.asyncio
+    async def test_splits_large_chunks(self, buffer, sent):
+        buffer.add(bytes(960 * 2 + 100))
+        await asyncio.sleep(0.05)
+        assert [len(s) for s in sent] == [960, 960, 100]
+
+    @pytest.mark.asyncio
+    async def test_slow_upstream_does_not_block_client(self, buffer, sent, gate):
+        gate.clear()
+        # add() never waits; past the queue audio collects in the buffer
+        for _ in range(20):
+            buffer.add(bytes(480))
+
+        metrics = buffer.metrics()
+        assert metrics["queued"] == 2
+        assert len(buffer.buffer) <= 4800
+        assert metrics["dropped_bytes"] > 0
+
+        gate.set()
+        await asyncio.sleep(0.1)
+        assert sum(len(s) for s in sent) + metrics["dropped_bytes"] == 20 * 480
+        assert buffer.metrics()["queued"] == 0
@@ -0,0 +1,193 @@
+"""
+Unit tests for client audio codec negotiation and resampling.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from api.connection import AudioCoalescer
+from api.voice.audio import InputAudioBuffer
+from api.voice.codecs import (
+    AudioCodec,
+    G711Codec,
+    OpusCodec,
+    Resampler,
+    ResamplingCodec,
+    negotiate_codec,
+    opuslib,
+    pack_packets,
+    unpack_packets,
+)
+
+
+def tone(rate: int, ms: int, amplitude: int = 8000) -> np.ndarray:
+    t = np.arange(rate * ms // 1000) / rate
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype("<i2")
+
+
+class TestResampler:
+
+    @pytest.mark.parametrize(
+        "from_rate,to_rate",
+        [(16000, 24000), (24000, 16000), (48000, 24000), (24000, 44100)],
+    )
+    def test_length_ratio(self, from_rate, to_rate):
+        resampler = Resampler(from_rate, to_rate)
+        output = resampler.process(tone(from_rate, 1000).tobytes())
+
+        assert abs(len(output) // 2 - to_rate) <= 1
+
+    def test_chunks_match_one_pass(self):
+        audio = tone(16000, 500).tobytes()
+        whole = Resampler(16000, 24000).process(audio)
+
+        resampler = Resampler(16000, 24000)
+        # odd sized chunks, including ones shorter than one output step
+        sizes = [2, 6, 318, 2, 1000, 4]
+        chunks: list[bytes] = []
+        position = 0
+        while position < len(audio):
+            size = sizes[len(chunks) % len(sizes)]
+            chunks.append(resampler.process(audio[position : position + size]))
+            position += size
+
+        assert b"".join(chunks) == whole
+
+    def test_round_trip(self):
+        original = tone(24000, 200)
+        down = Resampler(24000, 16000).process(original.tobytes())
+        up = np.frombuffer(Resampler(16000, 24000).process(down), dtype="<i2")
+
+        n = min(len(up), len(original))
+        # linear interpolation of a 440Hz tone stays close
+        assert np.max(np.abs(up[:n].astype(int) - original[:n])) < 200
+
+
+class TestNegotiateCodec:
+
+    def test_default(self):
+        codec = negotiate_codec({})
+
+        assert type(codec) is AudioCodec
+        assert codec.settings() == {"audio_format": "pcm16", "sample_rate": 24000}
+
+    def test_resampling(self):
+        codec = negotiate_codec({"audio_format": "pcm16", "sample_rate": 16000})
+
+        assert isinstance(codec, ResamplingCodec)
+        assert codec.upstream_format == "pcm16"
+        assert codec.settings()["sample_rate"] == 16000
+
+    def test_unsupported_rate_falls_back(self):
+        codec = negotiate_codec({"sample_rate": 1000})
+
+        assert type(codec) is AudioCodec
+
+    def test_g711_passthrough(self):
+        codec = negotiate_codec({"audio_formats": ["g711_ulaw", "pcm16"]})
+
+        assert isinstance(codec, G711Codec)
+        assert codec.upstream_format == "g711_ulaw"
+        assert (codec.upstream_rate, codec.upstream_width) == (8000, 1)
+
+    def test_first_supported_preference(self):
+        codec = negotiate_codec({"audio_formats": ["mp3", "g711_alaw"]})
+
+        assert codec.name == "g711_alaw"
+
+    def test_opus_without_library(self, monkeypatch):
+        monkeypatch.setattr("api.voice.codecs.opuslib", None)
+        codec = negotiate_codec({"audio_formats": ["opus", "pcm16"]})
+
+        assert codec.name == "pcm16"
+
+    @pytest.mark.asyncio
+    async def test_g711_is_untouched(self):
+        codec = G711Codec("g711_alaw")
+
+        assert await codec.decode(b"\x01\x02\x03") == b"\x01\x02\x03"
+        assert await codec.encode(b"\x01\x02\x03") == b"\x01\x02\x03"
+
+    def test_g711_framing(self):
+        async def discard(audio: bytes):
+            pass
+
+        codec = G711Codec("g711_ulaw")
+        coalescer = AudioCoalescer(discard, frame_ms=100)
+        coalescer.sample_rate = codec.upstream_rate
+        coalescer.sample_width = codec.upstream_width
+        buffer = InputAudioBuffer(
+            discard,
+            chunk_ms=100,
+            sample_rate=codec.upstream_rate,
+            sample_width=codec.upstream_width,
+        )
+
+        assert coalescer.frame_bytes == 800
+        assert buffer.chunk_bytes == 800
+
+
+class TestOpus:
+
+    def test_packets(self):
+        packets = [b"", b"a", b"bc" * 300]
+
+        assert unpack_packets(pack_packets(packets)) == packets
+
+    @pytest.mark.asyncio
+    async def test_round_trip(self):
+        if opuslib is None:
+            pytest.skip("opus is not available")
+        codec = OpusCodec()
+
+        # 50ms is two 20ms packets, the rest is padded at the end
+        encoded = await codec.encode(tone(24000, 50).tobytes())
+        assert len(unpack_packets(encoded)) == 2
+        encoded += await codec.finish()
+        assert len(unpack_packets(encoded)) == 3
+
+        decoded = await codec.decode(encoded)
+        assert len(decoded) == 24000 * 60 // 1000 * 2
+
+    @pytest.fixture
+    def fake_opus(self, monkeypatch):
+        # stands in for libopus, a "packet" is the pcm it was given
+        class Encoder:
+            def __init__(self, *args):
+                self.bitrate = 0
+
+            def encode(self, pcm: bytes, frame_size: int) -> bytes:
+                assert len(pcm) == frame_size * 2
+                return pcm
+
+        opus = SimpleNamespace(
+            Encoder=Encoder, Decoder=lambda *args: None, APPLICATION_VOIP=0
+        )
+        monkeypatch.setattr("api.voice.codecs.opuslib", opus)
+
+    @pytest.mark.asyncio
+    async def test_partial_frames_carry_over(self, fake_opus):
+        codec = OpusCodec()
+        audio = tone(24000, 50).tobytes()
+
+        # coalescer flushes of 10ms and 30ms make two whole packets
+        first = await codec.encode(audio[:480])
+        second = await codec.encode(audio[480:1920])
+        assert unpack_packets(first) == []
+        assert unpack_packets(second) == [audio[:960], audio[960:1920]]
+
+        # no silence until the response's audio ends
+        assert await codec.encode(audio[1920:]) == b""
+        last = unpack_packets(await codec.finish())
+        assert last == [audio[1920:] + bytes(960 - len(audio[1920:]))]
+        assert await codec.finish() == b""
+
+    @pytest.mark.asyncio
+    async def test_reset_drops_partial_frame(self, fake_opus):
+        codec = OpusCodec()
+        await codec.encode(bytes(500))
+        codec.reset()
+
+        assert await codec.finish() == b""
@@ -0,0 +1,313 @@
+"""
+Unit tests for websocket connections and the binary audio subprotocol.
+"""
+
+import asyncio
+import base64
+
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+
+from api.connection import (
+    AUDIO_FRAME,
+    AUDIO_SUBPROTOCOL,
+    AudioCoalescer,
+    Connection,
+    ConnectionManager,
+    Playback,
+    SendQueue,
+    decode_frame,
+)
+from api.model import Update
+from api.voice.codecs import AudioCodec
+
+
+PCM = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client():
+    manager = ConnectionManager()
+    app = FastAPI()
+
+    @app.websocket("/ws/{id}")
+    async def endpoint(id: str, websocket: WebSocket):
+        connection = await manager.connect(id, websocket)
+        await connection.send_audio(id="delta", audio=base64.b64encode(PCM).decode())
+
+        # echo what was received so the test can inspect it
+        message = await connection.receive()
+        if isinstance(message, bytes):
+            frame_type, payload = decode_frame(message)
+            await connection.send_audio(
+                id=str(frame_type), audio=base64.b64encode(payload).decode()
+            )
+        else:
+            await connection.websocket.send_json(message)
+        await connection.flush_audio()
+        await connection.close()
+
+    return TestClient(app)
+
+
+class TestAudioSubprotocol:
+
+    def test_binary_audio_frames(self, client):
+        with client.websocket_connect(
+            "/ws/binary", subprotocols=[AUDIO_SUBPROTOCOL]
+        ) as websocket:
+            assert websocket.accepted_subprotocol == AUDIO_SUBPROTOCOL
+
+            frame = websocket.receive_bytes()
+            assert frame[0] == AUDIO_FRAME
+            assert frame[1:] == PCM
+
+            websocket.send_bytes(bytes((AUDIO_FRAME,)) + PCM[:10])
+            echoed = websocket.receive_bytes()
+            assert echoed[1:] == PCM[:10]
+
+    def test_json_audio_without_subprotocol(self, client):
+        with client.websocket_connect("/ws/json") as websocket:
+            assert websocket.accepted_subprotocol is None
+
+            update = websocket.receive_json()
+            assert update["type"] == "audio"
+            assert base64.b64decode(update["content"]) == PCM
+
+            websocket.send_json({"type": "message", "content": "hello"})
+            assert websocket.receive_json() == {"type": "message", "content": "hello"}
+
+
+class TestAudioCoalescer:
+
+    @pytest.fixture
+    def frames(self):
+        return []
+
+    @pytest.fixture
+    def coalescer(self, frames):
+        async def send(audio: bytes):
+            frames.append(audio)
+
+        # 10ms at 24kHz pcm16 = 480 bytes
+        return AudioCoalescer(send, frame_ms=10)
+
+    @pytest.mark.asyncio
+    async def test_merges_small_deltas(self, coalescer, frames):
+        for _ in range(10):
+            await coalescer.add(bytes(100))
+
+        assert [len(f) for f in frames] == [500, 500]
+
+    @pytest.mark.asyncio
+    async def test_flush_and_clear(self, coalescer, frames):
+        await coalescer.add(bytes(100))
+        await coalescer.flush()
+        assert [len(f) for f in frames] == [100]
+
+        await coalescer.add(bytes(100))
+        coalescer.clear()
+        await coalescer.flush()
+        assert [len(f) for f in frames] == [100]
+
+    @pytest.mark.asyncio
+    async def test_partial_frame_sent_after_window(self, coalescer, frames):
+        await coalescer.add(bytes(100))
+        assert frames == []
+
+        await asyncio.sleep(0.05)
+        assert [len(f) for f in frames] == [100]
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, frames):
+        async def send(audio: bytes):
+            frames.append(audio)
+
+        coalescer = AudioCoalescer(send, frame_ms=0)
+        await coalescer.add(bytes(10))
+        await coalescer.add(bytes(10))
+        assert len(frames) == 2
+
+
+class TestSendQueue:
+
+    @pytest.fixture
+    def sent(self):
+        return []
+
+    @pytest.fixture
+    def gate(self):
+        # closed gate = a client that isn't reading
+        return asyncio.Event()
+
+    @pytest.fixture
+    def queue(self, sent, gate):
+        async def write_text(text: str):
+            await gate.wait()
+            sent.append(text)
+
+        async def write_audio(audio: bytes):
+            await gate.wait()
+            sent.append(audio)
+
+        return SendQueue(write_text, write_audio, max_items=4, max_audio_bytes=100)
+
+    @pytest.mark.asyncio
+    async def test_sends_in_order(self, queue, sent, gate):
+        gate.set()
+        await queue.put_text("a")
+        queue.put_audio(bytes(10))
+        await queue.put_text("b")
+        await queue.close()
+        assert sent == ["a", bytes(10), "b"]
+        assert queue.metrics()["sent"] == 3
+
+    @pytest.mark.asyncio
+    async def test_stale_audio_dropped_text_kept(self, queue, sent, gate):
+        queue.max_items = 8
+        await queue.put_text("a")
+        await asyncio.sleep(0)  # writer picks up "a" and blocks
+        for i in range(5):
+            queue.put_audio(bytes([i]) * 40)
+            await queue.put_text(f"t{i}")
+
+        metrics = queue.metrics()
+        assert metrics["depth"] <= 8
+        assert metrics["audio_bytes"] <= 100
+        assert metrics["dropped_audio"] > 0
+
+        gate.set()
+        await queue.close()
+        texts = [s for s in sent if isinstance(s, str)]
+        assert texts == ["a", "t0", "t1", "t2", "t3", "t4"]
+        # whatever audio survived is the most recent
+        audio = b"".join(s for s in sent if isinstance(s, bytes))
+        assert audio.endswith(bytes([4]) * 40)
+
+    @pytest.mark.asyncio
+    async def test_full_queue_compacts_audio(self, queue, sent, gate):
+        await queue.put_text("a")
+        await asyncio.sleep(0)
+        for _ in range(6):
+            queue.put_audio(bytes(10))
+
+        assert queue.metrics()["compacted"] > 0
+        assert queue.metrics()["dropped_audio"] == 0
+
+        gate.set()
+        await queue.close()
+        assert sum(len(s) for s in sent if isinstance(s, bytes)) == 60
+
+    @pytest.mark.asyncio
+    async def test_text_waits_for_space(self, queue, sent, gate):
+        for i in range(5):
+            await queue.put_text(str(i))
+        await asyncio.sleep(0)
+
+        blocked = asyncio.create_task(queue.put_text("last"))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        gate.set()
+        await blocked
+        await queue.close()
+        assert sent == ["0", "1", "2", "3", "4", "last"]
+        assert queue.metrics()["waits"] > 0
+
+    @pytest.mark.asyncio
+    async def test_clear_audio(self, queue, sent, gate):
+        queue.put_audio(bytes(10))
+        await queue.put_text("a")
+        queue.put_audio(bytes(10))
+        queue.clear_audio()
+
+        gate.set()
+        await queue.close()
+        assert sent == ["a"] or sent == [bytes(10), "a"]
+
+    @pytest.mark.asyncio
+    async def test_close_gives_up_on_stuck_client(self, queue, sent):
+        await queue.put_text("a")
+        await queue.close(timeout=0.01)
+        assert sent == []
+        assert queue.writer is not None and queue.writer.done()
+
+        await queue.put_text("b")
+        assert queue.metrics()["depth"] == 0
+
+
+class TestPlayback:
+
+    def test_buffered_audio_is_unplayed(self):
+        playback = Playback()
+        playback.start("item_1")
+        # 1s of 24kHz pcm16 written at once
+        playback.write(48000, now=10.0)
+        assert playback.played_ms(now=10.25) == 250
+        assert playback.played_ms(now=12.0) == 1000
+
+    def test_stalls(self):
+        playback = Playback()
+        playback.start("item_1")
+        playback.write(4800, now=10.0)
+        # the client ran dry for 900ms before more audio arrived
+        playback.write(4800, now=11.0)
+        assert playback.played_ms(now=11.05) == 150
+
+    def test_other_formats(self):
+        playback = Playback(sample_rate=8000, sample_width=1)
+        playback.start("item_1")
+        playback.write(8000, now=0.0)
+        assert playback.played_ms(now=0.5) == 500
+
+    @pytest.mark.asyncio
+    async def test_written_audio(self):
+        class Socket:
+            async def send_text(self, data: str):
+                pass
+
+        connection = Connection(Socket())  # type: ignore
+        connection.playback.start("item_1")
+        await connection.write_audio(bytes(4800))
+        assert connection.playback.written_ms == 100
+        assert connection.playback.played_ms() < 100
+
+
+class TestAudioEnd:
+
+    class Codec(AudioCodec):
+        def __init__(self):
+            super().__init__()
+            self.calls: list[str] = []
+
+        async def encode(self, audio: bytes) -> bytes:
+            self.calls.append("encode")
+            return audio
+
+        async def finish(self) -> bytes:
+            self.calls.append("finish")
+            return b""
+
+        def reset(self):
+            self.calls.append("reset")
+
+    @pytest.mark.asyncio
+    async def test_codec_finished_only_at_end_of_audio(self):
+        class Socket:
+            async def send_text(self, data: str):
+                pass
+
+        connection = Connection(Socket())  # type: ignore
+        codec = self.Codec()
+        connection.set_codec(codec)
+
+        # a transcript mid response flushes the coalescer, not the codec
+        await connection.send_audio(id="a", audio=base64.b64encode(PCM).decode())
+        await connection.send_update(Update.message(id="m", role="user", content="hi"))
+        await connection.flush_audio()
+        await asyncio.sleep(0.01)
+        await connection.send_update(Update.interrupt())
+        await connection.outbound.close()
+
+        assert codec.calls == ["encode", "finish", "reset"]
@@ -0,0 +1,278 @@
+"""
+Unit tests for media streaming with a fake blob container.
+"""
+
+import io
+import asyncio
+import contextlib
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from azure.core.exceptions import (
+    HttpResponseError,
+    ResourceModifiedError,
+    ResourceNotFoundError,
+)
+
+from api.media import router
+from api.media.cache import MediaCache
+from api.media.common import parse_range
+from api.media.derivatives import negotiate_variant
+
+
+VIDEO = bytes(range(256)) * 40
+IMAGE = b"\x89PNG" + bytes(range(256)) * 4
+ETAG = '"0x8DCAFE"'
+
+
+def make_png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(output, format="PNG")
+    return output.getvalue()
+
+
+PNG = make_png(1024, 1024)
+
+
+class FakeDownloader:
+    def __init__(self, data: bytes, offset: int, length: int | None):
+        end = len(data) if length is None else min(offset + length, len(data))
+        self.content = data[offset:end]
+        self.size = len(self.content)
+        self.properties = SimpleNamespace(
+            etag=ETAG,
+            last_modified=None,
+            content_range=f"bytes {offset}-{end - 1}/{len(data)}",
+        )
+
+    async def readall(self):
+        return self.content
+
+    async def chunks(self):
+        for i in range(0, self.size, 1000):
+            yield self.content[i : i + 1000]
+
+
+class FakeBlobClient:
+    def __init__(self, data: bytes | None):
+        self.data = data
+
+    async def download_blob(self, offset=None, length=None, **kwargs):
+        if self.data is None:
+            raise ResourceNotFoundError("missing")
+        # like the sdk, etag=None means no condition
+        if kwargs.get("etag") is not None and kwargs["etag"] != ETAG:
+            raise ResourceModifiedError("modified")
+        if offset is not None and offset >= len(self.data):
+            error = HttpResponseError("invalid range")
+            error.status_code = 416
+            raise error
+        return FakeDownloader(self.data, offset or 0, length)
+
+    async def get_blob_properties(self):
+        return SimpleNamespace(size=len(self.data or b""))
+
+
+class FakeContainerClient:
+    def __init__(self, blobs: dict[str, bytes]):
+        self.blobs = blobs
+
+    def get_blob_client(self, name: str):
+        return FakeBlobClient(self.blobs.get(name))
+
+
+@pytest.fixture
+def client(tmp_path):
+    @contextlib.asynccontextmanager
+    async def fake_storage_client(container: str):
+        yield FakeContainerClient(
+            {
+                "videos/test.mp4": VIDEO,
+                "images/test.png": IMAGE,
+                "images/real.png": PNG,
+            }
+        )
+
+    app = FastAPI()
+    app.include_router(router)
+    with patch("api.media.common.get_storage_client", fake_storage_client), patch(
+        "api.media.image_cache", MediaCache(tmp_path)
+    ):
+        yield TestClient(app)
+
+
+class TestRangeParsing:
+
+    def test_parse_range(self):
+        assert parse_range(None) is None
+        assert parse_range("bytes=0-") == (0, None)
+        assert parse_range("bytes=100-199") == (100, 199)
+        assert parse_range("bytes=-500") == (-500, None)
+        assert parse_range("bytes=200-100") is None
+        assert parse_range("bytes=0-1,5-9") is None
+        assert parse_range("items=0-1") is None
+
+
+class TestVideoStreaming:
+
+    def test_full_video(self, client):
+        response = client.get("/videos/test.mp4")
+        assert response.status_code == 200
+        assert response.content == VIDEO
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-length"] == str(len(VIDEO))
+        assert response.headers["etag"] == ETAG
+
+    def test_partial_video(self, client):
+        response = client.get("/videos/test.mp4", headers={"Range": "bytes=100-2099"})
+        assert response.status_code == 206
+        assert response.content == VIDEO[100:2100]
+        assert response.headers["content-range"] == f"bytes 100-2099/{len(VIDEO)}"
+
+    def test_suffix_range(self, client):
+        response = client.get("/videos/test.mp4", headers={"Range": "bytes=-10"})
+        assert response.status_code == 206
+        assert response.content == VIDEO[-10:]
+
+    def test_if_range_mismatch_sends_full_video(self, client):
+        response = client.get(
+            "/videos/test.mp4",
+            headers={"Range": "bytes=100-", "If-Range": '"0xOLD"'},
+        )
+        assert response.status_code == 200
+        assert response.content == VIDEO
+
+    def test_unsatisfiable_range(self, client):
+        response = client.get("/videos/test.mp4", headers={"Range": "bytes=999999-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(VIDEO)}"
+
+    def test_missing_video(self, client):
+        response = client.get("/videos/missing.mp4")
+        assert response.status_code == 404
+
+
+class TestImageCache:
+
+    def test_image_etag_and_not_modified(self, client):
+        response = client.get("/images/test.png")
+        assert response.status_code == 200
+        assert response.content == IMAGE
+        assert "immutable" in response.headers["cache-control"]
+
+        etag = response.headers["etag"]
+        response = client.get("/images/test.png", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_missing_image(self, client):
+        response = client.get("/images/missing.png")
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_load_once(self, tmp_path):
+        cache = MediaCache(tmp_path)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return IMAGE
+
+        results = await asyncio.gather(*[cache.get("a", loader) for _ in range(10)])
+        assert all(r == IMAGE for r in results)
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_memory_eviction_falls_back_to_disk(self, tmp_path):
+        cache = MediaCache(tmp_path, memory_limit=len(IMAGE) * 8, disk_limit=1024 * 1024)
+        loads: list[str] = []
+
+        def loader(key):
+            async def load():
+                loads.append(key)
+                return IMAGE
+
+            return load
+
+        for key in ["a", "b", "c", "d", "e", "f", "g", "h", "i"]:
+            await cache.get(key, loader(key))
+
+        # "a" was evicted from memory but is still on disk
+        assert "a" not in cache.memory
+        assert await cache.get("a", loader("a")) == IMAGE
+        assert loads.count("a") == 1
+
+    @pytest.mark.asyncio
+    async def test_disk_limit(self, tmp_path):
+        cache = MediaCache(tmp_path, memory_limit=0, disk_limit=len(IMAGE) * 2)
+
+        async def loader():
+            return IMAGE
+
+        for key in ["a", "b", "c"]:
+            await cache.get(key, loader)
+
+        assert cache.disk_size <= len(IMAGE) * 2
+        assert len(list(tmp_path.iterdir())) == 2
+
+
+class TestImageDerivatives:
+
+    def test_negotiate_variant(self):
+        assert negotiate_variant(None, None, "*/*") is None
+        assert negotiate_variant(None, None, None) is None
+
+        variant = negotiate_variant(700, None, "*/*")
+        assert variant is not None
+        assert variant.width == 800 and variant.format == "png"
+
+        variant = negotiate_variant(None, 77, "image/webp,*/*")
+        assert variant is not None
+        assert variant.format == "webp" and variant.quality == 75
+
+        variant = negotiate_variant(None, None, "image/webp;q=0,*/*")
+        assert variant is None
+
+    def test_resized_webp(self, client):
+        response = client.get(
+            "/images/real.png?width=800", headers={"Accept": "image/webp,*/*"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.headers["vary"] == "Accept"
+        assert len(response.content) < len(PNG)
+
+        with Image.open(io.BytesIO(response.content)) as image:
+            assert image.size == (800, 800)
+
+        original = client.get("/images/real.png")
+        assert original.content == PNG
+        assert original.headers["etag"] != response.headers["etag"]
+
+    def test_missing_image_variant(self, client):
+        response = client.get("/images/missing.png?width=256")
+        assert response.status_code == 404
+
+
+class TestRedirectDelivery:
+
+    def test_redirects_to_signed_url(self, client):
+        class FakeSigner:
+            async def get_url(self, container: str, blob_name: str) -> str:
+                return f"https://account.blob.core.windows.net/{container}/{blob_name}?sig=x"
+
+        with patch("api.media.MEDIA_DELIVERY", "redirect"), patch(
+            "api.media.signed_urls", FakeSigner()
+        ):
+            response = client.get("/videos/test.mp4", follow_redirects=False)
+            assert response.status_code == 307
+            assert response.headers["location"].endswith("/sustineo/videos/test.mp4?sig=x")
+
+            # resized variants are still rendered by the api
+            response = client.get("/images/real.png?width=256", follow_redirects=False)
+            assert response.status_code == 200
@@ -0,0 +1,70 @@
+"""
+Unit tests for Update serialization.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, ClassVar, Optional
+
+import pytest
+
+from api.model import Content, SettingsUpdate, Update, serializable
+
+
+UPDATES = [
+    Update.audio(id="a", data="AAAA"),
+    Update.message(id="m", role="assistant", content="hello"),
+    Update.function(id="f", call_id="c", name="fn", arguments={"x": [1, 2]}),
+    Update.interrupt(),
+    Update.console(id="c", payload={"message": "Unhandled message"}),
+    Update.exception(id="e", error="error", content="details"),
+    Update.audio_settings(id="s", settings={"audio_format": "opus"}),
+    Update.agent(id="g", call_id="c", name="agent", status="run in_progress"),
+    Update.agent(
+        id="g",
+        call_id="c",
+        name="agent",
+        status="step completed",
+        content=Content(type="image", content=[{"image_url": "images/a.png"}]),
+        output=True,
+    ),
+]
+
+
+class TestUpdateSerialization:
+
+    @pytest.mark.parametrize("update", UPDATES, ids=lambda u: u.type)
+    def test_matches_asdict(self, update):
+        assert update.to_dict() == asdict(update)
+        assert json.loads(update.to_json()) == asdict(update)
+
+    def test_settings_required(self):
+        # a factory named like the field would become its default
+        with pytest.raises(TypeError):
+            SettingsUpdate(id="a", type="settings")  # type: ignore
+
+    def test_round_trip(self):
+        update = Update.message(id="m", role="user", content="hi")
+        assert Update.from_json(update.to_json()) == update
+
+    def test_slotted(self):
+        assert not hasattr(Update.audio(id="a", data=""), "__dict__")
+
+    def test_nested_dataclasses(self):
+        @dataclass
+        class Point:
+            x: int
+
+        @serializable
+        @dataclass(slots=True)
+        class Gallery:
+            cover: Optional[Content]
+            pages: list[Content]
+            points: dict[str, tuple[Point, ...]]
+
+            to_dict: ClassVar[Callable[[Any], dict[str, Any]]]
+
+        content = Content(type="text", content=[{"value": "hi"}])
+        gallery = Gallery(content, [content, content], {"a": (Point(1), Point(2))})
+        assert gallery.to_dict() == asdict(gallery)
+        assert Gallery(None, [], {}).to_dict() == asdict(Gallery(None, [], {}))
@@ -0,0 +1,161 @@
+"""
+Unit tests for the realtime connection pool against a local stub
+realtime server.
+"""
+
+import json
+import asyncio
+
+import pytest
+import pytest_asyncio
+from websockets.asyncio.server import serve
+from openai import AsyncAzureOpenAI
+
+from api.voice.pool import AZURE_VOICE_MODEL, RealtimePool
+
+
+class StubRealtimeServer:
+    """
+    Accepts realtime websocket connections, sends session.created and
+    answers session.update with session.updated.
+    """
+
+    def __init__(self):
+        self.opened = 0
+        self.closed = 0
+
+    async def handler(self, websocket):
+        self.opened += 1
+        try:
+            await websocket.send(
+                json.dumps(
+                    {"type": "session.created", "event_id": "e0", "session": {}}
+                )
+            )
+            async for message in websocket:
+                event = json.loads(message)
+                if event["type"] == "session.update":
+                    await websocket.send(
+                        json.dumps(
+                            {"type": "session.updated", "event_id": "e1", "session": {}}
+                        )
+                    )
+        finally:
+            self.closed += 1
+
+
+@pytest_asyncio.fixture
+async def stub():
+    server = StubRealtimeServer()
+    async with serve(server.handler, "127.0.0.1", 0) as websocket_server:
+        port = list(websocket_server.sockets)[0].getsockname()[1]
+        client = AsyncAzureOpenAI(
+            azure_endpoint="http://127.0.0.1",
+            api_key="key",
+            api_version="2025-04-01-preview",
+            websocket_base_url=f"ws://127.0.0.1:{port}",
+        )
+        server.connect = lambda: client.beta.realtime.connect(model=AZURE_VOICE_MODEL)  # type: ignore
+        yield server
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+class TestRealtimePool:
+
+    @pytest.mark.asyncio
+    async def test_pooled_session_skips_session_created(self, stub):
+        pool = RealtimePool(stub.connect, size=2)
+        pool.start()
+        await wait_for(lambda: len(pool.idle) == 2)
+        assert stub.opened == 2
+
+        async with pool.connection() as realtime:
+            await realtime.session.update(session={"voice": "sage"})
+            event = await realtime.recv()
+            assert event.type == "session.updated"
+
+        # the pool refilled behind the hand-off
+        await wait_for(lambda: len(pool.idle) == 2)
+        assert pool.metrics()["hits"] == 1
+        assert stub.opened == 3
+
+        await pool.close()
+        await wait_for(lambda: stub.closed == 3)
+
+    @pytest.mark.asyncio
+    async def test_connects_directly_when_empty(self, stub):
+        pool = RealtimePool(stub.connect, size=0)
+        async with pool.connection() as realtime:
+            # a fresh connection still starts with session.created
+            event = await realtime.recv()
+            assert event.type == "session.created"
+
+        assert pool.metrics()["misses"] == 1
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_idle_sessions_are_replaced(self, stub):
+        pool = RealtimePool(stub.connect, size=1, max_age=0.05, check_interval=0.02)
+        pool.start()
+        await wait_for(lambda: pool.metrics()["expired"] >= 2)
+        await wait_for(lambda: len(pool.idle) == 1)
+        assert stub.closed >= 2
+
+        await pool.close()
+        await wait_for(lambda: stub.closed == stub.opened)
+
+    @pytest.mark.asyncio
+    async def test_warm_errors_are_counted(self):
+        def connect():
+            raise ConnectionError("upstream unavailable")
+
+        pool = RealtimePool(connect, size=1, check_interval=0.02)  # type: ignore
+        pool.start()
+        await wait_for(lambda: pool.metrics()["errors"] >= 2)
+        assert len(pool.idle) == 0
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_pooled_sessions_are_configured(self, stub):
+        configured = []
+
+        async def configure(realtime):
+            configured.append(realtime)
+            await realtime.session.update(session={"modalities": ["text", "audio"]})
+
+        pool = RealtimePool(stub.connect, size=1, configure=configure)
+        pool.start()
+        await wait_for(lambda: len(pool.idle) == 1)
+        assert len(configured) == 1
+
+        async with pool.connection() as realtime:
+            # session.updated for the shared configuration was taken too
+            await realtime.session.update(session={"voice": "sage"})
+            event = await realtime.recv()
+            assert event.type == "session.updated"
+
+
+        await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_warm_errors_back_off(self):
+        attempts: list[float] = []
+
+        def connect():
+            attempts.append(asyncio.get_running_loop().time())
+            raise ConnectionError("upstream unavailable")
+
+        pool = RealtimePool(connect, size=1, check_interval=0.02)  # type: ignore
+        pool.start()
+        await wait_for(lambda: len(attempts) >= 3)
+        await pool.close()
+
+        # 0.04s after the first failure, 0.08s after the second
+        gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+        assert gaps[1] > gaps[0] >= 0.04
+        assert pool.failures >= 3
@@ -0,0 +1,145 @@
+"""
+Unit tests for recording and replaying voice sessions.
+"""
+
+import json
+import time
+import base64
+import asyncio
+from typing import Any, cast
+
+import pytest
+from openai._models import construct_type_unchecked
+from openai.types.beta.realtime import RealtimeServerEvent
+
+from api.connection import AUDIO_FRAME
+from api.voice.replay import (
+    DISCONNECT,
+    RecordedEvent,
+    ReplaySession,
+    SessionRecorder,
+    load_recording,
+)
+from api.voice.session import RealtimeSession
+
+from .test_session import FakeClient, FakeRealtime
+
+AUDIO = base64.b64encode(bytes(4800)).decode()
+
+REALTIME: list[dict[str, Any]] = [
+    {"type": "session.created", "event_id": "e0", "session": {}},
+    {
+        "type": "conversation.item.input_audio_transcription.completed",
+        "event_id": "e1",
+        "item_id": "item_1",
+        "content_index": 0,
+        "transcript": " hello there ",
+    },
+    *[
+        {
+            "type": "response.audio.delta",
+            "event_id": f"d{i}",
+            "response_id": "resp_1",
+            "item_id": "item_2",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": AUDIO,
+        }
+        for i in range(5)
+    ],
+    {
+        "type": "response.audio.done",
+        "event_id": "e2",
+        "response_id": "resp_1",
+        "item_id": "item_2",
+        "output_index": 0,
+        "content_index": 0,
+    },
+]
+
+
+def recording(spacing: float = 0.0) -> list[RecordedEvent]:
+    events = [RecordedEvent(0.0, "client", {"user": "tester"})]
+    events += [
+        RecordedEvent(i * spacing, "realtime", data) for i, data in enumerate(REALTIME)
+    ]
+    events += [
+        RecordedEvent(0.0, "client", bytes((AUDIO_FRAME,)) + bytes(4800)),
+        RecordedEvent(0.0, "client", {"type": "audio", "content": AUDIO}),
+        RecordedEvent(len(REALTIME) * spacing, "client", DISCONNECT),
+    ]
+    return events
+
+
+async def replay(session: ReplaySession) -> RealtimeSession:
+    await session.client.receive_json()
+    realtime = RealtimeSession(cast(Any, session.realtime), session.client)
+    await asyncio.gather(realtime.receive_realtime(), realtime.receive_client())
+    return realtime
+
+
+class TestRecording:
+
+    def test_event_round_trip(self):
+        for event in recording():
+            assert RecordedEvent.from_json(event.to_json()) == event
+
+    @pytest.mark.asyncio
+    async def test_records_session(self, tmp_path):
+        path = str(tmp_path / "session.jsonl")
+        recorder = SessionRecorder.open(path)
+        events = [
+            construct_type_unchecked(value=e, type_=cast(Any, RealtimeServerEvent))
+            for e in REALTIME
+        ]
+        client = FakeClient(
+            [bytes((AUDIO_FRAME,)) + bytes(480), {"type": "audio", "content": AUDIO}]
+        )
+        session = RealtimeSession(
+            FakeRealtime(events), client, recorder=recorder  # type: ignore
+        )
+        await asyncio.gather(session.receive_realtime(), session.receive_client())
+        assert recorder.file.closed
+
+        recorded = load_recording(path)
+        realtime = [e.data for e in recorded if e.source == "realtime"]
+        client_messages = [e.data for e in recorded if e.source == "client"]
+
+        assert [e["type"] for e in realtime] == [e["type"] for e in REALTIME]  # type: ignore
+        assert realtime[1] == REALTIME[1]
+        assert client_messages[0] == bytes((AUDIO_FRAME,)) + bytes(480)
+        assert client_messages[-1] == DISCONNECT
+        assert all(a.t <= b.t for a, b in zip(recorded, recorded[1:]))
+
+
+class TestReplay:
+
+    @pytest.mark.asyncio
+    async def test_replay_as_fast_as_possible(self):
+        session = ReplaySession(recording(spacing=1.0), speed=0)
+        start = time.perf_counter()
+        realtime = await replay(session)
+
+        assert time.perf_counter() - start < 1.0
+        # both appends (binary and json) went upstream
+        appends = [e for e in session.realtime.sent if e.type == "input_audio_buffer.append"]
+        assert sum(len(base64.b64decode(e.audio)) for e in appends) == 9600
+
+        updates = [json.loads(text) for text in session.websocket.text]
+        assert {"type": "message", "role": "user"}.items() <= updates[0].items()
+        audio = [u for u in updates if u["type"] == "audio"]
+        assert sum(len(base64.b64decode(u["content"])) for u in audio) == 5 * 4800
+
+        assert len(session.realtime.times.samples["response.audio.delta"]) == 5
+        assert len(session.websocket.times.all()) == 3
+        assert realtime.input_audio.closed
+
+    @pytest.mark.asyncio
+    async def test_replay_keeps_timing(self):
+        # 7 realtime events 50ms apart, at 2x
+        session = ReplaySession(recording(spacing=0.05), speed=2.0)
+        start = time.perf_counter()
+        await replay(session)
+
+        elapsed = time.perf_counter() - start
+        assert 0.15 <= elapsed < 1.0
@@ -0,0 +1,700 @@
+"""
+Unit tests for realtime event dispatch with fake realtime and client
+connections.
+"""
+
+import base64
+import asyncio
+import contextlib
+from types import SimpleNamespace
+from unittest.mock import Mock
+from typing import Callable, Union
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+
+from api.connection import AUDIO_FRAME, Playback
+from api.voice.codecs import AudioCodec
+from api.voice.metrics import Histogram, SetupTimer, TurnMetrics, TurnTimer
+from api.agent import run_function
+from api.agent.common import FoundryRun
+from api.agent.decorators import function_calls
+from api.model import Agent, Content, Function
+from api.voice.session import TOOL_IN_PROGRESS, RealtimeSession, realtime_handler
+
+
+class FakeRealtime:
+    def __init__(self, events: list = []):
+        self.events = events
+        self.sent: list = []
+        self.response = SimpleNamespace(create=self.create_response)
+        self.responses = 0
+
+    async def __aiter__(self):
+        for event in self.events:
+            yield event
+
+    async def send(self, event):
+        self.sent.append(event)
+
+    async def create_response(self):
+        self.responses += 1
+
+    async def close(self):
+        pass
+
+
+class FakeClient:
+    state = WebSocketState.CONNECTED
+    codec = AudioCodec()
+
+    def __init__(self, messages: list = []):
+        self.messages = list(messages)
+        self.audio: list[str] = []
+        self.updates: list = []
+        self.flushes = 0
+        self.playback = Playback()
+        # set by the session, as on a real connection
+        self.on_audio_written: Union[Callable[[], None], None] = None
+
+    async def receive(self):
+        if len(self.messages) == 0:
+            # give queued work a chance to finish before disconnecting
+            await asyncio.sleep(0.05)
+            raise WebSocketDisconnect()
+        return self.messages.pop(0)
+
+    async def close(self):
+        pass
+
+    async def send_audio(self, id: str, audio: str):
+        self.audio.append(audio)
+
+    async def flush_audio(self):
+        self.flushes += 1
+
+    async def send_update(self, update):
+        self.updates.append(update)
+
+
+def event(type: str, **kwargs):
+    return SimpleNamespace(type=type, **kwargs)
+
+
+def delta(event_id: str, audio: str, response_id: str = "resp_1", item_id: str = "item_1"):
+    return event(
+        "response.audio.delta",
+        event_id=event_id,
+        response_id=response_id,
+        item_id=item_id,
+        delta=audio,
+    )
+
+
+EVENTS = [
+    event("session.created"),
+    delta("e1", "AAAA"),
+    delta("e2", "BBBB"),
+    event("response.audio.done"),
+    event("some.future.event"),
+]
+
+
+class TestRealtimeDispatch:
+
+    def test_only_subscribed_events_have_handlers(self):
+        assert RealtimeSession.handlers["response.audio.delta"] == "response_audio_delta"
+        assert "session.created" not in RealtimeSession.handlers
+
+    @pytest.mark.asyncio
+    async def test_dispatch(self):
+        client = FakeClient()
+        session = RealtimeSession(FakeRealtime(EVENTS), client)  # type: ignore
+        await session.receive_realtime()
+
+        assert client.audio == ["AAAA", "BBBB"]
+        assert client.flushes == 1
+
+    @pytest.mark.asyncio
+    async def test_subclass_registers_handlers(self):
+        seen: list[str] = []
+
+        class CustomSession(RealtimeSession):
+            @realtime_handler("session.created", "some.future.event")
+            async def record(self, event):
+                seen.append(event.type)
+
+            # an override is dispatched without repeating the decorator
+            async def response_audio_done(self, event):
+                seen.append("done")
+
+        client = FakeClient()
+        session = CustomSession(FakeRealtime(EVENTS), client)  # type: ignore
+        await session.receive_realtime()
+
+        assert seen == ["session.created", "done", "some.future.event"]
+        assert client.audio == ["AAAA", "BBBB"]
+        assert client.flushes == 0
+        assert "session.created" not in RealtimeSession.handlers
+
+    @pytest.mark.asyncio
+    async def test_plugin_handlers(self):
+        seen: list[str] = []
+
+        async def on_delta(event):
+            seen.append(event.event_id)
+
+        client = FakeClient()
+        session = RealtimeSession(FakeRealtime(EVENTS), client)  # type: ignore
+        session.on("response.audio.delta", on_delta)
+        await session.receive_realtime()
+
+        assert seen == ["e1", "e2"]
+        assert client.audio == ["AAAA", "BBBB"]
+
+
+class TestInputAudio:
+
+    @pytest.mark.asyncio
+    async def test_local_vad_drops_silence(self):
+        silence = bytes(4800)
+        client = FakeClient(
+            [bytes((AUDIO_FRAME,)) + silence] * 10
+            + [{"type": "audio", "content": base64.b64encode(silence).decode()}]
+        )
+        realtime = FakeRealtime()
+        session = RealtimeSession(realtime, client)  # type: ignore
+        await session.update_realtime_session(
+            instructions="", detection_type="server_vad", local_vad=True
+        )
+        await session.receive_client()
+
+        # only the session.update went upstream
+        assert [e.type for e in realtime.sent] == ["session.update"]
+
+    @pytest.mark.asyncio
+    async def test_audio_passes_through_without_local_vad(self):
+        silence = bytes(4800)
+        client = FakeClient([bytes((AUDIO_FRAME,)) + silence])
+        realtime = FakeRealtime()
+        session = RealtimeSession(realtime, client)  # type: ignore
+        await session.receive_client()
+
+        assert [e.type for e in realtime.sent] == ["input_audio_buffer.append"]
+        assert base64.b64decode(realtime.sent[0].audio) == silence
+
+    @pytest.mark.asyncio
+    async def test_malformed_frames_skipped(self):
+        silence = bytes(4800)
+        client = FakeClient([b"", b"\x7fjunk", bytes((AUDIO_FRAME,)) + silence])
+        realtime = FakeRealtime()
+        session = RealtimeSession(realtime, client)  # type: ignore
+        await session.receive_client()
+
+        assert [e.type for e in realtime.sent] == ["input_audio_buffer.append"]
+
+
+class TestSetupTimer:
+
+    @pytest.mark.asyncio
+    async def test_overlapping_steps(self):
+        timer = SetupTimer()
+        await asyncio.gather(
+            timer.time("a", asyncio.sleep(0.05)),
+            timer.time("b", asyncio.sleep(0.05)),
+        )
+
+        report = timer.report()
+        assert set(report) == {"a", "b", "total"}
+        assert report["a"] >= 50 and report["b"] >= 50
+        # the steps ran side by side
+        assert report["total"] < report["a"] + report["b"]
+        assert str(timer).startswith("a=")
+
+
+TURN = [
+    event("input_audio_buffer.speech_stopped"),
+    event("input_audio_buffer.committed"),
+    event("response.created", response=SimpleNamespace(id="resp_1")),
+    delta("e1", "AAAA"),
+    delta("e2", "BBBB"),
+    event("response.done", response=SimpleNamespace(id="resp_1", output=[])),
+]
+
+
+class TestTurnMetrics:
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(10, 100))
+        for ms in (5, 50, 60, 500):
+            histogram.observe(ms)
+        histogram.observe(70, exemplar={"trace_id": "abc"})
+
+        report = histogram.report()
+        assert report["buckets"] == {"10": 1, "100": 3, "+Inf": 1}
+        assert report["p50"] == 100
+        assert report["p99"] == "+Inf"
+        assert report["exemplars"] == {"100": {"ms": 70, "trace_id": "abc"}}
+
+    def test_stages(self):
+        turn = TurnTimer(speech_stopped=1.0, committed=1.1, response_created=1.3)
+
+        assert turn.stages() == pytest.approx({"commit": 100, "response": 200})
+
+    @pytest.mark.asyncio
+    async def test_session_turn(self, monkeypatch):
+        metrics = TurnMetrics()
+        monkeypatch.setattr("api.voice.session.turn_metrics", metrics)
+
+        class WritingClient(FakeClient):
+            async def send_audio(self, id: str, audio: str):
+                await super().send_audio(id, audio)
+                if self.on_audio_written is not None:
+                    self.on_audio_written()
+
+        client = WritingClient()
+        session = RealtimeSession(FakeRealtime(TURN), client)  # type: ignore
+        session.configuration, session.voice = "travel", "alloy"
+        await session.receive_realtime()
+
+        assert session.turn is None
+        for stages in (metrics.configurations["travel"], metrics.voices["alloy"]):
+            assert set(stages) == {
+                "commit",
+                "response",
+                "first_audio",
+                "forward",
+                "first_write",
+                "done",
+            }
+            assert all(h.count == 1 for h in stages.values())
+
+    @pytest.mark.asyncio
+    async def test_response_without_speech(self, monkeypatch):
+        metrics = TurnMetrics()
+        monkeypatch.setattr("api.voice.session.turn_metrics", metrics)
+
+        session = RealtimeSession(FakeRealtime(TURN[2:]), FakeClient())  # type: ignore
+        await session.receive_realtime()
+
+        assert set(metrics.voices["sage"]) == {"first_audio"}
+
+    def test_slow_turn_exemplar(self):
+        metrics = TurnMetrics(slow_turn_ms=50)
+        metrics.record(
+            TurnTimer(speech_stopped=1.0, response_done=1.2), "default", "sage"
+        )
+        metrics.record(
+            TurnTimer(speech_stopped=1.0, response_done=1.01), "default", "sage"
+        )
+
+        done = metrics.voices["sage"]["done"].report()
+        assert done["count"] == 2
+        assert list(done["exemplars"]) == ["250"]
+        assert done["exemplars"]["250"]["configuration"] == "default"
+
+
+def function_call(call_id: str):
+    item = SimpleNamespace(
+        type="function_call",
+        id=f"item_{call_id}",
+        call_id=call_id,
+        name="f",
+        arguments="{}",
+    )
+    return event("response.output_item.done", item=item)
+
+
+RESPONSE_DONE = event("response.done", response=SimpleNamespace(id="r", output=[]))
+
+
+class TestToolOutputs:
+
+    @pytest.mark.asyncio
+    async def test_parallel_calls_share_one_response(self):
+        realtime = FakeRealtime(
+            [
+                event("response.created", response=SimpleNamespace(id="r")),
+                function_call("a"),
+                function_call("b"),
+                RESPONSE_DONE,
+            ]
+        )
+        session = RealtimeSession(realtime, FakeClient())  # type: ignore
+        await session.receive_realtime()
+
+        await session.queue_response("a", "1")
+        assert realtime.sent == [] and realtime.responses == 0
+
+        await session.queue_response("b", "2")
+        assert [item.item.call_id for item in realtime.sent] == ["a", "b"]
+        assert realtime.responses == 1
+        assert session.response_timer is None
+
+    @pytest.mark.asyncio
+    async def test_waits_for_active_response(self):
+        realtime = FakeRealtime(
+            [event("response.created", response=SimpleNamespace(id="r"))]
+        )
+        session = RealtimeSession(realtime, FakeClient())  # type: ignore
+        await session.receive_realtime()
+
+        await session.queue_response("a", "1")
+        assert realtime.responses == 0
+
+        await session.response_done(RESPONSE_DONE)  # type: ignore
+        assert len(realtime.sent) == 1
+        assert realtime.responses == 1
+
+    @pytest.mark.asyncio
+    async def test_unanswered_call_times_out(self, monkeypatch):
+        monkeypatch.setattr("api.voice.session.TOOL_OUTPUT_WAIT_MS", 20)
+        realtime = FakeRealtime([function_call("a"), function_call("b"), RESPONSE_DONE])
+        session = RealtimeSession(realtime, FakeClient())  # type: ignore
+        await session.receive_realtime()
+
+        await session.queue_response("a", "1")
+        assert realtime.responses == 0
+
+        await asyncio.sleep(0.1)
+        assert len(realtime.sent) == 1
+        assert realtime.responses == 1
+
+    @pytest.mark.asyncio
+    async def test_output_before_sibling_call_times_out(self, monkeypatch):
+        monkeypatch.setattr("api.voice.session.TOOL_OUTPUT_WAIT_MS", 20)
+        realtime = FakeRealtime(
+            [
+                event("response.created", response=SimpleNamespace(id="r")),
+                function_call("a"),
+            ]
+        )
+        session = RealtimeSession(realtime, FakeClient())  # type: ignore
+        await session.receive_realtime()
+
+        # a is answered before b is even called, nothing else is pending yet
+        await session.queue_response("a", "1")
+        await session.response_output_item_done(function_call("b"))  # type: ignore
+        await session.response_done(RESPONSE_DONE)  # type: ignore
+        assert realtime.responses == 0
+        assert session.response_timer is not None
+
+        await asyncio.sleep(0.1)
+        assert [item.item.call_id for item in realtime.sent] == ["a"]
+        assert realtime.responses == 1
+
+    @pytest.mark.asyncio
+    async def test_client_completion(self):
+        realtime = FakeRealtime()
+        client = FakeClient(
+            [{"type": "function_completion", "call_id": "a", "output": "done"}]
+        )
+        session = RealtimeSession(realtime, client)  # type: ignore
+        await session.receive_client()
+
+        assert realtime.sent[0].item.output == "done"
+        assert realtime.responses == 1
+
+
+class TestServerTools:
+
+    @pytest.fixture
+    def functions(self, monkeypatch):
+        calls: list = []
+
+        async def has_function(name):
+            return name != "client_only"
+
+        async def run_function(name, arguments, notify, prepared=None):
+            calls.append((name, arguments))
+            if name == "broken":
+                raise RuntimeError("boom")
+            await notify("Test Agent")(
+                id="step",
+                status="run completed",
+                content=Content(type="text", content=[{"type": "text", "value": "42"}]),
+                output=True,
+            )
+
+        monkeypatch.setattr("api.voice.session.has_function", has_function)
+        monkeypatch.setattr("api.voice.session.run_function", run_function)
+        return calls
+
+    async def call(self, session: RealtimeSession, name: str, arguments: str = "{}"):
+        item = SimpleNamespace(
+            type="function_call",
+            id="item_1",
+            call_id="c1",
+            name=name,
+            arguments=arguments,
+        )
+        await session.response_output_item_done(  # type: ignore
+            event("response.output_item.done", item=item)
+        )
+        await asyncio.gather(*session.background)
+
+    @pytest.mark.asyncio
+    async def test_runs_in_process(self, functions):
+        realtime, client = FakeRealtime(), FakeClient()
+        session = RealtimeSession(realtime, client, server_tools=True)  # type: ignore
+        await self.call(session, "answer", '{"q": 1}')
+        # the output waits for the in progress response to finish
+        assert [e.item.output for e in realtime.sent] == [TOOL_IN_PROGRESS]
+        await session.response_done(RESPONSE_DONE)  # type: ignore
+
+        assert functions == [("answer", {"q": 1})]
+        assert [e.item.output for e in realtime.sent] == [TOOL_IN_PROGRESS, "42"]
+        assert realtime.responses == 2
+        assert [u.type for u in client.updates] == ["agent"]
+        assert client.updates[0].call_id == "c1"
+
+    @pytest.mark.asyncio
+    async def test_client_functions(self, functions):
+        realtime, client = FakeRealtime(), FakeClient()
+        session = RealtimeSession(realtime, client, server_tools=True)  # type: ignore
+        await self.call(session, "client_only")
+        await self.call(session, "camera", '{"kind": "CAMERA"}')
+        # the client fills in the image it is showing
+        await self.call(session, "post", '{"image_url": "https://made/up.png"}')
+
+        assert functions == []
+        assert [u.type for u in client.updates] == ["function"] * 3
+        assert realtime.sent == []
+
+    @pytest.mark.asyncio
+    async def test_failure(self, functions):
+        realtime, client = FakeRealtime(), FakeClient()
+        session = RealtimeSession(realtime, client, server_tools=True)  # type: ignore
+        await self.call(session, "broken")
+        await session.response_done(RESPONSE_DONE)  # type: ignore
+
+        assert "has failed" in realtime.sent[-1].item.output
+        assert client.updates[-1].status == "run failed"
+
+    @pytest.mark.asyncio
+    async def test_ignores_client_completion(self, functions):
+        realtime = FakeRealtime()
+        client = FakeClient(
+            [{"type": "function_completion", "call_id": "c1", "output": "late"}]
+        )
+        session = RealtimeSession(realtime, client, server_tools=True)  # type: ignore
+        await self.call(session, "answer")
+        await session.receive_client()
+
+        assert "late" not in [e.item.output for e in realtime.sent]
+
+    @pytest.mark.asyncio
+    async def test_function_call(self, monkeypatch):
+        # a plain @function through the real run_function, notify included
+        async def add(a: int, b: int, notify):
+            await notify(id="add", status="run completed")
+            return a + b
+
+        async def no_foundry_agents():
+            return {}
+
+        monkeypatch.setattr("api.agent.load_foundry_agents", no_foundry_agents)
+        monkeypatch.setitem(function_calls, "add", Function("add", [], add))
+        realtime, client = FakeRealtime(), FakeClient()
+        session = RealtimeSession(realtime, client, server_tools=True)  # type: ignore
+        await self.call(session, "add", '{"a": 1, "b": 2}')
+        await session.response_done(RESPONSE_DONE)  # type: ignore
+
+        assert [e.item.output for e in realtime.sent] == [TOOL_IN_PROGRESS, "3"]
+        assert [(u.name, u.status) for u in client.updates] == [("add", "run completed")]
+
+    @pytest.mark.asyncio
+    async def test_foundry_arguments(self, monkeypatch):
+        executed: list = []
+        deleted: list = []
+
+        async def foundry_agents():
+            return {"research": Agent("asst_1", "Research", "foundry", "", [])}
+
+        async def execute_foundry_agent(
+            agent_id, additional_instructions, query, tools, notify, prepared=None
+        ):
+            executed.append((additional_instructions, query, prepared))
+
+        async def delete_thread(thread_id):
+            deleted.append(thread_id)
+
+        monkeypatch.setattr("api.agent.load_foundry_agents", foundry_agents)
+        monkeypatch.setattr("api.agent.execute_foundry_agent", execute_foundry_agent)
+        notify = Mock()
+
+        # additional_instructions is optional
+        await run_function("research", {"query": "weather"}, notify, prepared="run")
+        assert executed == [("", "weather", "run")]
+
+        # a call that fails before the run is handed over still releases it
+        stack = contextlib.AsyncExitStack()
+        closed: list = []
+        stack.callback(closed.append, True)
+        client = SimpleNamespace(agents=SimpleNamespace(delete_thread=delete_thread))
+        prepared = FoundryRun(stack, client, "asst_1", "thread_1", "weather")  # type: ignore
+        with pytest.raises(KeyError):
+            await run_function("research", {}, notify, prepared=prepared)
+        assert deleted == ["thread_1"] and closed == [True]
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, functions):
+        session = RealtimeSession(FakeRealtime(), FakeClient())  # type: ignore
+        await self.call(session, "answer")
+
+        assert functions == []
+
+
+class TestSpeculation:
+
+    @pytest.fixture
+    def agents(self, monkeypatch):
+        log: list = []
+
+        async def has_function(name):
+            return True
+
+        def prepare_fields(name):
+            return ("query",) if name == "research" else None
+
+        async def prepare_function(name, arguments):
+            log.append(("prepare", arguments["query"]))
+            return f"run {arguments['query']}"
+
+        async def discard_prepared(prepared):
+            log.append(("discard", prepared))
+
+        async def run_function(name, arguments, notify, prepared=None):
+            log.append(("run", prepared))
+
+        monkeypatch.setattr("api.voice.session.has_function", has_function)
+        monkeypatch.setattr("api.voice.session.prepare_fields", prepare_fields)
+        monkeypatch.setattr("api.voice.session.run_function", run_function)
+        monkeypatch.setattr("api.voice.speculation.prepare_function", prepare_function)
+        monkeypatch.setattr("api.voice.speculation.discard_prepared", discard_prepared)
+        return log
+
+    async def stream(self, session: RealtimeSession, name: str, deltas: list[str]):
+        item = SimpleNamespace(
+            type="function_call", id="item_1", call_id="c1", name=name, arguments=""
+        )
+        await session.response_output_item_added(  # type: ignore
+            event("response.output_item.added", item=item)
+        )
+        for delta in deltas:
+            await session.response_function_call_arguments_delta(  # type: ignore
+                event("response.function_call_arguments.delta", item_id="item_1", delta=delta)
+            )
+            await asyncio.sleep(0)
+        return item
+
+    async def finish(self, session: RealtimeSession, item, arguments: str):
+        item.arguments = arguments
+        await session.response_output_item_done(  # type: ignore
+            event("response.output_item.done", item=item)
+        )
+        await asyncio.gather(*session.background)
+
+    @pytest.mark.asyncio
+    async def test_prepared_before_done(self, agents):
+        session = RealtimeSession(FakeRealtime(), FakeClient(), server_tools=True)  # type: ignore
+        item = await self.stream(
+            session, "research", ['{"query": "wea', 'ther"', ', "additional_instructions": "']
+        )
+        # started while the rest of the arguments stream in
+        assert agents == [("prepare", "weather")]
+
+        await self.finish(
+            session, item, '{"query": "weather", "additional_instructions": ""}'
+        )
+        assert agents == [("prepare", "weather"), ("run", "run weather")]
+
+    @pytest.mark.asyncio
+    async def test_rolled_back(self, agents):
+        session = RealtimeSession(FakeRealtime(), FakeClient(), server_tools=True)  # type: ignore
+        item = await self.stream(session, "research", ['{"query": "weather",'])
+        # arguments arrived differently from the stream, start over
+        await self.finish(session, item, '{"query": "news"}')
+        assert agents == [
+            ("prepare", "weather"),
+            ("discard", "run weather"),
+            ("run", None),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_unprepared_function(self, agents):
+        session = RealtimeSession(FakeRealtime(), FakeClient(), server_tools=True)  # type: ignore
+        item = await self.stream(session, "images", ['{"query": "cats"}'])
+        await self.finish(session, item, '{"query": "cats"}')
+        assert agents == [("run", None)]
+
+    @pytest.mark.asyncio
+    async def test_unfinished_response(self, agents):
+        session = RealtimeSession(FakeRealtime(), FakeClient(), server_tools=True)  # type: ignore
+        await self.stream(session, "research", ['{"query": "weather",'])
+        await session.response_done(RESPONSE_DONE)  # type: ignore
+        await asyncio.gather(*session.discards)
+        assert agents == [("prepare", "weather"), ("discard", "run weather")]
+
+    @pytest.mark.asyncio
+    async def test_close_discards_prepared(self, agents):
+        session = RealtimeSession(FakeRealtime(), FakeClient(), server_tools=True)  # type: ignore
+        await self.stream(session, "research", ['{"query": "weather",'])
+        await asyncio.sleep(0)
+        # the setup already finished, its thread is still cleaned up
+        await session.close()
+        assert agents == [("prepare", "weather"), ("discard", "run weather")]
+
+
+class TestBargeIn:
+
+    def session(self, events: list):
+        realtime, client = FakeRealtime(events), FakeClient()
+        return RealtimeSession(realtime, client), realtime, client  # type: ignore
+
+    @pytest.mark.asyncio
+    async def test_cancel_and_truncate(self):
+        session, realtime, client = self.session(
+            [
+                event("response.created", response=SimpleNamespace(id="resp_1")),
+                delta("e1", "AAAA"),
+                event("input_audio_buffer.speech_started", item_id="input_2"),
+                # generated before the cancel landed
+                delta("e2", "BBBB"),
+            ]
+        )
+        await session.receive_realtime()
+
+        cancel, truncate = realtime.sent
+        assert cancel.type == "response.cancel"
+        assert cancel.response_id == "resp_1"
+        assert truncate.type == "conversation.item.truncate"
+        assert truncate.item_id == "item_1"
+        assert truncate.audio_end_ms == 0
+        assert client.audio == ["AAAA"]
+        assert client.updates[-1].type == "interrupt"
+        assert client.playback.item_id is None
+
+    @pytest.mark.asyncio
+    async def test_nothing_playing(self):
+        session, realtime, client = self.session(
+            [event("input_audio_buffer.speech_started", item_id="input_1")]
+        )
+        await session.receive_realtime()
+
+        assert realtime.sent == []
+        assert [u.type for u in client.updates] == ["interrupt"]
+
+    @pytest.mark.asyncio
+    async def test_played_out(self):
+        # the response is done and the client has played all of it
+        session, realtime, client = self.session(
+            [event("input_audio_buffer.speech_started", item_id="input_2")]
+        )
+        client.playback.start("item_1")
+        client.playback.write(4800, now=0.0)
+        await session.receive_realtime()
+
+        assert realtime.sent == []
+
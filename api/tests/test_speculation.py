@@ -0,0 +1,43 @@
+"""
+Unit tests for parsing streamed function call arguments.
+"""
+
+from api.voice.speculation import ArgumentStream
+
+
+class TestArgumentStream:
+
+    def feed(self, text: str, size: int):
+        stream = ArgumentStream()
+        completed = []
+        for i in range(0, len(text), size):
+            completed.extend(stream.feed(text[i : i + size]))
+        return stream, completed
+
+    def test_fields_complete_early(self):
+        stream = ArgumentStream()
+        assert stream.feed('{"query": "wea') == []
+        assert stream.feed('ther", "n": 1') == ["query"]
+        assert stream.fields == {"query": "weather"}
+        assert stream.feed("}") == ["n"]
+        assert stream.done
+
+    def test_any_chunking(self):
+        text = (
+            '{"query": "say \\"hi\\", {please}", "nested": {"a": [1, {"b": ","}]},'
+            ' "list": [1, 2], "flag": true}'
+        )
+        for size in (1, 2, 3, 7, len(text)):
+            stream, completed = self.feed(text, size)
+            assert completed == ["query", "nested", "list", "flag"]
+            assert not stream.failed
+
+    def test_empty(self):
+        stream, completed = self.feed(" {} ", 1)
+        assert completed == [] and stream.done and not stream.failed
+
+    def test_not_an_object(self):
+        stream, _ = self.feed("[1, 2]", 1)
+        assert stream.failed
+        stream, _ = self.feed('{"a": nope}', 1)
+        assert stream.failed and stream.fields == {}
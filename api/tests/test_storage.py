@@ -0,0 +1,260 @@
+"""
+Unit tests for blob persistence with a fake container client.
+"""
+
+import asyncio
+import base64
+import contextlib
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+from aiohttp.streams import StreamReader
+
+from datetime import datetime, timedelta, timezone
+from azure.storage.blob import UserDelegationKey
+from azure.storage.blob.aio import ContainerClient
+
+from api.agent.storage import (
+    SignedUrlCache,
+    StorageClientManager,
+    save_image_blobs,
+    save_video_blob,
+)
+
+
+class FakeContainerClient:
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.blobs: dict[str, bytes] = {}
+        self.active = 0
+        self.max_active = 0
+
+    async def upload_blob(self, name: str, data: bytes, overwrite: bool = False):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.blobs[name] = data
+        self.active -= 1
+
+
+@pytest.fixture
+def container():
+    container_client = FakeContainerClient()
+
+    @contextlib.asynccontextmanager
+    async def fake_storage_client(container: str):
+        yield container_client
+
+    with patch("api.agent.storage.get_storage_client", fake_storage_client):
+        yield container_client
+
+
+class TestSaveImageBlobs:
+
+    @pytest.mark.asyncio
+    async def test_uploads_are_concurrent_and_bounded(self, container):
+        images = [base64.b64encode(f"image {i}".encode()).decode() for i in range(8)]
+
+        names = [name async for name in save_image_blobs(images)]
+
+        assert len(names) == 8
+        assert all(name.startswith("images/") for name in names)
+        assert sorted(container.blobs.values()) == sorted(
+            f"image {i}".encode() for i in range(8)
+        )
+        assert 1 < container.max_active <= 4
+
+
+class FakeBlobClient:
+    def __init__(self, container: "FakeContainerClient", name: str):
+        self.container = container
+        self.name = name
+        self.staged: dict[str, bytes] = {}
+
+    async def stage_block(self, block_id: str, data: bytes):
+        self.container.active += 1
+        self.container.max_active = max(self.container.max_active, self.container.active)
+        await asyncio.sleep(0.01)
+        self.staged[block_id] = data
+        self.container.active -= 1
+
+    async def commit_block_list(self, block_list, content_settings=None):
+        self.container.blobs[self.name] = b"".join(
+            self.staged[block.id] for block in block_list
+        )
+
+
+class TestSaveVideoBlob:
+
+    @pytest.mark.asyncio
+    async def test_streams_blocks_in_order(self, container):
+        container.get_blob_client = lambda name: FakeBlobClient(container, name)
+        video = bytes(range(256)) * 1000
+
+        reader = StreamReader(Mock(), limit=2**16)
+        reader.feed_data(video)
+        reader.feed_eof()
+
+        with patch("api.agent.storage.UPLOAD_BLOCK_SIZE", 10_000):
+            blob_name = await save_video_blob(reader)
+
+        assert blob_name.startswith("videos/")
+        assert container.blobs[blob_name] == video
+        assert 1 < container.max_active <= 4
+
+
+class FakeServiceClient:
+    def __init__(self):
+        self.key_requests = 0
+
+    async def get_user_delegation_key(self, key_start_time, key_expiry_time):
+        self.key_requests += 1
+        key = UserDelegationKey()
+        key.signed_oid = "oid"
+        key.signed_tid = "tid"
+        key.signed_start = key_start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        key.signed_expiry = key_expiry_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        key.signed_service = "b"
+        key.signed_version = "2025-01-05"
+        key.value = base64.b64encode(b"secret").decode()
+        return key
+
+
+class TestSignedUrls:
+
+    @pytest.fixture
+    def signer(self):
+        clients = StorageClientManager("https://account.blob.core.windows.net")
+        service_client = FakeServiceClient()
+        clients.get_service_client = lambda: service_client  # type: ignore
+        clients.get_container_client = lambda container: ContainerClient(  # type: ignore
+            "https://account.blob.core.windows.net", container
+        )
+        return SignedUrlCache(clients, ttl=timedelta(minutes=20))
+
+    @pytest.mark.asyncio
+    async def test_urls_are_cached_until_near_expiry(self, signer):
+        url = await signer.get_url("sustineo", "images/a.png")
+        assert url.startswith(
+            "https://account.blob.core.windows.net/sustineo/images/a.png?"
+        )
+        assert "sp=r" in url and "skoid=oid" in url
+
+        assert await signer.get_url("sustineo", "images/a.png") == url
+        assert signer.clients.get_service_client().key_requests == 1
+
+        # close to expiry, a fresh url is signed with the cached key
+        key = "sustineo/images/a.png"
+        signer.urls[key] = ("stale", datetime.now(timezone.utc) + timedelta(minutes=1))
+        assert await signer.get_url("sustineo", "images/a.png") != "stale"
+        assert signer.urls[key][1] > datetime.now(timezone.utc) + timedelta(minutes=15)
+        assert signer.clients.get_service_client().key_requests == 1
+
+
+class FakeCredential:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeManagedServiceClient:
+    def __init__(self, account_url, credential, transport, **kwargs):
+        self.transport = transport
+        self.session = transport.session
+        self.closed = False
+
+    def get_container_client(self, container: str):
+        return ContainerClient("https://account.blob.core.windows.net", container)
+
+    async def close(self):
+        # closes the aiohttp session the transport owns
+        await self.transport.close()
+        self.closed = True
+
+
+@pytest.fixture
+def managed():
+    with (
+        patch("api.agent.storage.DefaultAzureCredential", FakeCredential),
+        patch("api.agent.storage.BlobServiceClient", FakeManagedServiceClient),
+    ):
+        yield StorageClientManager("https://account.blob.core.windows.net")
+
+
+class TestStorageClientManager:
+
+    @pytest.mark.asyncio
+    async def test_clients_are_reused(self, managed):
+        service_client = managed.get_service_client()
+        container_client = managed.get_container_client("sustineo")
+
+        assert managed.get_service_client() is service_client
+        assert managed.get_container_client("sustineo") is container_client
+        assert managed.get_container_client("other") is not container_client
+
+        await managed.close()
+
+    @pytest.mark.asyncio
+    async def test_close(self, managed):
+        # as the application's lifespan does on shutdown
+        service_client = managed.get_service_client()
+        credential = managed.credential
+        await managed.close()
+
+        assert service_client.closed and credential.closed
+        assert service_client.session.closed
+        assert managed.service_client is None and managed.container_clients == {}
+        # the next request starts over
+        assert managed.get_service_client() is not service_client
+        await managed.close()
+
+    @pytest.mark.asyncio
+    async def test_new_loop_closes_old_clients(self, managed):
+        service_client = managed.get_service_client()
+        credential = managed.credential
+
+        # as if created on a loop that is no longer running
+        loop = asyncio.new_event_loop()
+        managed.loop = loop
+        try:
+            assert managed.get_service_client() is not service_client
+            await asyncio.wait(managed.closing)
+        finally:
+            loop.close()
+
+        assert service_client.closed and credential.closed
+        await managed.close()
+
+    @pytest.mark.asyncio
+    async def test_running_loop_closes_its_own_clients(self, managed):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            # clients created on the other (still running) loop
+            service_client, credential = await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.create(managed), loop)
+            )
+            managed.get_service_client()
+            await wait_for_closed(service_client)
+
+            assert credential.closed
+            assert managed.loop is asyncio.get_running_loop()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        await managed.close()
+
+    @staticmethod
+    async def create(managed):
+        return managed.get_service_client(), managed.credential
+
+
+async def wait_for_closed(client, timeout: float = 2.0):
+    async with asyncio.timeout(timeout):
+        while not client.closed:
+            await asyncio.sleep(0.01)
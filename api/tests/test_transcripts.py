@@ -0,0 +1,149 @@
+"""
+Unit tests for write-behind transcript persistence.
+"""
+
+import asyncio
+from typing import cast
+from unittest.mock import patch
+
+import pytest
+
+from api.voice.transcripts import ThreadMessage, TranscriptWriter
+
+
+class FakeTranscriptWriter(TranscriptWriter):
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        super().__init__(flush_interval=0.01, max_attempts=3, retry_delay=0.001)
+        self.failures = failures
+        self.delay = delay
+        self.messages: list[tuple[str, str]] = []
+
+    async def create_message(self, thread_id: str, message: ThreadMessage):
+        await asyncio.sleep(self.delay)
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("foundry unavailable")
+        self.messages.append((thread_id, message.content))
+
+
+class TestTranscriptWriter:
+
+    @pytest.mark.asyncio
+    async def test_write_does_not_wait(self):
+        writer = FakeTranscriptWriter(delay=1)
+        writer.write("thread", role="user", content="hello")
+        assert writer.messages == []
+        assert writer.metrics()["pending"] == 1
+        await writer.close(timeout=0)
+
+    @pytest.mark.asyncio
+    async def test_ordered_per_thread(self):
+        writer = FakeTranscriptWriter()
+        for i in range(5):
+            writer.write("a", role="user", content=f"a{i}")
+            writer.write("b", role="user", content=f"b{i}")
+
+        assert await writer.drain("a")
+        assert await writer.drain("b")
+        assert [c for t, c in writer.messages if t == "a"] == [f"a{i}" for i in range(5)]
+        assert [c for t, c in writer.messages if t == "b"] == [f"b{i}" for i in range(5)]
+        assert writer.queues == {} and writer.tasks == {}
+
+    @pytest.mark.asyncio
+    async def test_retries_keep_order(self):
+        writer = FakeTranscriptWriter(failures=2)
+        writer.write("a", role="user", content="first")
+        writer.write("a", role="assistant", content="second")
+
+        assert await writer.drain("a")
+        assert writer.messages == [("a", "first"), ("a", "second")]
+        assert writer.metrics() == {"pending": 0, "written": 2, "retried": 2, "failed": 0}
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_attempts(self):
+        writer = FakeTranscriptWriter(failures=3)
+        writer.write("a", role="user", content="lost")
+        writer.write("a", role="user", content="kept")
+
+        assert await writer.drain("a")
+        assert writer.messages == [("a", "kept")]
+        assert writer.metrics()["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_write_after_flush_starts_new_task(self):
+        writer = FakeTranscriptWriter()
+        writer.write("a", role="user", content="one")
+        assert await writer.drain("a")
+
+        writer.write("a", role="user", content="two")
+        await writer.close()
+        assert writer.messages == [("a", "one"), ("a", "two")]
+
+    @pytest.mark.asyncio
+    async def test_drain_timeout(self):
+        writer = FakeTranscriptWriter(delay=1)
+        writer.write("a", role="user", content="slow")
+        assert not await writer.drain("a", timeout=0.01)
+        await writer.close(timeout=0)
+
+    @pytest.mark.asyncio
+    async def test_waits_for_thread_creation(self):
+        async def create_thread():
+            await asyncio.sleep(0.02)
+            return "thread_123"
+
+        writer = FakeTranscriptWriter()
+        thread = asyncio.create_task(create_thread())
+        writer.write(thread, role="user", content="early")
+        writer.write(thread, role="user", content="later")
+
+        assert await writer.drain(thread)
+        assert writer.messages == [("thread_123", "early"), ("thread_123", "later")]
+
+    @pytest.mark.asyncio
+    async def test_failed_thread_creation(self):
+        async def create_thread():
+            raise ConnectionError("foundry unavailable")
+
+        writer = FakeTranscriptWriter()
+        thread = asyncio.create_task(create_thread())
+        writer.write(thread, role="user", content="lost")
+
+        assert await writer.drain(thread)
+        assert writer.messages == []
+        assert writer.metrics()["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_new_loop_closes_old_client(self):
+        class FakeClient:
+            def __init__(self):
+                self.closed = False
+
+            async def close(self):
+                self.closed = True
+
+        class FakeProjectClient(FakeClient):
+            @staticmethod
+            def from_connection_string(conn_str, credential):
+                return FakeProjectClient()
+
+        with (
+            patch("api.voice.transcripts.DefaultAzureCredential", FakeClient),
+            patch("api.voice.transcripts.AIProjectClient", FakeProjectClient),
+        ):
+            writer = TranscriptWriter()
+            project_client = cast(FakeProjectClient, writer.get_project_client())
+            credential = cast(FakeClient, writer.credential)
+            assert writer.get_project_client() is project_client
+
+            # as if created on a loop that is no longer running
+            loop = asyncio.new_event_loop()
+            writer.loop = loop
+            try:
+                assert writer.get_project_client() is not project_client
+                await asyncio.wait(writer.closing)
+            finally:
+                loop.close()
+
+            assert project_client.closed and credential.closed
+            await writer.close()
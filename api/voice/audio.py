@@ -0,0 +1,233 @@
+import os
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Literal, Union
+
+try:
+    # optional, the local vad gate is disabled without it
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+# realtime input audio is 24kHz mono pcm16
+INPUT_SAMPLE_RATE = 24000
+
+# client audio is appended upstream in chunks of this duration (0 sends
+# whatever has arrived), never held longer than one chunk window
+INPUT_APPEND_MS = int(os.getenv("VOICE_INPUT_APPEND_MS", "100"))
+# appends waiting on the upstream socket. past this, audio keeps
+# collecting in the buffer, up to VOICE_INPUT_BUFFER_MS of it
+INPUT_QUEUE_SIZE = int(os.getenv("VOICE_INPUT_QUEUE_SIZE", "32"))
+INPUT_BUFFER_MS = int(os.getenv("VOICE_INPUT_BUFFER_MS", "10000"))
+
+# drop silent microphone audio before it goes upstream
+LOCAL_VAD = os.getenv("VOICE_LOCAL_VAD", "false").lower() == "true"
+# frames quieter than this (rms, dB relative to full scale) are silence
+LOCAL_VAD_THRESHOLD_DB = float(os.getenv("VOICE_LOCAL_VAD_THRESHOLD_DB", "-50"))
+# silence kept in front of speech, so onsets aren't clipped
+LOCAL_VAD_PADDING_MS = int(os.getenv("VOICE_LOCAL_VAD_PADDING_MS", "300"))
+LOCAL_VAD_FRAME_MS = 20
+
+# the longest a semantic_vad turn can stay open on silence, by eagerness
+SEMANTIC_VAD_TIMEOUT_MS = {"low": 8000, "medium": 4000, "auto": 4000, "high": 2000}
+
+
+def trailing_silence_ms(
+    detection_type: Literal["semantic_vad", "server_vad"],
+    silence_duration_ms: int = 500,
+    eagerness: str = "auto",
+) -> int:
+    """
+    Silence to keep sending after speech so the upstream turn detection
+    still sees the end of the turn.
+    """
+    if detection_type == "semantic_vad":
+        return SEMANTIC_VAD_TIMEOUT_MS.get(eagerness, 4000)
+    return silence_duration_ms + LOCAL_VAD_PADDING_MS
+
+
+class EnergyGate:
+    """
+    Energy based voice activity gate for pcm16 input audio. Audio is cut
+    into short frames and the rms level of all of them is computed in one
+    vectorized pass. Speech frames pass, as do ``padding_ms`` of silence
+    before speech and ``trailing_ms`` after it; the rest of the silence is
+    dropped.
+    """
+
+    def __init__(
+        self,
+        trailing_ms: int,
+        padding_ms: int = LOCAL_VAD_PADDING_MS,
+        threshold_db: float = LOCAL_VAD_THRESHOLD_DB,
+        frame_ms: int = LOCAL_VAD_FRAME_MS,
+        sample_rate: int = INPUT_SAMPLE_RATE,
+    ):
+        if np is None:
+            raise RuntimeError("numpy is required for the local vad gate")
+
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        # pcm16 full scale, squared, so levels compare without a sqrt/log
+        self.threshold = (32768.0 * 10 ** (threshold_db / 20)) ** 2
+        self.padding: deque[bytes] = deque(maxlen=padding_ms // frame_ms)
+        self.trailing_frames = trailing_ms // frame_ms
+        self.hangover = 0
+        self.remainder = b""
+
+        # metrics
+        self.received = 0
+        self.sent = 0
+
+    def process(self, audio: bytes) -> bytes:
+        """
+        Return the part of ``audio`` that should go upstream (possibly
+        empty). Partial frames are held until the next call.
+        """
+        data = self.remainder + audio
+        whole = len(data) - len(data) % self.frame_bytes
+        self.remainder = data[whole:]
+        if whole == 0:
+            return b""
+
+        samples = np.frombuffer(data[:whole], dtype="<i2").astype(np.float32)
+        frames = samples.reshape(-1, self.frame_bytes // 2)
+        speech = np.mean(frames * frames, axis=1) > self.threshold
+
+        self.received += whole
+        if self.hangover == 0 and not speech.any():
+            # the common case, nothing but silence. only the tail
+            # can end up as padding
+            start = max(0, len(speech) - (self.padding.maxlen or 0))
+            for i in range(start, len(speech)):
+                self.padding.append(
+                    data[i * self.frame_bytes : (i + 1) * self.frame_bytes]
+                )
+            return b""
+
+        output = bytearray()
+        for i, is_speech in enumerate(speech.tolist()):
+            frame = data[i * self.frame_bytes : (i + 1) * self.frame_bytes]
+            if is_speech:
+                # speech (re)starts, send the silence leading into it
+                output += b"".join(self.padding)
+                self.padding.clear()
+                output += frame
+                self.hangover = self.trailing_frames
+            elif self.hangover > 0:
+                output += frame
+                self.hangover -= 1
+            else:
+                self.padding.append(frame)
+
+        self.sent += len(output)
+        return bytes(output)
+
+    def metrics(self) -> dict[str, int]:
+        return {"received_bytes": self.received, "sent_bytes": self.sent}
+
+
+class InputAudioBuffer:
+    """
+    Sits between the client and the upstream realtime socket. Client
+    audio of any chunk size is collected and cut into appends of
+    ``chunk_ms``. A partial chunk is sent once it is ``chunk_ms`` old.
+    Appends go through a bounded queue to a sender task, so a slow
+    upstream write never blocks reading from the client. While the queue
+    is full, audio keeps collecting in the buffer. Beyond
+    ``max_buffer_ms`` the oldest audio is dropped.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[bytes], Awaitable[None]],
+        chunk_ms: int = INPUT_APPEND_MS,
+        max_chunks: int = INPUT_QUEUE_SIZE,
+        max_buffer_ms: int = INPUT_BUFFER_MS,
+        sample_rate: int = INPUT_SAMPLE_RATE,
+        sample_width: int = 2,
+    ):
+        self.send = send
+        self.chunk_ms = chunk_ms
+        self.sample_width = sample_width
+        self.chunk_bytes = sample_rate * chunk_ms // 1000 * sample_width
+        self.max_buffer_bytes = sample_rate * max_buffer_ms // 1000 * sample_width
+        self.buffer = bytearray()
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(max_chunks)
+        self.timer: Union[asyncio.TimerHandle, None] = None
+        self.sender: Union[asyncio.Task, None] = None
+        self.closed = False
+
+        # metrics
+        self.received = 0
+        self.appends = 0
+        self.dropped = 0
+
+    def add(self, audio: bytes):
+        if self.closed:
+            return
+        if self.sender is None:
+            self.sender = asyncio.create_task(self.run())
+
+        self.received += len(audio)
+        self.buffer += audio
+        self.move(partial=self.chunk_bytes == 0)
+
+        if len(self.buffer) > self.max_buffer_bytes:
+            # upstream is too far behind, keep the most recent audio
+            excess = len(self.buffer) - self.max_buffer_bytes
+            excess += -excess % self.sample_width
+            del self.buffer[:excess]
+            if self.dropped == 0:
+                print("Upstream is falling behind, dropping input audio")
+            self.dropped += excess
+
+        if len(self.buffer) > 0 and self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(
+                self.chunk_ms / 1000, self.flush
+            )
+
+    def move(self, partial: bool = False):
+        # whole chunks (or, when partial, whatever is left) to the queue
+        while len(self.buffer) > 0 and not self.queue.full():
+            if len(self.buffer) >= self.chunk_bytes > 0:
+                size = self.chunk_bytes
+            elif partial:
+                size = len(self.buffer)
+            else:
+                break
+
+            self.queue.put_nowait(bytes(self.buffer[:size]))
+            del self.buffer[:size]
+
+    def flush(self):
+        self.timer = None
+        self.move(partial=True)
+
+    async def run(self):
+        try:
+            while True:
+                chunk = await self.queue.get()
+                await self.send(chunk)
+                self.appends += 1
+                # room again, a partial chunk is overdue once its timer fired
+                self.move(partial=self.timer is None)
+        except Exception as e:
+            print(f"Error sending input audio: {e}")
+            self.closed = True
+
+    def close(self):
+        # input audio is meaningless once the session ends
+        self.closed = True
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.sender is not None:
+            self.sender.cancel()
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "received_bytes": self.received,
+            "appends": self.appends,
+            "queued": self.queue.qsize(),
+            "dropped_bytes": self.dropped,
+        }
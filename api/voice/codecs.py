@@ -0,0 +1,264 @@
+import os
+import struct
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Literal, Union
+
+from api.voice.audio import INPUT_SAMPLE_RATE, np
+
+try:
+    # optional, needs the native libopus library as well
+    import opuslib  # type: ignore
+except Exception:  # pragma: no cover
+    opuslib = None
+
+AudioFormat = Literal["pcm16", "g711_ulaw", "g711_alaw", "opus"]
+UpstreamFormat = Literal["pcm16", "g711_ulaw", "g711_alaw"]
+
+# opus encoding and decoding runs on these threads (ctypes releases the
+# GIL for the duration of each libopus call)
+AUDIO_WORKERS = int(os.getenv("VOICE_AUDIO_WORKERS", "4"))
+OPUS_FRAME_MS = 20
+OPUS_BITRATE = int(os.getenv("VOICE_OPUS_BITRATE", "24000"))
+
+_executor: Union[ThreadPoolExecutor, None] = None
+
+
+def get_audio_workers() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=AUDIO_WORKERS, thread_name_prefix="audio-codec"
+        )
+    return _executor
+
+
+def shutdown_audio_workers():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class Resampler:
+    """
+    Streaming linear interpolation between two sample rates for mono
+    pcm16. The position of the next output sample carries over between
+    chunks, so chunk boundaries don't click.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int):
+        self.step = from_rate / to_rate
+        self.offset = 0.0
+        self.last: Union[float, None] = None
+
+    def process(self, audio: bytes) -> bytes:
+        samples = np.frombuffer(audio, dtype="<i2").astype(np.float32)
+        if len(samples) == 0:
+            return b""
+        if self.last is not None:
+            # index 0 is the last sample of the previous chunk
+            samples = np.concatenate(([self.last], samples))
+
+        end = len(samples) - 1
+        if end < self.offset:
+            self.offset -= end
+            self.last = float(samples[-1])
+            return b""
+
+        count = int((end - self.offset) // self.step) + 1
+        positions = self.offset + self.step * np.arange(count)
+        output = np.interp(positions, np.arange(len(samples)), samples)
+
+        self.offset = self.offset + self.step * count - end
+        self.last = float(samples[-1])
+        return np.round(output).astype("<i2").tobytes()
+
+
+class AudioCodec:
+    """
+    Audio exchanged with a voice client. The base codec is pcm16 at the
+    realtime api's own rate, passed through untouched. ``decode`` turns
+    client audio into upstream audio, ``encode`` the reverse.
+    """
+
+    name: AudioFormat = "pcm16"
+    upstream_format: UpstreamFormat = "pcm16"
+    upstream_rate = INPUT_SAMPLE_RATE
+    upstream_width = 2
+
+    def __init__(self, sample_rate: int = INPUT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+
+    async def decode(self, audio: bytes) -> bytes:
+        return audio
+
+    async def encode(self, audio: bytes) -> bytes:
+        return audio
+
+    async def finish(self) -> bytes:
+        """Encode what ``encode`` still holds back, at the end of a response."""
+        return b""
+
+    def reset(self):
+        """Forget what ``encode`` holds back, the client stopped playback."""
+        pass
+
+    def settings(self) -> dict[str, Any]:
+        return {"audio_format": self.name, "sample_rate": self.sample_rate}
+
+
+class G711Codec(AudioCodec):
+    """
+    G.711 (8kHz, 8 bit) passed straight through, the realtime api takes
+    and produces it natively.
+    """
+
+    upstream_rate = 8000
+    upstream_width = 1
+
+    def __init__(self, format: Literal["g711_ulaw", "g711_alaw"]):
+        super().__init__(sample_rate=8000)
+        self.name = format
+        self.upstream_format = format
+
+
+class ResamplingCodec(AudioCodec):
+    """
+    pcm16 at the client's native sample rate, resampled to and from the
+    realtime rate.
+    """
+
+    def __init__(self, sample_rate: int):
+        super().__init__(sample_rate=sample_rate)
+        self.inbound = Resampler(sample_rate, INPUT_SAMPLE_RATE)
+        self.outbound = Resampler(INPUT_SAMPLE_RATE, sample_rate)
+
+    async def decode(self, audio: bytes) -> bytes:
+        return self.inbound.process(audio)
+
+    async def encode(self, audio: bytes) -> bytes:
+        return self.outbound.process(audio)
+
+
+def pack_packets(packets: list[bytes]) -> bytes:
+    # several opus packets per message, each with a 2 byte length prefix
+    return b"".join(struct.pack(">H", len(p)) + p for p in packets)
+
+
+def unpack_packets(data: bytes) -> list[bytes]:
+    packets: list[bytes] = []
+    position = 0
+    while position + 2 <= len(data):
+        (size,) = struct.unpack_from(">H", data, position)
+        packets.append(data[position + 2 : position + 2 + size])
+        position += 2 + size
+    return packets
+
+
+class OpusCodec(AudioCodec):
+    """
+    Opus at the realtime rate, encoded and decoded on the audio worker
+    threads. Messages carry length prefixed 20ms packets (see
+    pack_packets). Outbound audio that doesn't fill the last packet waits
+    for the next write; only finish() pads it with silence.
+    """
+
+    name: AudioFormat = "opus"
+
+    def __init__(self):
+        super().__init__(sample_rate=INPUT_SAMPLE_RATE)
+        self.frame_samples = INPUT_SAMPLE_RATE * OPUS_FRAME_MS // 1000
+        self.encoder = opuslib.Encoder(INPUT_SAMPLE_RATE, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = OPUS_BITRATE
+        self.decoder = opuslib.Decoder(INPUT_SAMPLE_RATE, 1)
+        # outbound audio short of a whole packet
+        self.pending = b""
+        # the encoder and decoder are stateful, keep each one in order
+        self.encode_lock = asyncio.Lock()
+        self.decode_lock = asyncio.Lock()
+
+    def decode_packets(self, data: bytes) -> bytes:
+        return b"".join(
+            # the largest opus frame is 120ms
+            self.decoder.decode(packet, self.frame_samples * 6)
+            for packet in unpack_packets(data)
+        )
+
+    def encode_packets(self, audio: bytes) -> bytes:
+        frame_bytes = self.frame_samples * 2
+        audio = self.pending + audio
+        whole = len(audio) - len(audio) % frame_bytes
+        audio, self.pending = audio[:whole], audio[whole:]
+
+        return pack_packets(
+            [
+                self.encoder.encode(audio[i : i + frame_bytes], self.frame_samples)
+                for i in range(0, len(audio), frame_bytes)
+            ]
+        )
+
+    def finish_packets(self) -> bytes:
+        if len(self.pending) == 0:
+            return b""
+        frame_bytes = self.frame_samples * 2
+        audio = self.pending + bytes(frame_bytes - len(self.pending))
+        self.pending = b""
+        return pack_packets([self.encoder.encode(audio, self.frame_samples)])
+
+    async def decode(self, audio: bytes) -> bytes:
+        async with self.decode_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_audio_workers(), self.decode_packets, audio
+            )
+
+    async def encode(self, audio: bytes) -> bytes:
+        async with self.encode_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_audio_workers(), self.encode_packets, audio
+            )
+
+    async def finish(self) -> bytes:
+        async with self.encode_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(get_audio_workers(), self.finish_packets)
+
+    def reset(self):
+        self.pending = b""
+
+
+def supported_formats() -> list[AudioFormat]:
+    formats: list[AudioFormat] = ["pcm16", "g711_ulaw", "g711_alaw"]
+    if opuslib is not None:
+        formats.append("opus")
+    return formats
+
+
+def negotiate_codec(settings: dict[str, Any]) -> AudioCodec:
+    """
+    Pick the client's most preferred audio format that is supported
+    here, from ``audio_formats`` (or a single ``audio_format``) and
+    ``sample_rate`` in its settings. Falls back to pcm16 at 24kHz.
+    """
+    if "audio_formats" in settings:
+        requested = list(settings["audio_formats"])
+    else:
+        requested = [settings["audio_format"] if "audio_format" in settings else "pcm16"]
+    sample_rate = int(settings["sample_rate"]) if "sample_rate" in settings else None
+
+    for format in requested:
+        match format:
+            case "pcm16":
+                if sample_rate is None or sample_rate == INPUT_SAMPLE_RATE:
+                    return AudioCodec()
+                if np is not None and 8000 <= sample_rate <= 96000:
+                    return ResamplingCodec(sample_rate)
+            case "g711_ulaw" | "g711_alaw":
+                return G711Codec(format)
+            case "opus":
+                if opuslib is not None:
+                    return OpusCodec()
+
+    return AudioCodec()
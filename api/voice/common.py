@@ -163,28 +163,38 @@ def convert_function_params(params: list[dict]) -> dict:
         "required": [p["name"] for p in params if p["required"]],
     }
 
+@trace
+def configuration_tools(config: Configuration) -> list[SessionTool]:
+    tools: list[SessionTool] = []
+    if config.tools is not None and len(config.tools) > 0:
+        for tool in config.tools:
+            tools.append(
+                SessionTool(
+                    type="function",
+                    name=tool["name"].strip().lower().replace(" ", "_"),
+                    description=(
+                        tool["description"]
+                        if "description" in tool
+                        else "No Description"
+                    ),
+                    parameters=convert_function_params(tool["parameters"]),
+                )
+            )
+    return tools
+
+
+async def render_configuration(config: Configuration, **args) -> DefaultConfiguration:
+    p = load_prompty(config.content)
+    msgs = await prompty.prepare_async(p, inputs={**args})
+    system_message = msgs[0]["content"] if len(msgs) > 0 else ""
+    return DefaultConfiguration(
+        system_message=system_message, tools=configuration_tools(config)
+    )
+
+
 @trace
 async def get_default_configuration_data(**args) -> Union[DefaultConfiguration, None]:
     config = await get_default_configuration()
     if config:
-        p = load_prompty(config.content)
-        msgs = await prompty.prepare_async(p, inputs={**args})
-        system_message = msgs[0]["content"] if len(msgs) > 0 else ""
-        tools: list[SessionTool] = []
-        if config.tools is not None and len(config.tools) > 0:
-            for tool in config.tools:
-                tools.append(
-                    SessionTool(
-                        type="function",
-                        name=tool["name"].strip().lower().replace(" ", "_"),
-                        description=(
-                            tool["description"]
-                            if "description" in tool
-                            else "No Description"
-                        ),
-                        parameters=convert_function_params(tool["parameters"]),
-                    )
-                )
-
-        return DefaultConfiguration(system_message=system_message, tools=tools)
+        return await render_configuration(config, **args)
     return None
@@ -0,0 +1,227 @@
+import os
+import math
+import time
+import bisect
+from dataclasses import dataclass
+from typing import Any, Awaitable, TypeVar, Union
+
+from opentelemetry import trace as oteltrace
+
+T = TypeVar("T")
+
+
+class SetupTimer:
+    """
+    Per-step timings for setting up a voice session. Steps can overlap,
+    so each step records its own duration and the report adds the total
+    time since the client connected.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps: dict[str, float] = {}
+
+    async def time(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.steps[name] = (time.perf_counter() - start) * 1000
+
+    @property
+    def elapsed(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def report(self) -> dict[str, float]:
+        return {
+            **{name: round(ms, 1) for name, ms in self.steps.items()},
+            "total": round(self.elapsed, 1),
+        }
+
+    def __str__(self) -> str:
+        return ", ".join(f"{name}={ms}ms" for name, ms in self.report().items())
+
+
+# turns slower than this (speech stopped to first audio written to the
+# client) leave a trace span and an exemplar in their histogram bucket.
+# 0 disables exemplars
+VOICE_SLOW_TURN_MS = float(os.getenv("VOICE_SLOW_TURN_MS", "0"))
+
+# histogram bucket upper bounds in ms, the last bucket is unbounded
+TURN_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# a turn's timestamps, in the order they normally arrive
+TURN_MARKS = (
+    "speech_stopped",
+    "committed",
+    "response_created",
+    "first_audio",
+    "first_write",
+    "response_done",
+)
+
+# stages reported per turn: (name, from mark, to mark). a stage is only
+# observed when both marks were seen
+TURN_STAGES = (
+    # upstream turn detection and commit
+    ("commit", "speech_stopped", "committed"),
+    ("response", "committed", "response_created"),
+    # upstream model latency
+    ("first_audio", "response_created", "first_audio"),
+    # our own event loop and send queue
+    ("forward", "first_audio", "first_write"),
+    # what the user waits for, as far as the server can see
+    ("first_write", "speech_stopped", "first_write"),
+    ("done", "speech_stopped", "response_done"),
+)
+
+
+class Histogram:
+    """
+    Cumulative bucketed durations in ms, with the latest exemplar per
+    bucket.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = TURN_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.exemplars: dict[int, dict[str, Any]] = {}
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, ms: float, exemplar: Union[dict[str, Any], None] = None):
+        index = bisect.bisect_left(self.buckets, ms)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += ms
+        if exemplar is not None:
+            self.exemplars[index] = {"ms": round(ms, 1), **exemplar}
+
+    def percentile(self, p: float) -> Union[float, None]:
+        # upper bound of the bucket holding the p-th percentile
+        if self.count == 0:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                return self.buckets[index] if index < len(self.buckets) else math.inf
+        return math.inf
+
+    def report(self) -> dict[str, Any]:
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        percentiles = {f"p{p}": self.percentile(p) for p in (50, 95, 99)}
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 1),
+            # json has no infinity
+            **{k: "+Inf" if v == math.inf else v for k, v in percentiles.items()},
+            "buckets": dict(zip(bounds, self.counts)),
+            "exemplars": {bounds[i]: e for i, e in sorted(self.exemplars.items())},
+        }
+
+
+@dataclass(slots=True)
+class TurnTimer:
+    """
+    perf_counter timestamps of one turn, from speech stopping to the
+    response being done.
+    """
+
+    speech_stopped: Union[float, None] = None
+    committed: Union[float, None] = None
+    response_created: Union[float, None] = None
+    first_audio: Union[float, None] = None
+    first_write: Union[float, None] = None
+    response_done: Union[float, None] = None
+
+    def mark(self, name: str):
+        # only the first occurrence counts
+        if getattr(self, name) is None:
+            setattr(self, name, time.perf_counter())
+
+    def stages(self) -> dict[str, float]:
+        stages: dict[str, float] = {}
+        for name, start, end in TURN_STAGES:
+            start_at, end_at = getattr(self, start), getattr(self, end)
+            if start_at is not None and end_at is not None:
+                stages[name] = (end_at - start_at) * 1000
+        return stages
+
+
+class TurnMetrics:
+    """
+    Per-stage turn latency histograms by configuration and by voice.
+    """
+
+    def __init__(self, slow_turn_ms: float = VOICE_SLOW_TURN_MS):
+        self.slow_turn_ms = slow_turn_ms
+        self.configurations: dict[str, dict[str, Histogram]] = {}
+        self.voices: dict[str, dict[str, Histogram]] = {}
+
+    def record(
+        self,
+        turn: TurnTimer,
+        configuration: str,
+        voice: str,
+        attributes: dict[str, str] = {},
+    ):
+        stages = turn.stages()
+        if len(stages) == 0:
+            return
+
+        exemplar = None
+        slow = stages.get("first_write", stages.get("done", 0.0))
+        if self.slow_turn_ms > 0 and slow >= self.slow_turn_ms:
+            exemplar = self.exemplar(
+                turn, stages, {"configuration": configuration, "voice": voice, **attributes}
+            )
+
+        for name, ms in stages.items():
+            for histograms in (
+                self.configurations.setdefault(configuration, {}),
+                self.voices.setdefault(voice, {}),
+            ):
+                if name not in histograms:
+                    histograms[name] = Histogram()
+                histograms[name].observe(ms, exemplar)
+
+    def exemplar(
+        self, turn: TurnTimer, stages: dict[str, float], attributes: dict[str, str]
+    ) -> dict[str, Any]:
+        # a span covering the slow turn, backdated to its first mark
+        now, now_ns = time.perf_counter(), time.time_ns()
+        start = min(getattr(turn, m) for m in TURN_MARKS if getattr(turn, m) is not None)
+        tracer = oteltrace.get_tracer("prompty")
+        span = tracer.start_span(
+            "voice.turn",
+            start_time=now_ns - int((now - start) * 1e9),
+            attributes={
+                **attributes,
+                **{f"turn.{name}_ms": round(ms, 1) for name, ms in stages.items()},
+            },
+        )
+        span.end(end_time=now_ns)
+
+        context = span.get_span_context()
+        exemplar: dict[str, Any] = dict(attributes)
+        if context.is_valid:
+            exemplar["trace_id"] = format(context.trace_id, "032x")
+            exemplar["span_id"] = format(context.span_id, "016x")
+        return exemplar
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "configurations": {
+                key: {name: h.report() for name, h in stages.items()}
+                for key, stages in self.configurations.items()
+            },
+            "voices": {
+                key: {name: h.report() for name, h in stages.items()}
+                for key, stages in self.voices.items()
+            },
+        }
+
+
+turn_metrics = TurnMetrics()
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import contextlib
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncContextManager, AsyncGenerator, Awaitable, Callable, Union
+from openai import AsyncAzureOpenAI
+from openai.resources.beta.realtime.realtime import AsyncRealtimeConnection
+
+AZURE_VOICE_ENDPOINT = os.getenv("AZURE_VOICE_ENDPOINT") or ""
+AZURE_VOICE_KEY = os.getenv("AZURE_VOICE_KEY", "fake_key")
+AZURE_VOICE_MODEL = "gpt-4o-realtime-preview"
+# realtime websocket url override, e.g. a local stub for load tests
+AZURE_VOICE_WEBSOCKET_URL = os.getenv("AZURE_VOICE_WEBSOCKET_URL") or None
+
+# number of upstream realtime sessions kept connected ahead of users (0
+# disables the pool, the default when no realtime endpoint is set). idle
+# sessions are replaced after VOICE_POOL_MAX_AGE_SECONDS, well before the
+# service drops them
+VOICE_POOL_SIZE = int(
+    os.getenv(
+        "VOICE_POOL_SIZE",
+        "2" if AZURE_VOICE_ENDPOINT or AZURE_VOICE_WEBSOCKET_URL else "0",
+    )
+)
+VOICE_POOL_MAX_AGE_SECONDS = int(os.getenv("VOICE_POOL_MAX_AGE_SECONDS", "300"))
+VOICE_POOL_CHECK_SECONDS = 10.0
+# failed warming backs off from the check interval up to this
+VOICE_POOL_MAX_BACKOFF_SECONDS = 300.0
+
+RealtimeConnect = Callable[[], AsyncContextManager[AsyncRealtimeConnection]]
+# sends the session.update every pooled session starts with
+RealtimeConfigure = Callable[[AsyncRealtimeConnection], Awaitable[None]]
+
+_client: Union[AsyncAzureOpenAI, None] = None
+
+
+def connect_realtime() -> AsyncContextManager[AsyncRealtimeConnection]:
+    global _client
+    if _client is None:
+        _client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_VOICE_ENDPOINT,
+            api_key=AZURE_VOICE_KEY,
+            api_version="2025-04-01-preview",
+            websocket_base_url=AZURE_VOICE_WEBSOCKET_URL,
+        )
+    return _client.beta.realtime.connect(
+        model=AZURE_VOICE_MODEL, extra_query={"debug": "elvis"}
+    )
+
+
+@dataclass
+class PooledConnection:
+    connection: AsyncRealtimeConnection
+    stack: contextlib.AsyncExitStack
+    created: float
+
+
+class RealtimePool:
+    """
+    Upstream realtime sessions connected ahead of time, so a new voice
+    client skips the TLS and websocket handshakes and the wait for
+    ``session.created``. With ``configure``, pooled sessions also get the
+    configuration every user shares up front. Each session is handed out
+    once and closed when the voice client is done with it; the pool
+    refills in the background, backing off while warming fails.
+    """
+
+    def __init__(
+        self,
+        connect: RealtimeConnect = connect_realtime,
+        size: int = VOICE_POOL_SIZE,
+        max_age: float = VOICE_POOL_MAX_AGE_SECONDS,
+        check_interval: float = VOICE_POOL_CHECK_SECONDS,
+        configure: Union[RealtimeConfigure, None] = None,
+    ):
+        self.connect = connect
+        self.configure = configure
+        self.size = size
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.idle: deque[PooledConnection] = deque()
+        self.warming = 0
+        self.tasks: set[asyncio.Task] = set()
+        self.maintainer: Union[asyncio.Task, None] = None
+        self.closed = False
+        # consecutive warming failures, and when to try again
+        self.failures = 0
+        self.retry_at = 0.0
+
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.errors = 0
+
+    def start(self):
+        self.closed = False
+        self.fill()
+        if self.maintainer is None and self.size > 0:
+            self.maintainer = asyncio.create_task(self.maintain())
+
+    async def open(self, warm: bool) -> PooledConnection:
+        stack = contextlib.AsyncExitStack()
+        try:
+            connection = await stack.enter_async_context(self.connect())
+            if warm:
+                # every session starts with session.created, take it now
+                # rather than while a user waits
+                event = await connection.recv()
+                if event.type != "session.created":
+                    raise RuntimeError(f"Expected session.created, got {event.type}")
+                if self.configure is not None:
+                    await self.configure(connection)
+                    event = await connection.recv()
+                    if event.type != "session.updated":
+                        raise RuntimeError(f"Expected session.updated, got {event.type}")
+        except BaseException:
+            await stack.aclose()
+            raise
+
+        return PooledConnection(connection, stack, time.monotonic())
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def fill(self):
+        if time.monotonic() < self.retry_at:
+            return
+        while not self.closed and len(self.idle) + self.warming < self.size:
+            self.warming += 1
+            self.spawn(self.warm())
+
+    async def warm(self):
+        try:
+            pooled = await self.open(warm=True)
+        except Exception as e:
+            # a later check tries again, backing off while it keeps failing
+            self.errors += 1
+            self.failures += 1
+            backoff = min(
+                self.check_interval * 2**self.failures, VOICE_POOL_MAX_BACKOFF_SECONDS
+            )
+            self.retry_at = time.monotonic() + backoff
+            print(f"Error warming realtime connection, retrying in {backoff:.0f}s: {e}")
+            return
+        finally:
+            self.warming -= 1
+
+        self.failures = 0
+
+        if self.closed:
+            await pooled.stack.aclose()
+        else:
+            self.idle.append(pooled)
+
+    def expire(self):
+        now = time.monotonic()
+        while len(self.idle) > 0 and now - self.idle[0].created > self.max_age:
+            self.expired += 1
+            self.spawn(self.idle.popleft().stack.aclose())
+
+    async def maintain(self):
+        while not self.closed:
+            await asyncio.sleep(self.check_interval)
+            self.expire()
+            self.fill()
+
+    @contextlib.asynccontextmanager
+    async def connection(self) -> AsyncGenerator[AsyncRealtimeConnection, None]:
+        """
+        A realtime session for one voice client: a pooled one when
+        available, else a new connection. Closed on exit.
+        """
+        self.expire()
+        if len(self.idle) > 0:
+            self.hits += 1
+            pooled = self.idle.popleft()
+        else:
+            self.misses += 1
+            pooled = None
+
+        # replace what was just taken (or couldn't be)
+        self.fill()
+
+        if pooled is None:
+            pooled = await self.open(warm=False)
+
+        try:
+            yield pooled.connection
+        finally:
+            await pooled.stack.aclose()
+
+    async def close(self):
+        self.closed = True
+        if self.maintainer is not None:
+            self.maintainer.cancel()
+            self.maintainer = None
+
+        for task in list(self.tasks):
+            task.cancel()
+        if len(self.tasks) > 0:
+            await asyncio.wait(list(self.tasks))
+
+        while len(self.idle) > 0:
+            pooled = self.idle.popleft()
+            try:
+                await pooled.stack.aclose()
+            except Exception as e:
+                print(f"Error closing realtime connection: {e}")
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "idle": len(self.idle),
+            "warming": self.warming,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "errors": self.errors,
+        }
+
+
+realtime_pool = RealtimePool()
@@ -0,0 +1,287 @@
+import os
+import time
+import json
+import base64
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Literal, TextIO, Union, cast
+
+from fastapi.websockets import WebSocketState
+from openai._models import construct_type_unchecked
+from openai.types.beta.realtime import RealtimeServerEvent
+
+from api.connection import Connection
+
+# sessions are recorded to this directory when set (one jsonl file each)
+VOICE_RECORD_DIR = os.getenv("VOICE_RECORD_DIR")
+
+RecordSource = Literal["realtime", "client"]
+
+# a disconnect is recorded so a replay ends the session on time
+DISCONNECT = {"type": "websocket.disconnect"}
+
+
+@dataclass(slots=True)
+class RecordedEvent:
+    # seconds since the recording started
+    t: float
+    source: RecordSource
+    # a realtime event or client json message, or a binary client frame
+    data: Union[dict[str, Any], bytes]
+
+    def to_json(self) -> str:
+        if isinstance(self.data, bytes):
+            payload: dict[str, Any] = {"bytes": base64.b64encode(self.data).decode()}
+        else:
+            payload = {"event": self.data}
+        return json.dumps({"t": round(self.t, 6), "source": self.source, **payload})
+
+    @staticmethod
+    def from_json(line: str) -> "RecordedEvent":
+        item = json.loads(line)
+        if "bytes" in item:
+            data: Union[dict[str, Any], bytes] = base64.b64decode(item["bytes"])
+        else:
+            data = item["event"]
+        return RecordedEvent(t=item["t"], source=item["source"], data=data)
+
+
+class SessionRecorder:
+    """
+    Records what a RealtimeSession receives, upstream realtime events and
+    client messages, with their timing to a jsonl file that ReplaySession
+    can play back.
+    """
+
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.start = time.perf_counter()
+        self.count = 0
+
+    @staticmethod
+    def open(path: str) -> "SessionRecorder":
+        return SessionRecorder(open(path, "w", encoding="utf-8"))
+
+    def record(self, source: RecordSource, data: Union[dict[str, Any], bytes]):
+        if self.file.closed:
+            return
+        event = RecordedEvent(time.perf_counter() - self.start, source, data)
+        # buffered by the file, written out in blocks
+        self.file.write(event.to_json() + "\n")
+        self.count += 1
+
+    def record_realtime(self, event: Any):
+        self.record("realtime", event.model_dump(exclude_unset=True))
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def open_recorder(id: str) -> Union[SessionRecorder, None]:
+    if not VOICE_RECORD_DIR:
+        return None
+    os.makedirs(VOICE_RECORD_DIR, exist_ok=True)
+    path = os.path.join(VOICE_RECORD_DIR, f"{id}-{int(time.time())}.jsonl")
+    print(f"Recording voice session {id} to {path}")
+    return SessionRecorder.open(path)
+
+
+def load_recording(path: str) -> list[RecordedEvent]:
+    with open(path, encoding="utf-8") as file:
+        return [RecordedEvent.from_json(line) for line in file if line.strip()]
+
+
+class ReplayClock:
+    """
+    Shared schedule for a replay. ``speed`` scales the recorded timing
+    (2.0 plays twice as fast); 0 replays as fast as possible. Starts on
+    first use.
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.start: Union[float, None] = None
+
+    async def wait(self, t: float):
+        if self.speed <= 0:
+            # still yield, so the session's other tasks get to run
+            await asyncio.sleep(0)
+            return
+
+        loop = asyncio.get_running_loop()
+        if self.start is None:
+            self.start = loop.time()
+        delay = self.start + t / self.speed - loop.time()
+        await asyncio.sleep(max(0.0, delay))
+
+
+@dataclass
+class HandlingTimes:
+    # time the session spent on each replayed event, by event type
+    samples: dict[str, list[float]] = field(default_factory=dict)
+
+    def add(self, event_type: str, seconds: float):
+        self.samples.setdefault(event_type, []).append(seconds)
+
+    def all(self) -> list[float]:
+        return [s for samples in self.samples.values() for s in samples]
+
+
+class ReplayResponses:
+    def __init__(self, realtime: "ReplayRealtime"):
+        self.realtime = realtime
+
+    async def create(self, **kwargs):
+        self.realtime.sent.append({"type": "response.create", **kwargs})
+
+
+class ReplayRealtime:
+    """
+    Stands in for AsyncRealtimeConnection. Yields the recorded realtime
+    events, parsed the same way the openai client parses them, on the
+    clock's schedule. What the session sends upstream is kept in ``sent``.
+    """
+
+    def __init__(self, events: list[RecordedEvent], clock: ReplayClock):
+        self.events = events
+        self.clock = clock
+        self.sent: list[Any] = []
+        self.response = ReplayResponses(self)
+        self.times = HandlingTimes()
+        self.done = asyncio.Event()
+        self.closed = False
+
+    async def __aiter__(self):
+        for recorded in self.events:
+            await self.clock.wait(recorded.t)
+            if self.closed:
+                break
+            event = construct_type_unchecked(
+                value=recorded.data, type_=cast(Any, RealtimeServerEvent)
+            )
+            start = time.perf_counter()
+            yield event
+            # resumed once the session handled the event
+            self.times.add(event.type, time.perf_counter() - start)
+        self.done.set()
+
+    async def send(self, event: Any):
+        self.sent.append(event)
+
+    async def close(self):
+        self.closed = True
+        self.done.set()
+
+
+class ReplayWebSocket:
+    """
+    Stands in for the client's websocket under a real Connection, so the
+    send queue and audio coalescing are part of the replay. Recorded
+    messages are received on the clock's schedule; the client disconnects
+    at the recorded time, but not before the realtime events are replayed.
+    """
+
+    def __init__(
+        self,
+        events: list[RecordedEvent],
+        clock: ReplayClock,
+        realtime_done: asyncio.Event,
+    ):
+        self.events = [e for e in events if e.data != DISCONNECT]
+        self.end = max((e.t for e in events), default=0.0)
+        self.clock = clock
+        self.realtime_done = realtime_done
+        self.client_state = WebSocketState.CONNECTED
+        self.scope: dict[str, Any] = {"subprotocols": []}
+        self.times = HandlingTimes()
+        self.last: Union[tuple[str, float], None] = None
+
+        # what the session sent to the client
+        self.text: list[str] = []
+        self.bytes: list[bytes] = []
+
+    def handled(self):
+        # the previous message is handled once the next one is asked for
+        if self.last is not None:
+            event_type, start = self.last
+            self.times.add(event_type, time.perf_counter() - start)
+            self.last = None
+
+    async def next(self) -> Union[RecordedEvent, None]:
+        self.handled()
+        if len(self.events) == 0:
+            await self.clock.wait(self.end)
+            await self.realtime_done.wait()
+            self.client_state = WebSocketState.DISCONNECTED
+            return None
+
+        recorded = self.events.pop(0)
+        await self.clock.wait(recorded.t)
+        event_type = (
+            "binary"
+            if isinstance(recorded.data, bytes)
+            else recorded.data.get("type", "json")
+        )
+        self.last = (event_type, time.perf_counter())
+        return recorded
+
+    async def receive(self) -> dict[str, Any]:
+        recorded = await self.next()
+        if recorded is None:
+            return {"type": "websocket.disconnect", "code": 1000}
+        if isinstance(recorded.data, bytes):
+            return {"type": "websocket.receive", "bytes": recorded.data}
+        return {"type": "websocket.receive", "text": json.dumps(recorded.data)}
+
+    async def receive_json(self) -> dict[str, Any]:
+        recorded = await self.next()
+        if recorded is None or isinstance(recorded.data, bytes):
+            raise RuntimeError("Expected a json message from the recording")
+        return recorded.data
+
+    async def send_text(self, data: str):
+        self.text.append(data)
+
+    async def send_bytes(self, data: bytes):
+        self.bytes.append(data)
+
+    async def accept(self, subprotocol: Union[str, None] = None):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+class ReplaySession:
+    """
+    A recorded voice session ready to be played back through a
+    RealtimeSession, with no network: ``realtime`` replaces the upstream
+    connection and ``client`` the client's Connection.
+
+        replay = ReplaySession.load("session.jsonl", speed=0)
+        settings = await replay.client.receive_json()
+        session = RealtimeSession(replay.realtime, replay.client)
+        await asyncio.gather(session.receive_realtime(), session.receive_client())
+    """
+
+    def __init__(
+        self,
+        events: list[RecordedEvent],
+        speed: float = 1.0,
+        binary_audio: bool = False,
+    ):
+        self.clock = ReplayClock(speed)
+        self.realtime = ReplayRealtime(
+            [e for e in events if e.source == "realtime"], self.clock
+        )
+        self.websocket = ReplayWebSocket(
+            [e for e in events if e.source == "client"],
+            self.clock,
+            self.realtime.done,
+        )
+        self.client = Connection(cast(Any, self.websocket), binary_audio=binary_audio)
+
+    @staticmethod
+    def load(path: str, speed: float = 1.0, binary_audio: bool = False):
+        return ReplaySession(load_recording(path), speed, binary_audio)
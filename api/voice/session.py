@@ -1,10 +1,24 @@
+import os
 import json
-from typing import Literal, Union
+import base64
+import asyncio
+from typing import Any, Awaitable, Callable, ClassVar, Literal, Union
 from prompty.tracer import trace
-from api.connection import Connection
+from api.connection import AUDIO_FRAME, Connection, decode_frame
 from fastapi import WebSocketDisconnect
 from fastapi.websockets import WebSocketState
-from api.agent.common import create_thread_message
+from api.voice.audio import (
+    LOCAL_VAD,
+    EnergyGate,
+    InputAudioBuffer,
+    np,
+    trailing_silence_ms,
+)
+from api.agent import has_function, prepare_fields, run_function
+from api.voice.metrics import TurnTimer, turn_metrics
+from api.voice.replay import DISCONNECT, SessionRecorder
+from api.voice.speculation import Speculation
+from api.voice.transcripts import ThreadRef, transcripts
 
 from openai.resources.beta.realtime.realtime import (
     AsyncRealtimeConnection,
@@ -17,34 +31,17 @@ from openai.types.beta.realtime.session_update_event import (
 )
 from openai.types.beta.realtime import (
     ErrorEvent,
-    SessionCreatedEvent,
-    SessionUpdatedEvent,
-    ConversationCreatedEvent,
-    ConversationItemCreatedEvent,
     ConversationItemInputAudioTranscriptionCompletedEvent,
-    ConversationItemInputAudioTranscriptionFailedEvent,
-    ConversationItemInputAudioTranscriptionDeltaEvent,
-    ConversationItemTruncatedEvent,
-    ConversationItemDeletedEvent,
-    InputAudioBufferCommittedEvent,
-    InputAudioBufferClearedEvent,
     InputAudioBufferSpeechStartedEvent,
     InputAudioBufferSpeechStoppedEvent,
+    InputAudioBufferCommittedEvent,
     ResponseCreatedEvent,
     ResponseDoneEvent,
     ResponseOutputItemAddedEvent,
     ResponseOutputItemDoneEvent,
-    ResponseContentPartAddedEvent,
-    ResponseContentPartDoneEvent,
-    ResponseTextDeltaEvent,
-    ResponseTextDoneEvent,
-    ResponseAudioTranscriptDeltaEvent,
-    ResponseAudioTranscriptDoneEvent,
+    ResponseFunctionCallArgumentsDeltaEvent,
     ResponseAudioDeltaEvent,
     ResponseAudioDoneEvent,
-    ResponseFunctionCallArgumentsDeltaEvent,
-    ResponseFunctionCallArgumentsDoneEvent,
-    RateLimitsUpdatedEvent,
 )
 
 from openai.types.beta.realtime import (
@@ -53,10 +50,10 @@ from openai.types.beta.realtime import (
     # InputAudioBufferCommitEvent,
     # InputAudioBufferClearEvent,
     ConversationItemCreateEvent,
-    # ConversationItemTruncateEvent,
+    ConversationItemTruncateEvent,
     # ConversationItemDeleteEvent,
     ResponseCreateEvent,
-    # ResponseCancelEvent,
+    ResponseCancelEvent,
 )
 
 from openai.types.beta.realtime import (
@@ -64,7 +61,120 @@ from openai.types.beta.realtime import (
     ConversationItemContent,
 )
 
-from api.model import Update
+from api.model import AgentUpdate, Content, Update
+
+# longest a tool output waits for its sibling calls' outputs
+TOOL_OUTPUT_WAIT_MS = int(os.getenv("VOICE_TOOL_OUTPUT_WAIT_MS", "10000"))
+
+# run function calls from the model in-process instead of round tripping
+# them through the client (clients can ask with "server_tools")
+VOICE_SERVER_TOOLS = os.getenv("VOICE_SERVER_TOOLS", "false").lower() == "true"
+
+# how long close() waits for setups started from streaming arguments
+# to be cleaned up (see speculation.py)
+SPECULATION_DISCARD_SECONDS = 5.0
+
+# told to the model while a server side call runs, as the web client does
+TOOL_IN_PROGRESS = (
+    "This is a message from the function call that it is in progress. "
+    "You can ignore it and continue the conversation until the function "
+    "call is completed."
+)
+
+# print the type of every (non delta) realtime event, for debugging
+VOICE_LOG_EVENTS = os.getenv("VOICE_LOG_EVENTS", "false").lower() == "true"
+
+EventHandler = Callable[[Any], Awaitable[None]]
+
+
+def realtime_handler(*event_types: str):
+    """
+    Mark a RealtimeSession method as the handler for the given realtime
+    event types. Event types without a handler are skipped entirely.
+    """
+
+    def decorator(fn):
+        fn.__realtime_events__ = event_types
+        return fn
+
+    return decorator
+
+
+def collect_handlers(cls: type) -> dict[str, str]:
+    # base classes first so subclasses can take over an event type
+    handlers: dict[str, str] = {}
+    for klass in reversed(cls.__mro__):
+        for name, value in vars(klass).items():
+            for event_type in getattr(value, "__realtime_events__", ()):
+                handlers[event_type] = name
+    return handlers
+
+
+def describe_output(item: dict[str, Any]) -> str:
+    # what the model is told about an agent's output, as the web client does
+    match item.get("type"):
+        case "text":
+            return str(item.get("value", ""))
+        case "image":
+            return (
+                f"Generated image as described by {item.get('description')}. "
+                f"It is {item.get('size')} and {item.get('quality')}. It has been "
+                "saved and is currently being displayed to the user."
+            )
+        case "video":
+            return (
+                f"Generated video as described by {item.get('description')}. "
+                f"It is {item.get('duration')} seconds long. It has been saved "
+                "and is currently being displayed to the user."
+            )
+    return ""
+
+
+def turn_detection(
+    detection_type: Literal["semantic_vad", "server_vad"] = "server_vad",
+    threshold: float = 0.8,
+    silence_duration_ms: int = 500,
+    prefix_padding_ms: int = 300,
+    eagerness: Literal["low", "medium", "high", "auto"] = "auto",
+) -> SessionTurnDetection:
+    if detection_type == "semantic_vad":
+        return SessionTurnDetection(
+            type=detection_type,
+            eagerness=eagerness,
+            create_response=True,
+            # cancelled here on speech_started, with a truncate
+            interrupt_response=False,
+        )
+    elif detection_type == "server_vad":
+        return SessionTurnDetection(
+            type=detection_type,
+            threshold=threshold,
+            silence_duration_ms=silence_duration_ms,
+            prefix_padding_ms=prefix_padding_ms,
+            create_response=True,
+            interrupt_response=False,
+        )
+    raise ValueError(
+        f"Invalid detection type: {detection_type}. "
+        "Must be 'semantic_vad' or 'server_vad'."
+    )
+
+
+def shared_session(tools: list[SessionTool] = []) -> Session:
+    """
+    The parts of a session every user shares (default formats, turn
+    detection and transcription, and the configuration's tools), sent to
+    pooled sessions while they wait for a user.
+    """
+    return Session(
+        input_audio_format="pcm16",
+        output_audio_format="pcm16",
+        turn_detection=turn_detection(),
+        input_audio_transcription=SessionInputAudioTranscription(model="whisper-1"),
+        modalities=["text", "audio"],
+        tool_choice="auto",
+        tools=tools,
+    )
 
 
 class RealtimeSession:
@@ -72,17 +182,67 @@ class RealtimeSession:
     Realtime session for handling websocket connections and messages.
     """
 
+    # realtime event type -> handler method name, see realtime_handler
+    handlers: ClassVar[dict[str, str]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.handlers = collect_handlers(cls)
+
     def __init__(
         self,
         realtime: AsyncRealtimeConnection,
         client: Connection,
-        thread_id: Union[str, None] = None,
+        thread_id: Union[ThreadRef, None] = None,
+        recorder: Union[SessionRecorder, None] = None,
+        server_tools: bool = VOICE_SERVER_TOOLS,
     ):
         self.realtime: AsyncRealtimeConnection = realtime
         self.connection: Connection = client
+        self.recorder = recorder
+        # tool outputs wait here while a response is active or sibling
+        # calls are outstanding, then go up with a single response.create
         self.response_queue: list[ConversationItemCreateEvent] = []
-        self.active = True
+        self.pending_calls: set[str] = set()
+        self.response_timer: Union[asyncio.TimerHandle, None] = None
+        self.active = False
+        self.background: set[asyncio.Task] = set()
+        # the response in flight, and one cancelled on barge-in whose
+        # remaining audio deltas are dropped
+        self.response_id: Union[str, None] = None
+        self.cancelled_id: Union[str, None] = None
+        # function calls run here rather than by the client
+        self.server_tools = server_tools
+        self.server_calls: set[str] = set()
+        # setup started from streaming arguments, by item id
+        self.speculations: dict[str, Speculation] = {}
+        self.discards: set[asyncio.Task] = set()
         self.thread_id = thread_id
+        # latency of the turn in flight, reported by configuration and voice
+        self.turn: Union[TurnTimer, None] = None
+        self.configuration = "default"
+        self.voice = "sage"
+        client.on_audio_written = self.audio_written
+        self.vad: Union[EnergyGate, None] = None
+        self.input_audio = InputAudioBuffer(
+            self.send_input_audio,
+            sample_rate=client.codec.upstream_rate,
+            sample_width=client.codec.upstream_width,
+        )
+
+        # handlers are looked up by name so overrides without the
+        # decorator are still picked up
+        self.dispatch: dict[str, list[EventHandler]] = {
+            event_type: [getattr(self, name)]
+            for event_type, name in self.handlers.items()
+        }
+
+    def on(self, event_type: str, handler: EventHandler):
+        """
+        Register an additional handler for a realtime event type. Handlers
+        run in registration order, after the session's own handler.
+        """
+        self.dispatch.setdefault(event_type, []).append(handler)
 
     async def update_realtime_session(
         self,
@@ -94,35 +254,35 @@ class RealtimeSession:
         prefix_padding_ms: int = 300,
         eagerness: Literal["low", "medium", "high", "auto"] = "auto",
         voice: str = "sage",
+        configuration: str = "default",
         tools: list[SessionTool] = [],
+        local_vad: bool = LOCAL_VAD,
     ):
-        if self.realtime is not None:
-
-            vad: SessionTurnDetection | None = None
-            if detection_type == "semantic_vad":
-                vad = SessionTurnDetection(
-                    type=detection_type,
-                    eagerness=eagerness,
-                    create_response=True,
-                    interrupt_response=True,
+        self.configuration = configuration
+        self.voice = voice
+        audio_format = self.connection.codec.upstream_format
+        if local_vad and np is None:
+            print("numpy is not installed, local vad is disabled")
+        elif local_vad and audio_format != "pcm16":
+            print(f"Local vad needs pcm16 audio, disabled for {audio_format}")
+        elif local_vad:
+            self.vad = EnergyGate(
+                trailing_ms=trailing_silence_ms(
+                    detection_type, silence_duration_ms, eagerness
                 )
+            )
 
-            elif detection_type == "server_vad":
-                vad = SessionTurnDetection(
-                    type=detection_type,
+        if self.realtime is not None:
+            session: Session = Session(
+                input_audio_format=audio_format,
+                output_audio_format=audio_format,
+                turn_detection=turn_detection(
+                    detection_type,
                     threshold=threshold,
                     silence_duration_ms=silence_duration_ms,
                     prefix_padding_ms=prefix_padding_ms,
-                )
-            else:
-                raise ValueError(
-                    f"Invalid detection type: {detection_type}. "
-                    "Must be 'semantic_vad' or 'server_vad'."
-                )
-
-            session: Session = Session(
-                input_audio_format="pcm16",
-                turn_detection=vad,
+                    eagerness=eagerness,
+                ),
                 input_audio_transcription=SessionInputAudioTranscription(
                     model=transcription_model,
                 ),
@@ -141,105 +301,31 @@ class RealtimeSession:
 
     @trace
     async def receive_realtime(self):
-        # signature = "api.session.RealtimeSession.receive_realtime"
-        # while self.realtime is not None:
         async for event in self.realtime:
-            if "delta" not in event.type:
+            if VOICE_LOG_EVENTS and "delta" not in event.type:
                 print(event.type)
-            self.active = True
+            if self.recorder is not None:
+                self.recorder.record_realtime(event)
             if (
                 self.realtime is None
                 or self.connection.state != WebSocketState.CONNECTED
             ):
                 break
 
-            match event.type:
-                case "error":
-
-                    await self.handle_error(event)
-                case "session.created":
-                    await self.session_created(event)
-                case "session.updated":
-                    await self.session_updated(event)
-                case "conversation.created":
-                    await self.conversation_created(event)
-                case "conversation.item.created":
-                    await self.conversation_item_created(event)
-                case "conversation.item.input_audio_transcription.completed":
-                    await self.conversation_item_input_audio_transcription_completed(
-                        event
-                    )
-                case "conversation.item.input_audio_transcription.delta":
-                    await self.conversation_item_input_audio_transcription_delta(event)  # type: ignore
-                case "conversation.item.input_audio_transcription.failed":
-                    await self.conversation_item_input_audio_transcription_failed(event)
-                case "conversation.item.truncated":
-                    await self.conversation_item_truncated(event)
-                case "conversation.item.deleted":
-                    await self.conversation_item_deleted(event)
-                case "input_audio_buffer.committed":
-                    await self.input_audio_buffer_committed(event)
-                case "input_audio_buffer.cleared":
-                    await self.input_audio_buffer_cleared(event)
-                case "input_audio_buffer.speech_started":
-                    await self.input_audio_buffer_speech_started(event)
-                case "input_audio_buffer.speech_stopped":
-                    await self.input_audio_buffer_speech_stopped(event)
-                case "response.created":
-                    await self.response_created(event)
-                case "response.done":
-                    await self.response_done(event)
-                case "response.output_item.added":
-                    await self.response_output_item_added(event)
-                case "response.output_item.done":
-                    await self.response_output_item_done(event)
-                case "response.content_part.added":
-                    await self.response_content_part_added(event)
-                case "response.content_part.done":
-                    await self.response_content_part_done(event)
-                case "response.text.delta":
-                    await self.response_text_delta(event)  # type: ignore
-                case "response.text.done":
-                    await self.response_text_done(event)
-                case "response.audio_transcript.delta":
-                    await self.response_audio_transcript_delta(event)  # type: ignore
-                case "response.audio_transcript.done":
-                    await self.response_audio_transcript_done(event)
-                case "response.audio.delta":
-                    await self.response_audio_delta(event)  # type: ignore
-                case "response.audio.done":
-                    await self.response_audio_done(event)  # type: ignore
-                case "response.function_call_arguments.delta":
-                    await self.response_function_call_arguments_delta(event)  # type: ignore
-                case "response.function_call_arguments.done":
-                    await self.response_function_call_arguments_done(event)  # type: ignore
-                case "rate_limits.updated":
-                    await self.rate_limits_updated(event)
-                case _:
-                    print(
-                        f"Unhandled event type {event.type}",
-                    )
+            for handler in self.dispatch.get(event.type, ()):
+                await handler(event)
 
+    @realtime_handler("error")
     @trace
     async def handle_error(self, event: ErrorEvent):
-        print(json.dumps(event.model_dump(), indent=2))
-
-    @trace
-    async def session_created(self, event: SessionCreatedEvent):
-        pass
-
-    @trace
-    async def session_updated(self, event: SessionUpdatedEvent):
-        pass
-
-    @trace
-    async def conversation_created(self, event: ConversationCreatedEvent):
-        pass
-
-    @trace
-    async def conversation_item_created(self, event: ConversationItemCreatedEvent):
-        pass
+        # a barge-in can race the end of the response it cancels
+        if event.error.code != "response_cancel_not_active":
+            print(json.dumps(event.model_dump(), indent=2))
+        # a failed response.create never reports response.created or
+        # response.done, don't hold tool outputs back on it
+        self.active = False
 
+    @realtime_handler("conversation.item.input_audio_transcription.completed")
     @trace
     async def conversation_item_input_audio_transcription_completed(
         self, event: ConversationItemInputAudioTranscriptionCompletedEvent
@@ -256,7 +342,7 @@ class RealtimeSession:
         )
 
         if self.thread_id is not None:
-            await create_thread_message(
+            transcripts.write(
                 thread_id=self.thread_id,
                 role="user",
                 content=event.transcript.strip(),
@@ -267,51 +353,90 @@ class RealtimeSession:
                 },
             )
 
-    async def conversation_item_input_audio_transcription_delta(
-        self, event: ConversationItemInputAudioTranscriptionDeltaEvent
-    ):
-        pass
-
-    @trace
-    async def conversation_item_input_audio_transcription_failed(
-        self, event: ConversationItemInputAudioTranscriptionFailedEvent
-    ):
-        pass
-
-    @trace
-    async def conversation_item_truncated(self, event: ConversationItemTruncatedEvent):
-        pass
-
-    @trace
-    async def conversation_item_deleted(self, event: ConversationItemDeletedEvent):
-        pass
-
-    @trace
-    async def input_audio_buffer_committed(self, event: InputAudioBufferCommittedEvent):
-        pass
-
-    @trace
-    async def input_audio_buffer_cleared(self, event: InputAudioBufferClearedEvent):
-        pass
-
+    @realtime_handler("input_audio_buffer.speech_started")
     @trace
     async def input_audio_buffer_speech_started(
         self, event: InputAudioBufferSpeechStartedEvent
     ):
+        await self.interrupt_response()
+        # the client stops playback, queued audio is purged on the way
         await self.connection.send_update(Update.interrupt())
 
-    @trace
+    async def interrupt_response(self):
+        """
+        Barge-in: cancel the response in flight and cut its audio item in
+        the conversation down to what the client actually played.
+        """
+        if self.realtime is None:
+            return
+
+        if self.active:
+            self.cancelled_id = self.response_id
+            await self.realtime.send(
+                ResponseCancelEvent(type="response.cancel", response_id=self.response_id)
+                if self.response_id is not None
+                else ResponseCancelEvent(type="response.cancel")
+            )
+
+        playback = self.connection.playback
+        if playback.item_id is not None:
+            played_ms = playback.played_ms()
+            if played_ms < int(playback.written_ms) or self.active:
+                await self.realtime.send(
+                    ConversationItemTruncateEvent(
+                        type="conversation.item.truncate",
+                        item_id=playback.item_id,
+                        content_index=0,
+                        audio_end_ms=played_ms,
+                    )
+                )
+            playback.stop()
+
+    @realtime_handler("input_audio_buffer.speech_stopped")
     async def input_audio_buffer_speech_stopped(
         self, event: InputAudioBufferSpeechStoppedEvent
     ):
-        pass
+        # a new turn, one still in flight was interrupted
+        self.turn = TurnTimer()
+        self.turn.mark("speech_stopped")
 
-    @trace
+    @realtime_handler("input_audio_buffer.committed")
+    async def input_audio_buffer_committed(self, event: InputAudioBufferCommittedEvent):
+        self.mark_turn("committed")
+
+    @realtime_handler("response.created")
     async def response_created(self, event: ResponseCreatedEvent):
-        pass
+        self.active = True
+        self.response_id = event.response.id
+        self.mark_turn("response_created")
+
+    def mark_turn(self, name: str):
+        # responses without speech (text, tool output) start their own turn
+        if self.turn is None:
+            self.turn = TurnTimer()
+        self.turn.mark(name)
+
+    def audio_written(self):
+        if self.turn is not None and self.turn.first_audio is not None:
+            self.turn.mark("first_write")
+
+    def finish_turn(self, response_id: Union[str, None]):
+        if self.turn is None:
+            return
+        self.turn.mark("response_done")
+        turn_metrics.record(
+            self.turn,
+            configuration=self.configuration,
+            voice=self.voice,
+            attributes={"response_id": str(response_id)},
+        )
+        self.turn = None
 
+    @realtime_handler("response.done")
     @trace
     async def response_done(self, event: ResponseDoneEvent):
+        self.finish_turn(event.response.id)
+        self.response_id = None
         if event.response.output is not None and len(event.response.output) > 0:
             output = event.response.output[0]
             match output.type:
@@ -327,7 +452,7 @@ class RealtimeSession:
                         )
 
                         if self.thread_id is not None:
-                            await create_thread_message(
+                            transcripts.write(
                                 thread_id=self.thread_id,
                                 role=output.role if output.role else "assistant",
                                 content=str(
@@ -349,37 +474,118 @@ class RealtimeSession:
                         )
                     )
 
-        if len(self.response_queue) > 0 and self.realtime is not None:
-            for item in self.response_queue:
-                await self.realtime.send(item)
-            self.response_queue.clear()
-            await self.realtime.response.create()
+        # items of a cancelled or failed response never finish
+        for speculation in self.speculations.values():
+            self.discard_speculation(speculation)
+        self.speculations.clear()
 
         self.active = False
+        await self.submit_responses()
+
+    async def queue_response(self, call_id: str, output: str):
+        self.pending_calls.discard(call_id)
+        self.response_queue.append(
+            ConversationItemCreateEvent(
+                type="conversation.item.create",
+                item=ConversationItem(
+                    call_id=call_id,
+                    type="function_call_output",
+                    output=output,
+                ),
+            )
+        )
+        await self.submit_responses()
+
+    def submit_overdue(self):
+        self.response_timer = None
+        self.pending_calls.clear()
+        self.spawn(self.submit_responses())
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    def discard_speculation(self, speculation: Speculation):
+        # not a background task, close() waits for these rather than
+        # cancelling them, a prepared run holds a client and a thread
+        task = asyncio.create_task(speculation.discard())
+        self.discards.add(task)
+        task.add_done_callback(self.discards.discard)
+
+    async def submit_responses(self):
+        """
+        Send queued tool outputs and one response.create for all of them,
+        once no response is active and no sibling call is outstanding.
+        """
+        if len(self.response_queue) == 0 or self.realtime is None:
+            return
 
-    @trace
+        if len(self.pending_calls) > 0:
+            # don't wait forever on a call the client never answers
+            if self.response_timer is None:
+                self.response_timer = asyncio.get_running_loop().call_later(
+                    TOOL_OUTPUT_WAIT_MS / 1000, self.submit_overdue
+                )
+            return
+
+        if self.active:
+            return
+
+        if self.response_timer is not None:
+            self.response_timer.cancel()
+            self.response_timer = None
+
+        items, self.response_queue = self.response_queue, []
+        for item in items:
+            await self.realtime.send(item)
+        # counts as active until response.created confirms it
+        self.active = True
+        await self.realtime.response.create()
+
+    @realtime_handler("response.output_item.added")
     async def response_output_item_added(self, event: ResponseOutputItemAddedEvent):
-        pass
+        if self.server_tools and event.item.type == "function_call":
+            needs = prepare_fields(str(event.item.name))
+            if needs is not None:
+                self.speculations[str(event.item.id)] = Speculation(
+                    name=str(event.item.name),
+                    call_id=str(event.item.call_id),
+                    needs=needs,
+                )
+
+    @realtime_handler("response.function_call_arguments.delta")
+    async def response_function_call_arguments_delta(
+        self, event: ResponseFunctionCallArgumentsDeltaEvent
+    ):
+        speculation = self.speculations.get(event.item_id)
+        if speculation is not None:
+            speculation.feed(event.delta)
 
+    @realtime_handler("response.output_item.done")
     @trace
     async def response_output_item_done(self, event: ResponseOutputItemDoneEvent):
         if event.item.type == "function_call":
+            speculation = self.speculations.pop(str(event.item.id), None)
+            # its output is held until every call in the response is answered
+            self.pending_calls.add(str(event.item.call_id))
             try:
                 args = json.loads(event.item.arguments or "{}")
             except json.JSONDecodeError:
                 args = {}
 
-            await self.connection.send_update(
-                Update.function(
-                    id=str(event.item.id),
-                    call_id=str(event.item.call_id),
-                    name=str(event.item.name),
-                    arguments=args,
-                )
-            )
+            # calls needing the user (a picture or a file) stay with the
+            # client, as do calls taking an image_url, which the client
+            # swaps for the image it's currently showing
+            if self.server_tools and "kind" not in args and "image_url" not in args:
+                self.spawn(self.run_function_call(event.item, args, speculation))
+            else:
+                if speculation is not None:
+                    self.discard_speculation(speculation)
+                await self.send_function_call(event.item, args)
 
             if self.thread_id is not None:
-                await create_thread_message(
+                transcripts.write(
                     thread_id=self.thread_id,
                     role="assistant",
                     content=f"Calling {event.item.name} with {str(event.item.arguments)}",
@@ -390,55 +596,122 @@ class RealtimeSession:
                     },
                 )
 
-    @trace
-    async def response_content_part_added(self, event: ResponseContentPartAddedEvent):
-        pass
+    async def send_function_call(self, item: Any, args: dict[str, Any]):
+        await self.connection.send_update(
+            Update.function(
+                id=str(item.id),
+                call_id=str(item.call_id),
+                name=str(item.name),
+                arguments=args,
+            )
+        )
 
     @trace
-    async def response_content_part_done(self, event: ResponseContentPartDoneEvent):
-        pass
+    async def run_function_call(
+        self,
+        item: Any,
+        args: dict[str, Any],
+        speculation: Union[Speculation, None] = None,
+    ):
+        """
+        Run a function call from the model in-process. Agent progress goes
+        to the client as agent updates and the output goes upstream
+        directly. Functions not known here are left to the client.
+        Setup started while the arguments streamed in is used when it
+        agrees with the final arguments.
+        """
+        call_id, name = str(item.call_id), str(item.name)
+        try:
+            if not await has_function(name):
+                if speculation is not None:
+                    await speculation.discard()
+                await self.send_function_call(item, args)
+                return
+        except Exception as e:
+            print(f"Error looking up function {name}: {e}")
+            if speculation is not None:
+                await speculation.discard()
+            await self.send_function_call(item, args)
+            return
 
-    async def response_text_delta(self, event: ResponseTextDeltaEvent):
-        pass
+        # the client's own completions for this call are ignored
+        self.server_calls.add(call_id)
+        await self.queue_response(call_id, TOOL_IN_PROGRESS)
 
-    @trace
-    async def response_text_done(self, event: ResponseTextDoneEvent):
-        pass
+        outputs: list[str] = []
+        failed = False
 
-    async def response_audio_transcript_delta(
-        self, event: ResponseAudioTranscriptDeltaEvent
-    ):
-        pass
+        def notify(agent_name: str):
+            async def send_status(
+                id: str,
+                status: str,
+                information: Union[str, None] = None,
+                content: Union[Content, None] = None,
+                output: bool = False,
+            ):
+                nonlocal failed
+                if "failed" in status.lower():
+                    failed = True
+                if output and content is not None:
+                    outputs.extend(describe_output(c) for c in content.content)
+                await self.connection.send_update(
+                    AgentUpdate(
+                        id=id,
+                        type="agent",
+                        call_id=call_id,
+                        name=agent_name,
+                        status=status,
+                        information=information,
+                        content=content,
+                        output=output,
+                    )
+                )
 
-    @trace
-    async def response_audio_transcript_done(
-        self, event: ResponseAudioTranscriptDoneEvent
-    ):
-        pass
+            return send_status
 
-    async def response_audio_delta(self, event: ResponseAudioDeltaEvent):
-        await self.connection.send_update(
-            Update.audio(id=event.event_id, data=event.delta)
-        )
+        prepared = None
+        if speculation is not None:
+            prepared = await speculation.take(args)
 
-    @trace
-    async def response_audio_done(self, event: ResponseAudioDoneEvent):
-        pass
+        result = None
+        try:
+            result = await run_function(name, args, notify, prepared=prepared)
+        except Exception as e:
+            print(f"Error running function {name}: {e}")
+            failed = True
+            await notify(name)(id=call_id, status="run failed", information=str(e))
+
+        if failed:
+            output = (
+                f"The {name} has failed. Please let the user know there may be "
+                "issues with this agent in the service and are happy to help in "
+                "any other way available to you."
+            )
+        elif len(outputs) > 0:
+            output = "\n".join(o for o in outputs if o)
+        elif result is not None:
+            output = result if isinstance(result, str) else json.dumps(result)
+        else:
+            output = f"The {name} has completed."
 
-    async def response_function_call_arguments_delta(
-        self, event: ResponseFunctionCallArgumentsDeltaEvent
-    ):
-        pass
+        await self.queue_response(call_id, output)
 
-    @trace
-    async def response_function_call_arguments_done(
-        self, event: ResponseFunctionCallArgumentsDoneEvent
-    ):
-        pass
+    @realtime_handler("response.audio.delta")
+    async def response_audio_delta(self, event: ResponseAudioDeltaEvent):
+        # already in flight when the response was cancelled
+        if event.response_id == self.cancelled_id:
+            return
+        if event.item_id != self.connection.playback.item_id:
+            self.connection.playback.start(event.item_id)
+        if self.turn is not None:
+            self.turn.mark("first_audio")
+        await self.connection.send_audio(id=event.event_id, audio=event.delta)
 
+    @realtime_handler("response.audio.done")
     @trace
-    async def rate_limits_updated(self, event: RateLimitsUpdatedEvent):
-        pass
+    async def response_audio_done(self, event: ResponseAudioDoneEvent):
+        # don't hold the tail of the response in a partial frame
+        await self.connection.flush_audio()
 
     @trace
     async def receive_client(self):
@@ -447,14 +720,29 @@ class RealtimeSession:
 
         try:
             while self.connection.state != WebSocketState.DISCONNECTED:
-                text = await self.connection.receive_text()
-                event = json.loads(text)
+                message = await self.connection.receive()
+                if self.recorder is not None:
+                    self.recorder.record("client", message)
+
+                if isinstance(message, bytes):
+                    # binary frames carry microphone audio in the negotiated
+                    # format, empty and unknown frames are skipped
+                    try:
+                        frame_type, payload = decode_frame(message)
+                    except ValueError:
+                        continue
+                    if frame_type == AUDIO_FRAME:
+                        await self.append_input_audio(
+                            await self.connection.codec.decode(payload)
+                        )
+                    continue
 
+                event = message
                 match event["type"]:
                     case "audio":
-                        await self.realtime.send(
-                            InputAudioBufferAppendEvent(
-                                type="input_audio_buffer.append", audio=event["content"]
+                        await self.append_input_audio(
+                            await self.connection.codec.decode(
+                                base64.b64decode(event["content"])
                             )
                         )
 
@@ -481,18 +769,9 @@ class RealtimeSession:
                         )
 
                     case "function_completion":
-                        await self.realtime.send(
-                            ConversationItemCreateEvent(
-                                type="conversation.item.create",
-                                item=ConversationItem(
-                                    call_id=event["call_id"],
-                                    type="function_call_output",
-                                    output=event["output"],
-                                ),
-                            )
-                        )
-
-                        await self.realtime.response.create()
+                        # the server already answers calls it runs itself
+                        if event["call_id"] not in self.server_calls:
+                            await self.queue_response(event["call_id"], event["output"])
 
                     case _:
                         await self.connection.send_update(
@@ -504,11 +783,56 @@ class RealtimeSession:
 
         except WebSocketDisconnect:
             print("Realtime Socket Disconnected")
+            if self.recorder is not None:
+                self.recorder.record("client", DISCONNECT)
             await self.close()
 
+    async def append_input_audio(self, audio: bytes):
+        if self.vad is not None:
+            # silence between turns never leaves the server
+            audio = self.vad.process(audio)
+            if len(audio) == 0:
+                return
+
+        # sent upstream by the buffer's own task
+        self.input_audio.add(audio)
+
+    async def send_input_audio(self, audio: bytes):
+        await self.realtime.send(
+            InputAudioBufferAppendEvent(
+                type="input_audio_buffer.append",
+                audio=base64.b64encode(audio).decode(),
+            )
+        )
+
     async def close(self):
+        self.input_audio.close()
+        if self.response_timer is not None:
+            self.response_timer.cancel()
+            self.response_timer = None
+        for task in list(self.background):
+            task.cancel()
+        for speculation in self.speculations.values():
+            self.discard_speculation(speculation)
+        self.speculations.clear()
+        if len(self.discards) > 0:
+            await asyncio.wait(list(self.discards), timeout=SPECULATION_DISCARD_SECONDS)
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.vad is not None:
+            print(f"Local vad: {self.vad.metrics()}")
+
         try:
             await self.connection.close()
             await self.realtime.close()
         except Exception as e:
             print("Error closing session", e)
+
+        if self.thread_id is not None:
+            # transcripts keep flushing in the background after a
+            # session ends, this only waits for them to land
+            if not await transcripts.drain(self.thread_id):
+                print(f"Transcripts for thread {self.thread_id} still pending")
+
+
+RealtimeSession.handlers = collect_handlers(RealtimeSession)
@@ -0,0 +1,160 @@
+import json
+import asyncio
+from typing import Any, Union
+
+from api.agent import discard_prepared, prepare_function
+
+# discards of setups whose call was cancelled, kept until they finish
+_cleanup: set[asyncio.Task] = set()
+
+
+class ArgumentStream:
+    """
+    Incremental parser for function call arguments as the model streams
+    them. Each top level field of the arguments object is parsed as soon
+    as its value is complete, long before the call itself is done.
+
+        stream = ArgumentStream()
+        stream.feed('{"query": "wea')   # []
+        stream.feed('ther", "n": 1')    # ["query"]
+        stream.feed('}')                # ["n"]
+    """
+
+    def __init__(self):
+        self.fields: dict[str, Any] = {}
+        # set once the text can't be an arguments object
+        self.failed = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        # text of the field being read, since the last top level , or {
+        self.pair: list[str] = []
+
+    def feed(self, delta: str) -> list[str]:
+        """Add streamed text, returns the fields it completed."""
+        if self.failed or self.done:
+            return []
+
+        completed: list[str] = []
+        start = 0
+        for i, c in enumerate(delta):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    if c != "{":
+                        self.failed = True
+                        return completed
+                    start = i + 1
+            elif c in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.pair.append(delta[start:i])
+                    completed.extend(self.complete())
+                    self.done = True
+                    return completed
+            elif c == "," and self.depth == 1:
+                self.pair.append(delta[start:i])
+                completed.extend(self.complete())
+                start = i + 1
+            elif self.depth == 0 and not c.isspace():
+                self.failed = True
+                return completed
+
+        if self.depth > 0:
+            self.pair.append(delta[start:])
+        return completed
+
+    def complete(self) -> list[str]:
+        text, self.pair = "".join(self.pair), []
+        if text.strip() == "":
+            return []
+        try:
+            pair = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            self.failed = True
+            return []
+        self.fields.update(pair)
+        return list(pair.keys())
+
+
+class Speculation:
+    """
+    Setup for a function call started while the model is still streaming
+    its arguments, once the fields the setup needs are known. The call
+    takes it if its final arguments agree with those fields, otherwise
+    it's discarded. (not a dataclass, traces would try to copy the task)
+    """
+
+    def __init__(self, name: str, call_id: str, needs: tuple[str, ...]):
+        self.name = name
+        self.call_id = call_id
+        # arguments the setup needs, see api.agent.prepare_fields
+        self.needs = needs
+        self.arguments = ArgumentStream()
+        # arguments the setup was started with
+        self.used: Union[dict[str, Any], None] = None
+        self.task: Union[asyncio.Task, None] = None
+
+    def __str__(self):
+        return f"Speculation(name={self.name}, used={self.used})"
+
+    def feed(self, delta: str):
+        self.arguments.feed(delta)
+        if (
+            self.task is None
+            and not self.arguments.failed
+            and all(n in self.arguments.fields for n in self.needs)
+        ):
+            self.used = {n: self.arguments.fields[n] for n in self.needs}
+            self.task = asyncio.create_task(prepare_function(self.name, self.used))
+
+    def matches(self, arguments: dict[str, Any]) -> bool:
+        return self.used is not None and all(
+            arguments.get(n) == v for n, v in self.used.items()
+        )
+
+    async def take(self, arguments: dict[str, Any]) -> Any:
+        """
+        The prepared setup if it was started with these arguments, or None
+        (the setup is discarded) to run the call from scratch.
+        """
+        if self.task is None:
+            return None
+        if not self.matches(arguments):
+            await self.discard()
+            return None
+        try:
+            # shielded, a cancelled call mustn't cancel the setup halfway
+            return await asyncio.shield(self.task)
+        except asyncio.CancelledError:
+            task = asyncio.create_task(self.discard())
+            _cleanup.add(task)
+            task.add_done_callback(_cleanup.discard)
+            raise
+        except Exception as e:
+            print(f"Error preparing function {self.name}: {e}")
+            return None
+
+    async def discard(self):
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        try:
+            # let it finish, cancelling could leave half made resources
+            prepared = await asyncio.shield(task)
+        except Exception:
+            return
+        try:
+            await discard_prepared(prepared)
+        except Exception as e:
+            print(f"Error discarding prepared function {self.name}: {e}")
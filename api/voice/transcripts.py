@@ -0,0 +1,226 @@
+import os
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Union
+
+from azure.ai.projects.aio import AIProjectClient
+from azure.identity.aio import DefaultAzureCredential
+
+from api.agent.common import FOUNDRY_CONNECTION
+
+# messages written within this window go out together
+TRANSCRIPT_FLUSH_MS = int(os.getenv("VOICE_TRANSCRIPT_FLUSH_MS", "250"))
+
+# attempts per message before it is given up on, with exponential backoff
+TRANSCRIPT_MAX_ATTEMPTS = int(os.getenv("VOICE_TRANSCRIPT_MAX_ATTEMPTS", "4"))
+TRANSCRIPT_RETRY_SECONDS = 0.5
+
+# how long a closing session (or the app) waits for pending transcripts
+TRANSCRIPT_DRAIN_SECONDS = 10.0
+
+# a thread id, or a task still creating the thread
+ThreadRef = Union[str, "asyncio.Future[str]"]
+
+
+@dataclass
+class ThreadMessage:
+    role: str
+    content: str
+    metadata: dict[str, str] = field(default_factory=dict)
+    attempts: int = 0
+
+
+class TranscriptWriter:
+    """
+    Write-behind persistence of voice transcripts to Foundry threads.
+    write() only queues the message; each thread has its own background
+    task that flushes the queue in order, retrying failed writes, so the
+    realtime loop never waits on Foundry. All writes share one project
+    client. Messages can be queued for a thread that is still being
+    created, they are written once its id is known.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = TRANSCRIPT_FLUSH_MS / 1000,
+        max_attempts: int = TRANSCRIPT_MAX_ATTEMPTS,
+        retry_delay: float = TRANSCRIPT_RETRY_SECONDS,
+    ):
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.queues: dict[ThreadRef, deque[ThreadMessage]] = {}
+        self.tasks: dict[ThreadRef, asyncio.Task] = {}
+        self.credential: Union[DefaultAzureCredential, None] = None
+        self.project_client: Union[AIProjectClient, None] = None
+        self.loop: Union[asyncio.AbstractEventLoop, None] = None
+        # clients left behind by reset(), still closing
+        self.closing: set[asyncio.Task] = set()
+
+        # metrics
+        self.written = 0
+        self.retried = 0
+        self.failed = 0
+
+    def write(
+        self,
+        thread_id: ThreadRef,
+        role: str,
+        content: str,
+        metadata: dict[str, str] = {},
+    ):
+        self.queues.setdefault(thread_id, deque()).append(
+            ThreadMessage(role=role, content=content, metadata=metadata)
+        )
+        if thread_id not in self.tasks:
+            self.tasks[thread_id] = asyncio.create_task(self.flush(thread_id))
+
+    def get_project_client(self) -> AIProjectClient:
+        loop = asyncio.get_running_loop()
+        if self.project_client is not None and self.loop is not loop:
+            # bound to the loop that created it, start over on this one
+            self.reset()
+
+        if self.project_client is None:
+            self.credential = DefaultAzureCredential()
+            self.project_client = AIProjectClient.from_connection_string(
+                conn_str=FOUNDRY_CONNECTION, credential=self.credential
+            )
+            self.loop = loop
+        return self.project_client
+
+    def detach(
+        self,
+    ) -> tuple[Union[AIProjectClient, None], Union[DefaultAzureCredential, None]]:
+        clients = (self.project_client, self.credential)
+        self.project_client = self.credential = self.loop = None
+        return clients
+
+    def reset(self):
+        # close the old client on its own loop if it is still running,
+        # else on this one
+        loop = self.loop
+        project_client, credential = self.detach()
+        if project_client is None and credential is None:
+            return
+
+        closing = close_clients(project_client, credential)
+        running = asyncio.get_running_loop()
+        if loop is not None and loop is not running and loop.is_running():
+            asyncio.run_coroutine_threadsafe(closing, loop)
+        else:
+            task = running.create_task(closing)
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+
+    async def create_message(self, thread_id: str, message: ThreadMessage):
+        project_client = self.get_project_client()
+        await project_client.agents.create_message(
+            thread_id=thread_id,
+            role=message.role,
+            content=message.content,
+            metadata=message.metadata,
+        )
+
+    async def resolve(self, thread: ThreadRef) -> Union[str, None]:
+        if isinstance(thread, str):
+            return thread
+
+        await asyncio.wait([thread])
+        if thread.cancelled() or thread.exception() is not None:
+            error = "cancelled" if thread.cancelled() else thread.exception()
+            print(f"Error creating transcript thread: {error}")
+            return None
+        return thread.result()
+
+    async def flush(self, thread: ThreadRef):
+        queue = self.queues[thread]
+        try:
+            thread_id = await self.resolve(thread)
+            if thread_id is None:
+                self.failed += len(queue)
+                queue.clear()
+
+            while len(queue) > 0:
+                # let the rest of the turn arrive before writing
+                await asyncio.sleep(self.flush_interval)
+
+                while len(queue) > 0:
+                    # the head stays queued until written so order holds
+                    message = queue[0]
+                    try:
+                        await self.create_message(str(thread_id), message)
+                        self.written += 1
+                    except Exception as e:
+                        message.attempts += 1
+                        if message.attempts < self.max_attempts:
+                            self.retried += 1
+                            await asyncio.sleep(
+                                self.retry_delay * 2 ** (message.attempts - 1)
+                            )
+                            continue
+
+                        self.failed += 1
+                        print(f"Error writing transcript to {thread_id}: {e}")
+
+                    queue.popleft()
+        finally:
+            # no await between the last check and here, so a write()
+            # racing with the end of this task starts a new one
+            del self.tasks[thread]
+            if len(queue) == 0:
+                del self.queues[thread]
+
+    async def drain(
+        self, thread_id: ThreadRef, timeout: float = TRANSCRIPT_DRAIN_SECONDS
+    ) -> bool:
+        """
+        Wait for the messages queued for ``thread_id`` to be written.
+        Returns False if they are still pending after ``timeout``.
+        """
+        task = self.tasks.get(thread_id)
+        if task is None:
+            return True
+
+        done, _ = await asyncio.wait([task], timeout=timeout)
+        return len(done) > 0
+
+    async def close(self, timeout: float = TRANSCRIPT_DRAIN_SECONDS):
+        tasks = list(self.tasks.values())
+        if len(tasks) > 0:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if len(pending) > 0:
+                print(f"Dropped pending transcripts for {len(pending)} threads")
+
+        await close_clients(*self.detach())
+        if self.closing:
+            await asyncio.wait(self.closing)
+
+    def metrics(self) -> dict[str, int]:
+        return {
+            "pending": sum(len(q) for q in self.queues.values()),
+            "written": self.written,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+transcripts = TranscriptWriter()
+
+
+async def close_clients(
+    project_client: Union[AIProjectClient, None],
+    credential: Union[DefaultAzureCredential, None],
+):
+    try:
+        if project_client is not None:
+            await project_client.close()
+    except Exception as e:
+        # e.g. connections left behind by a loop that has since closed
+        print("Error closing project client", e)
+    finally:
+        if credential is not None:
+            await credential.close()
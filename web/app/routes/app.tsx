@@ -219,9 +219,10 @@ export default function Home() {
             const images = output?.getAllImages();
             // if there's only one image, set the image_url to the first image
             if (images && images.length > 0) {
-              serverEvent.arguments.image_url = `${API_ENDPOINT}/${
-                images[images.length - 1].image_url
-              }`;
+              const image_url = images[images.length - 1].image_url;
+              serverEvent.arguments.image_url = image_url.startsWith("http")
+                ? image_url
+                : `${API_ENDPOINT}/${image_url}`;
             }
           }
 
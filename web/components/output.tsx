@@ -79,9 +79,10 @@ const Output: React.FC<Props> = ({ data }: Props) => {
         </>
       );
     } else if (data.type === "image") {
+      // thumbnails are resized (and re-encoded) by the api
       const url = data.image_url.startsWith("http")
         ? data.image_url
-        : `${API_ENDPOINT}/${data.image_url}`;
+        : `${API_ENDPOINT}/${data.image_url}?width=800`;
 
       const max_size = Math.max(width, height);
       const new_x = (width - max_size) / 2;
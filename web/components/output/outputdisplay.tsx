@@ -85,7 +85,11 @@ const OutputDisplay = React.forwardRef<OuptutDisplayHandle, {}>((_, ref) => {
             autoPlay
             loop
             muted
-            src={`${API_ENDPOINT}/${data.video_url}`}
+            src={
+              data.video_url.startsWith("http")
+                ? data.video_url
+                : `${API_ENDPOINT}/${data.video_url}`
+            }
           >
             Your browser does not support the video tag.
           </video>
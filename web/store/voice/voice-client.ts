@@ -81,6 +81,10 @@ export type Update =
   | ErrorUpdate;
 
 
+// binary pcm16 audio frames, see api/connection.py
+export const AUDIO_SUBPROTOCOL = "sustineo.audio.v1";
+export const AUDIO_FRAME = 0x01;
+
 export class VoiceClient {
   //private updateQueue: Update[] = [];
   //private started: boolean = false;
@@ -106,16 +110,26 @@ export class VoiceClient {
 
   async start(deviceId: string | null = null) {
     console.log("Starting voice client", this.url);
-    this.socket = new WebSocketClient<Update, Update>(this.url);
+    this.socket = new WebSocketClient<Update, Update>(this.url, [
+      AUDIO_SUBPROTOCOL,
+    ]);
 
     this.player = new Player(this.setAnalyzer);
 
     await this.player.init(24000);
 
     this.recorder = new Recorder((buffer: any) => {
-      const base64 = btoa(String.fromCharCode(...new Uint8Array(buffer)));
-      if (this.socket && this.socket.readyState === WebSocket.OPEN) {
-        this.socket!.send({ id: "audio", type: "audio", content: base64 });
+      if (!this.socket || this.socket.readyState !== WebSocket.OPEN) {
+        return;
+      }
+      if (this.socket.protocol === AUDIO_SUBPROTOCOL) {
+        const frame = new Uint8Array(buffer.byteLength + 1);
+        frame[0] = AUDIO_FRAME;
+        frame.set(new Uint8Array(buffer), 1);
+        this.socket.sendBinary(frame);
+      } else {
+        const base64 = btoa(String.fromCharCode(...new Uint8Array(buffer)));
+        this.socket.send({ id: "audio", type: "audio", content: base64 });
       }
     });
 
@@ -148,7 +162,12 @@ export class VoiceClient {
     try {
       for await (const serverEvent of this.socket) {
 
-        if (serverEvent.type === "audio") {
+        if (serverEvent instanceof ArrayBuffer) {
+          // binary frame: one byte frame type followed by pcm16
+          if (new Uint8Array(serverEvent)[0] === AUDIO_FRAME) {
+            this.player!.play(new Int16Array(serverEvent.slice(1)));
+          }
+        } else if (serverEvent.type === "audio") {
           // handle audio case internally
           const buffer = Uint8Array.from(atob(serverEvent.content), (c) =>
             c.charCodeAt(0)
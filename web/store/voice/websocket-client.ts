@@ -15,18 +15,20 @@ function sendMessage(
 type ResolveFn<T> = (value: IteratorResult<T>) => void;
 type RejectFn<E> = (reason: E) => void;
 
-export class WebSocketClient<U, D> implements AsyncIterable<D> {
+// binary frames are passed through untouched as ArrayBuffers
+export class WebSocketClient<U, D> implements AsyncIterable<D | ArrayBuffer> {
   private socket: WebSocket;
   private connectedPromise: Promise<void>;
   private closedPromise: Promise<void> | undefined = undefined;
   private error: Error | undefined;
-  private messageQueue: D[] = [];
+  private messageQueue: (D | ArrayBuffer)[] = [];
 
-  private receiverQueue: [ResolveFn<D>, RejectFn<Error>][] = [];
+  private receiverQueue: [ResolveFn<D | ArrayBuffer>, RejectFn<Error>][] = [];
   private done: boolean = false;
 
-  constructor(url: string | URL) {
-    this.socket = new WebSocket(url);
+  constructor(url: string | URL, protocols?: string | string[]) {
+    this.socket = new WebSocket(url, protocols);
+    this.socket.binaryType = "arraybuffer";
     this.connectedPromise = new Promise(async (resolve, reject) => {
       this.socket.onopen = () => {
         this.socket.onmessage = this.getMessageHandler();
@@ -72,7 +74,10 @@ export class WebSocketClient<U, D> implements AsyncIterable<D> {
   private getMessageHandler(): (event: MessageEvent) => void {
     const self = this;
     return (event: MessageEvent) => {
-      const message = JSON.parse(event.data as string);
+      const message =
+        event.data instanceof ArrayBuffer
+          ? event.data
+          : JSON.parse(event.data as string);
       if (self.receiverQueue.length > 0) {
         const [resolve, _] = self.receiverQueue.shift()!;
         resolve({ value: message, done: false });
@@ -82,9 +87,9 @@ export class WebSocketClient<U, D> implements AsyncIterable<D> {
     };
   }
 
-  [Symbol.asyncIterator](): AsyncIterator<D> {
+  [Symbol.asyncIterator](): AsyncIterator<D | ArrayBuffer> {
     return {
-      next: (): Promise<IteratorResult<D>> => {
+      next: (): Promise<IteratorResult<D | ArrayBuffer>> => {
         if (this.error) {
           return Promise.reject(this.error);
         } else if (this.done) {
@@ -113,6 +118,14 @@ export class WebSocketClient<U, D> implements AsyncIterable<D> {
       return sendMessage(this.socket, serialized);
   }
 
+  async sendBinary(data: ArrayBufferLike | ArrayBufferView): Promise<void> {
+    await this.connectedPromise;
+    if (this.error) {
+      throw this.error;
+    }
+    return sendMessage(this.socket, data);
+  }
+
   async close(): Promise<void> {
     await this.connectedPromise;
     if (this.done) {
@@ -125,4 +138,9 @@ export class WebSocketClient<U, D> implements AsyncIterable<D> {
   get readyState(): number {
     return this.socket.readyState;
   }
+
+  // subprotocol agreed with the server (empty if none)
+  get protocol(): string {
+    return this.socket.protocol;
+  }
 }